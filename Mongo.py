@@ -6,7 +6,8 @@ from fastapi import FastAPI, HTTPException
 from auth.auth_handler import signJWT
 from model import RemoteWorkRequest
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from dateutil import parser
 from bson import json_util
 from bson import ObjectId
@@ -18,6 +19,11 @@ import json
 import traceback
 import os
 from gridfs import GridFS
+from mongo_client import get_client
+from ttl_cache import TTLCache
+from pagination import paginate, paginate_newer, cursor_for, clamp_limit
+from presence import presence, SKIP_PRESENT_USERS, direct_conversation, direct_chat_id, group_conversation
+import metrics
 
 # Helper function for timezone-aware timestamps
 def get_current_timestamp_iso():
@@ -43,13 +49,8 @@ from pymongo import MongoClient
 
   # For storing yearly working days
 
-mongo_url = os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
-client = MongoClient(
-    mongo_url,
-    serverSelectionTimeoutMS=30000,
-    connectTimeoutMS=30000,
-    socketTimeoutMS=30000
-)
+# Single shared client (pool settings come from the environment)
+client = get_client()
 db = client["RBG_AI"]
 client=client.RBG_AI
 Users=client.Users
@@ -76,6 +77,7 @@ AttendanceStats = db["attendance_stats"]  # For caching calculated stats
 WorkingDays = db["working_days"]
 
 Notifications = db.notifications
+NotificationCounters = db["notification_counters"]
 # Others
 def Adddata(data,id,filename):
     a=Add.insert_one({'userid':id,'data':data,'filename':filename})
@@ -346,6 +348,9 @@ def Clockin(userid, name, time):
             
             Clock.insert_one(record)
         
+        # Present/Late both count as a present day
+        record_attendance_event(userid, today.year, present_delta=1)
+        
         # Return success message
         return f"Clock-in successful at {clockin_dt.strftime('%I:%M:%S %p')}"
         
@@ -364,6 +369,49 @@ def parse_time_string(time_str):
         else:
             return datetime.strptime(time_str, "%H:%M")
 
+def _compute_auto_clockout(record, today, ist, clockout_default_time):
+    """Work out clock-out time, duration text and remark for one open record"""
+    # Parse clock-in time
+    clockin_time = parser.parse(record['clockin'])
+    if clockin_time.tzinfo is None:
+        clockin_time = ist.localize(clockin_time)
+    
+    # Set clock-out time to default time
+    clockout_time = ist.localize(datetime.combine(today, clockout_default_time))
+    end_of_day = ist.localize(datetime.combine(today, datetime.strptime("23:59:59", "%H:%M:%S").time()))
+    
+    # Safety: ensure clock-out is not before clock-in
+    if clockout_time < clockin_time:
+        # If default time is before clock-in, set to end of day
+        clockout_time = end_of_day
+    
+    # Cap clock-out time to end of day
+    if clockout_time > end_of_day:
+        clockout_time = end_of_day
+    
+    # Calculate total hours worked (never more than 24h)
+    total_seconds_worked = (clockout_time - clockin_time).total_seconds()
+    
+    # Safety checks
+    if total_seconds_worked < 0:
+        total_seconds_worked = 0
+        clockout_time = clockin_time
+    
+    if total_seconds_worked > 86400:
+        total_seconds_worked = 86400
+        clockout_time = clockin_time + timedelta(seconds=86400)
+    
+    # Calculate hours and minutes
+    total_hours_worked = int(total_seconds_worked // 3600)
+    total_minutes_worked = int((total_seconds_worked % 3600) // 60)
+    
+    # Determine remark
+    remark = "Auto Clock-out - Complete" if total_hours_worked >= 8 else "Auto Clock-out - Incomplete"
+    
+    # Format work duration
+    hours_text = f'{total_hours_worked} hours {total_minutes_worked} minutes'
+    return clockout_time, hours_text, remark
+
 # Define the auto-clockout function
 def auto_clockout():
     """
@@ -371,96 +419,115 @@ def auto_clockout():
     Clocks out all users who haven't clocked out yet with default time.
     - Runs at scheduled time (e.g., 9:30 PM)
     - Caps work duration at 24 hours
-    - Sends notifications to affected users
+    - Applies every clock-out with one unordered bulk_write
+    - Inserts the notifications with one insert_many and pushes them
+      to connected users concurrently
+    Returns a report dict.
     """
     print("Running auto-clockout task...")
+    started = datetime.now()
     ist = pytz.timezone("Asia/Kolkata")
     today = datetime.now(ist).date()
     
     # Default clock-out time - typically end of business day
     # You can change this to 6:30 PM or 8:00 PM as needed
     clockout_default_time = datetime.strptime("09:30:00 PM", "%I:%M:%S %p").time()
-
+    
+    report = {
+        "date": str(today),
+        "open_records": 0,
+        "clocked_out": 0,
+        "notifications_created": 0,
+        "websocket_pushed": 0,
+        "errors": [],
+    }
+    
     # Find all users who clocked in today but haven't clocked out
-    clocked_in_users = Clock.find({'date': str(today), 'clockout': {'$exists': False}})
-
-    users_processed = 0
+    clocked_in_users = list(Clock.find(
+        {'date': str(today), 'clockout': {'$exists': False}},
+        {'_id': 1, 'name': 1, 'userid': 1, 'clockin': 1}
+    ))
+    report["open_records"] = len(clocked_in_users)
+    
+    operations = []
+    notices = []  # (record _id, clockout written, userid, message)
     for record in clocked_in_users:
         try:
-            name = record.get('name', 'Unknown')
-            userid = record.get('userid', '')
-            
-            # Parse clock-in time
-            clockin_time = parser.parse(record['clockin'])
-            if clockin_time.tzinfo is None:
-                clockin_time = ist.localize(clockin_time)
-            
-            # Set clock-out time to default time
-            clockout_time = ist.localize(datetime.combine(today, clockout_default_time))
-            
-            # Safety: ensure clock-out is not before clock-in
-            if clockout_time < clockin_time:
-                # If default time is before clock-in, set to end of day
-                clockout_time = ist.localize(datetime.combine(today, datetime.strptime("23:59:59", "%H:%M:%S").time()))
-            
-            # Cap clock-out time to end of day
-            end_of_day = ist.localize(datetime.combine(today, datetime.strptime("23:59:59", "%H:%M:%S").time()))
-            if clockout_time > end_of_day:
-                clockout_time = end_of_day
-            
-            # Calculate total hours worked (never more than 24h)
-            total_seconds_worked = (clockout_time - clockin_time).total_seconds()
-            
-            # Safety checks
-            if total_seconds_worked < 0:
-                total_seconds_worked = 0
-                clockout_time = clockin_time
-            
-            if total_seconds_worked > 86400:
-                total_seconds_worked = 86400
-                clockout_time = clockin_time + timedelta(seconds=86400)
-            
-            # Calculate hours and minutes
-            total_hours_worked = int(total_seconds_worked // 3600)
-            total_minutes_worked = int((total_seconds_worked % 3600) // 60)
-            
-            # Determine remark
-            remark = "Auto Clock-out - Complete" if total_hours_worked >= 8 else "Auto Clock-out - Incomplete"
-            
-            # Format work duration
-            hours_text = f'{total_hours_worked} hours {total_minutes_worked} minutes'
-            
-            # Update the clock-out time in the database
-            Clock.find_one_and_update(
-                {'_id': record['_id']},
-                {'$set': {
-                    'clockout': clockout_time.isoformat(),
-                    'total_hours_worked': hours_text,
-                    'remark': remark
-                }}
-            )
-            
-            # Create auto clock-out notification
-            if userid:
-                try:
-                    create_attendance_notification(
-                        userid=userid,
-                        message=f"Automatic clock-out at {clockout_time.strftime('%I:%M:%S %p')}. Work time: {hours_text}. Please review your attendance.",
-                        priority="medium",
-                        attendance_type="auto_clock_out"
-                    )
-                except Exception as notif_error:
-                    print(f"Notification error for {name}: {str(notif_error)}")
-            
-            print(f"✓ Auto clock-out for {name}: {hours_text}")
-            users_processed += 1
-            
+            clockout_time, hours_text, remark = _compute_auto_clockout(record, today, ist, clockout_default_time)
         except Exception as e:
             print(f"✗ Error processing auto clock-out for record {record.get('_id')}: {str(e)}")
+            report["errors"].append({"record": str(record.get('_id')), "error": str(e)})
             continue
-
-    print(f"Auto-clockout completed. Processed {users_processed} users.")
-    return users_processed
+        
+        # Guard on clockout so a manual clock-out in the meantime wins
+        operations.append(UpdateOne(
+            {'_id': record['_id'], 'clockout': {'$exists': False}},
+            {'$set': {
+                'clockout': clockout_time.isoformat(),
+                'total_hours_worked': hours_text,
+                'remark': remark
+            }}
+        ))
+        if record.get('userid'):
+            notices.append((
+                record['_id'],
+                clockout_time.isoformat(),
+                record['userid'],
+                f"Automatic clock-out at {clockout_time.strftime('%I:%M:%S %p')}. Work time: {hours_text}. Please review your attendance."
+            ))
+    
+    if operations:
+        try:
+            result = Clock.bulk_write(operations, ordered=False)
+            report["clocked_out"] = result.modified_count
+        except Exception as e:
+            print(f"✗ Auto clock-out bulk write failed: {str(e)}")
+            report["errors"].append({"stage": "bulk_write", "error": str(e)})
+            details = getattr(e, "details", None) or {}
+            report["clocked_out"] = details.get("nModified", 0)
+            # Which records were written is unknown, so notify nobody
+            notices = []
+    
+    if notices and report["clocked_out"] < len(operations):
+        # The clockout guard skipped some records (clocked out manually in
+        # the meantime): only notify records still holding our clock-out
+        written = {
+            doc['_id']: doc.get('clockout')
+            for doc in Clock.find({'_id': {'$in': [n[0] for n in notices]}}, {'clockout': 1})
+        }
+        notices = [n for n in notices if written.get(n[0]) == n[1]]
+    
+    # Notifications: one role lookup, one insert, one concurrent push
+    if notices:
+        try:
+            action_urls = get_role_based_action_urls([userid for _, _, userid, _ in notices], "attendance")
+            notifications = [
+                _build_notification_doc(
+                    userid=userid,
+                    title="🔄 Auto Clock-out",
+                    message=message,
+                    notification_type="attendance",
+                    priority="medium",
+                    action_url=action_urls.get(userid),
+                    metadata={"attendance_alert": True, "attendance_type": "auto_clock_out"}
+                )
+                for _, _, userid, message in notices
+            ]
+            notifications = insert_notifications(notifications)
+            report["notifications_created"] = len(notifications)
+            
+            from websocket_manager import notification_manager
+            connected = [n for n in notifications if n["userid"] in notification_manager.active_connections]
+            if connected:
+                unread_counts = get_unread_notification_counts([n["userid"] for n in connected])
+                report["websocket_pushed"] = notification_manager.push_from_thread(connected, unread_counts)
+        except Exception as notif_error:
+            print(f"Auto clock-out notification error: {str(notif_error)}")
+            report["errors"].append({"stage": "notifications", "error": str(notif_error)})
+    
+    report["duration_ms"] = round((datetime.now() - started).total_seconds() * 1000, 1)
+    print(f"Auto-clockout completed. Processed {report['clocked_out']} users in {report['duration_ms']} ms.")
+    return report
 
 def Clockout(userid, name, time):
     """
@@ -914,8 +981,9 @@ def leave_History_Details(userid: str,selected_option):
     return leave_request
 
 def delete_leave(userid, fromdate, requestdate, leavetype):
-    result = Leave.delete_one({"userid":userid, "leaveType": leavetype, "selectedDate": format_timestamp(fromdate), "requestDate":format_timestamp(requestdate)})
-    if result.deleted_count>0:
+    deleted = Leave.find_one_and_delete({"userid":userid, "leaveType": leavetype, "selectedDate": format_timestamp(fromdate), "requestDate":format_timestamp(requestdate)})
+    if deleted:
+        _apply_leave_status_change(deleted, None)
         return "Deleted"
     else:
         return "Invalid request"
@@ -1447,6 +1515,8 @@ def updated_user_leave_requests_status_in_mongo(leave_id, status):
             {"$set": {"status": status}}
         )
         print(result)
+        if result.modified_count > 0:
+            _apply_leave_status_change(leave_request, status)
         if result.modified_count > 0:
             # Return detailed information for notifications
             response_data = {
@@ -1516,6 +1586,8 @@ def recommend_manager_leave_requests_status_in_mongo(leave_id, status):
             {"$set": {"status": status}}
         )
         print(result)
+        if result.modified_count > 0:
+            _apply_leave_status_change(leave_request, status)
         
         if result.modified_count > 0:
             # Return detailed information for notifications
@@ -2064,13 +2136,80 @@ def get_admin_info(email):
 def iso_today():
     return datetime.now().strftime("%Y-%m-%d")
 
+# Tasks keep the display string due_date ("DD-MM-YYYY") plus due_at, the same
+# calendar day as a naive midnight datetime, so overdue / due-soon checks are
+# indexed range queries on (status, due_at) instead of parsing every task.
+TASK_DUE_DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%d", "%y-%m-%d")
+TASK_SCAN_BATCH_SIZE = int(os.environ.get("TASK_SCAN_BATCH_SIZE", "500"))
+
+def parse_task_due_date(value):
+    """Parse a stored or submitted due date into a midnight datetime, or None."""
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    for fmt in TASK_DUE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+def task_today():
+    """Today's date (IST) as a midnight datetime, comparable with due_at."""
+    today = datetime.now(pytz.timezone("Asia/Kolkata")).date()
+    return datetime(today.year, today.month, today.day)
+
+def iter_task_batches(query, projection=None, batch_size=TASK_SCAN_BATCH_SIZE):
+    """Stream tasks matching query from one cursor, yielding lists of batch_size."""
+    batch = []
+    for task in Tasks.find(query, projection).batch_size(batch_size):
+        batch.append(task)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def backfill_task_due_at(batch_size=TASK_SCAN_BATCH_SIZE):
+    """
+    Add due_at to tasks written before it existed and rewrite their due_date
+    as DD-MM-YYYY (add_task_list used to store YY-MM-DD).  Unparseable due
+    dates get due_at None so they are not picked up again.
+    """
+    updated = 0
+    while True:
+        batch = list(Tasks.find(
+            {"due_at": {"$exists": False}},
+            {"due_date": 1}
+        ).limit(batch_size))
+        if not batch:
+            break
+
+        operations = []
+        for task in batch:
+            due_at = parse_task_due_date(task.get("due_date"))
+            fields = {"due_at": due_at}
+            if due_at:
+                fields["due_date"] = due_at.strftime("%d-%m-%Y")
+            operations.append(UpdateOne({"_id": task["_id"]}, {"$set": fields}))
+
+        result = Tasks.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+        if len(batch) < batch_size:
+            break
+
+    print(f"Task due_at backfill: {updated} tasks updated")
+    return updated
+
 def add_task_list(task, userid, date, due_date, assigned_by="self",priority="Medium", subtasks=None, comments=None,files=None):
     task_entry = {
         "task": task,
         "status": "Not completed",
         # ✅ format here
         "date": datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y"),
-        "due_date": datetime.strptime(due_date, "%Y-%m-%d").strftime("%y-%m-%d"),
+        "due_date": datetime.strptime(due_date, "%Y-%m-%d").strftime("%d-%m-%Y"),
+        "due_at": parse_task_due_date(due_date),
         "userid": userid,
         # "assigned_by": assigned_by,
         "assigned_by": assigned_by if assigned_by else "HR",
@@ -2130,6 +2269,7 @@ def manager_task_assignment(task:str, userid: str, TL, today, due_date, assigned
         "status": "Not completed",
         "date": today,
         "due_date": due_date,
+        "due_at": parse_task_due_date(due_date),
         "userid": userid,
         "TL": TL,
         "assigned_by": assigned_by or TL,
@@ -2201,6 +2341,7 @@ def edit_the_task(
         update_fields["completed_date"] = cdate
     if due_date and due_date != "string":
         update_fields["due_date"] = due_date
+        update_fields["due_at"] = parse_task_due_date(due_date)
     if priority and priority != "string":
         update_fields["priority"] = priority
     if verified is not None:
@@ -3337,14 +3478,21 @@ def add_an_employee(employee_data):
         # employee_data["userid"] = userid
         print(employee_data)
         result = Users.insert_one(employee_data)
+        invalidate_user_role(str(result.inserted_id))
         return {"message": "Employee details added successfully"}
     
     
 def auto_approve_manager_leaves():
-    Leave.update_many(
+    pending = list(Leave.find(
         {"position":"Manager", "status": "Recommend"},
+        {"userid": 1, "status": 1, "leaveType": 1, "selectedDate": 1, "ToDate": 1}
+    ))
+    Leave.update_many(
+        {"_id": {"$in": [leave["_id"] for leave in pending]}, "status": "Recommend"},
         {"$set": {"status": "Approved"}}
     )
+    for leave in pending:
+        _apply_leave_status_change(leave, "Approved")
 
     return {"message": "Manager leave requests have been auto-approved where applicable."}
 
@@ -3393,6 +3541,8 @@ def edit_an_employee(employee_data):
         )
         
         if result:
+            invalidate_user_role(str(result["_id"]))
+            invalidate_user_names()
             return {"message": "Employee details updated successfully"}
         
         # Try updating by ObjectId in Users collection
@@ -3404,6 +3554,8 @@ def edit_an_employee(employee_data):
                 return_document=True
             )
             if result:
+                invalidate_user_role(str(result["_id"]))
+                invalidate_user_names()
                 return {"message": "Employee details updated successfully"}
         except:
             pass
@@ -3417,6 +3569,8 @@ def edit_an_employee(employee_data):
                 return_document=True
             )
             if result:
+                invalidate_user_role(str(result["_id"]))
+                invalidate_user_names()
                 return {"message": "Admin details updated successfully"}
             else:
                 raise HTTPException(status_code=404, detail="Employee not found in any collection")
@@ -3449,6 +3603,7 @@ def task_assign_to_multiple_users(task_details):
                 "status": "Not completed",
                 "date": datetime.strptime(item["date"], "%Y-%m-%d").strftime("%d-%m-%Y"),
                 "due_date": datetime.strptime(item["due_date"], "%Y-%m-%d").strftime("%d-%m-%Y"),
+                "due_at": parse_task_due_date(item["due_date"]),
                 "userid": item["userid"],
                 "assigned_by": item.get("assigned_by") or "HR",
                 "priority": item.get("priority", "Medium"),
@@ -3492,6 +3647,7 @@ async def task_assign_to_multiple_users_with_notification(task_details, assigner
                 "status": "Not completed",
                 "date": datetime.strptime(item["date"], "%Y-%m-%d").strftime("%d-%m-%Y"),
                 "due_date": due_date,
+                "due_at": parse_task_due_date(due_date),
                 "userid": userid,
                 "assigned_by": item.get("assigned_by") or "HR",
                 "priority": item.get("priority", "Medium"),
@@ -3734,183 +3890,287 @@ def get_local_ip():
 
 # Notification System Functions
 
+# Action URLs per notification type for admin-level and regular users
+ACTION_URL_MAPPINGS = {
+    # Task-related notifications
+    'task': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'task_created': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'task_manager_assigned': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'task_overdue': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'task_due_soon': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'manager_task': {
+        'admin': '/admin/task',
+        'user': '/user/todo'
+    },
+    'hr_task': {
+        'admin': '/admin/task',
+        'user': '/admin/task'  # HR users should see admin task view
+    },
+
+    # Leave-related notifications
+    'leave': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_submitted': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_approved': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_rejected': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_recommended': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_admin_pending': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/Leave'
+    },
+    'leave_manager_pending': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/Leave'
+    },
+    'leave_hr_final_approval': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+    'leave_final_approval_required': {
+        'admin': '/admin/leaveapproval',
+        'user': '/User/LeaveHistory'
+    },
+
+    # WFH-related notifications
+    'wfh': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_submitted': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_approved': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_rejected': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_admin_pending': {
+        'admin': '/admin/wfh',
+        'user': '/User/Workfromhome'
+    },
+    'wfh_manager_pending': {
+        'admin': '/admin/wfh',
+        'user': '/User/Workfromhome'
+    },
+    'wfh_hr_final_approval': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_hr_pending': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+    'wfh_final_approval_required': {
+        'admin': '/admin/wfh',
+        'user': '/User/Remote_details'
+    },
+
+    # Attendance-related notifications
+    'attendance': {
+        'admin': '/admin/time',
+        'user': '/User/Clockin_int/Clockdashboard'
+    },
+
+    # Employee management notifications
+    'employee': {
+        'admin': '/admin/employee',
+        'user': '/User/profile'
+    },
+
+    # Document-related notifications
+    'document': {
+        'admin': '/admin/review-docs',  # Admin reviews documents in review-docs page
+        'user': '/User/profile'
+    },
+
+    # System notifications
+    'system': {
+        'admin': '/admin/profile',
+        'user': '/User/profile'
+    }
+}
+
+# userid -> is_admin_level, consulted by every notification that needs an action URL.
+# invalidate_user_role() only clears this worker; other workers keep a
+# promoted or demoted user's old role for at most ROLE_CACHE_TTL seconds.
+ROLE_CACHE_TTL = int(os.environ.get("ROLE_CACHE_TTL", "60"))
+_role_cache = TTLCache(ROLE_CACHE_TTL)
+
+def _is_admin_level(user):
+    """Admins and HR users are routed to admin pages"""
+    is_admin = user.get("isadmin", False)
+    position = (user.get("position") or "").lower()
+    department = (user.get("department") or "").lower()
+    # Determine user role - HR users should be treated as admin-level for routing
+    is_hr = ("hr" in position or "hr" in department)
+    return bool(is_admin or is_hr)
+
+def invalidate_user_role(userid=None):
+    """Forget cached roles for one user (or everyone) after an employee write"""
+    _role_cache.invalidate(userid)
+
+# member id (ObjectId string or userid) -> display name, for chat notifications.
+# invalidate_user_names() only clears this worker; other workers show a
+# renamed user's old name for at most USER_NAME_CACHE_TTL seconds.
+USER_NAME_CACHE_TTL = int(os.environ.get("USER_NAME_CACHE_TTL", "60"))
+_user_name_cache = TTLCache(USER_NAME_CACHE_TTL)
+
+def invalidate_user_names():
+    """Forget cached names after an employee edit (ids come in two forms, so clear all)"""
+    _user_name_cache.invalidate()
+
+def get_user_names(member_ids):
+    """
+    {member_id: name} for users given as ObjectId strings or userid values,
+    served from the name cache; misses are loaded with one query on Users.
+    """
+    names = {}
+    missing = []
+    for member_id in member_ids:
+        name = _user_name_cache.get(member_id)
+        if name is None:
+            missing.append(member_id)
+        else:
+            names[member_id] = name
+    if not missing:
+        return names
+
+    object_ids = [ObjectId(m) for m in missing if ObjectId.is_valid(m)]
+    other_ids = [m for m in missing if not ObjectId.is_valid(m)]
+    found = {}
+    for member in Users.find(
+        {"$or": [{"_id": {"$in": object_ids}}, {"userid": {"$in": other_ids}}]},
+        {"_id": 1, "userid": 1, "name": 1}
+    ):
+        name = member.get("name", "User")
+        found[str(member["_id"])] = name
+        if member.get("userid"):
+            found.setdefault(member["userid"], name)
+    for member_id in missing:
+        if member_id in found:
+            names[member_id] = found[member_id]
+            _user_name_cache.set(member_id, found[member_id])
+    return names
+
+def get_user_admin_levels(userids):
+    """
+    {userid: is_admin_level} for many users, served from the role cache;
+    misses are loaded with one query on Users and one on admin.
+    Unknown users are absent from the result.
+    """
+    levels = {}
+    misses = []
+    for userid in set(userids):
+        if not userid:
+            continue
+        cached = _role_cache.get(userid)
+        if cached is None:
+            misses.append(userid)
+        else:
+            levels[userid] = cached
+    
+    object_ids = [ObjectId(u) for u in misses if ObjectId.is_valid(u)]
+    if not object_ids:
+        return levels
+    
+    role_fields = {"isadmin": 1, "position": 1, "department": 1}
+    try:
+        found = list(Users.find({"_id": {"$in": object_ids}}, role_fields))
+        found_ids = {user["_id"] for user in found}
+        missing = [oid for oid in object_ids if oid not in found_ids]
+        if missing:
+            # Try admin collection if not found in Users
+            found.extend(admin.find({"_id": {"$in": missing}}, role_fields))
+    except Exception as e:
+        print(f"Error looking up user roles: {e}")
+        return levels
+    
+    for user in found:
+        userid = str(user["_id"])
+        levels[userid] = _is_admin_level(user)
+        _role_cache.set(userid, levels[userid])
+    return levels
+
 def get_role_based_action_url(userid, notification_type, base_path=None):
     """Get the appropriate action URL based on user role and notification type"""
     try:
-        # Get user info to determine role
-        user = Users.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
-        if not user:
-            # Try admin collection if not found in Users
-            user = admin.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
-        if not user:
-            return base_path or '/User/Clockin_int'
-        is_admin = user.get("isadmin", False)
-        position = user.get("position", "").lower()
-        department = user.get("department", "").lower()
-        # Determine user role - HR users should be treated as admin-level for routing
-        is_hr = ("hr" in position or "hr" in department)
-        is_admin_level = is_admin or is_hr
-        
-        # Define URL mappings for different notification types
-        url_mappings = {
-            # Task-related notifications
-            'task': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'task_created': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'task_manager_assigned': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'task_overdue': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'task_due_soon': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'manager_task': {
-                'admin': '/admin/task',
-                'user': '/user/todo'
-            },
-            'hr_task': {
-                'admin': '/admin/task',
-                'user': '/admin/task'  # HR users should see admin task view
-            },
-            
-            # Leave-related notifications
-            'leave': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_submitted': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_approved': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_rejected': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_recommended': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_admin_pending': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/Leave'
-            },
-            'leave_manager_pending': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/Leave'
-            },
-            'leave_hr_final_approval': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            'leave_final_approval_required': {
-                'admin': '/admin/leaveapproval',
-                'user': '/User/LeaveHistory'
-            },
-            
-            # WFH-related notifications
-            'wfh': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_submitted': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_approved': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_rejected': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_admin_pending': {
-                'admin': '/admin/wfh',
-                'user': '/User/Workfromhome'
-            },
-            'wfh_manager_pending': {
-                'admin': '/admin/wfh',
-                'user': '/User/Workfromhome'
-            },
-            'wfh_hr_final_approval': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_hr_pending': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            'wfh_final_approval_required': {
-                'admin': '/admin/wfh',
-                'user': '/User/Remote_details'
-            },
-            
-            # Attendance-related notifications
-            'attendance': {
-                'admin': '/admin/time',
-                'user': '/User/Clockin_int/Clockdashboard'
-            },
-            
-            # Employee management notifications
-            'employee': {
-                'admin': '/admin/employee',
-                'user': '/User/profile'
-            },
-            
-            # Document-related notifications
-            'document': {
-                'admin': '/admin/review-docs',  # Admin reviews documents in review-docs page
-                'user': '/User/profile'
-            },
-            
-            # System notifications
-            'system': {
-                'admin': '/admin/profile',
-                'user': '/User/profile'
-            }
-        }
-        
-        # Get the appropriate URL based on role
-        role_key = 'admin' if is_admin_level else 'user'
-        
-        if notification_type in url_mappings:
-            return url_mappings[notification_type][role_key]
-        
-        # Fallback to base_path if provided
-        if base_path:
-            return base_path
-        
-        # Default fallback
-        return '/admin' if is_admin_level else '/User/Clockin_int'
-        
+        is_admin_level = get_user_admin_levels([userid]).get(userid)
+        return _resolve_action_url(is_admin_level, notification_type, base_path)
     except Exception as e:
         print(f"Error determining role-based action URL: {e}")
         return base_path or '/User/Clockin_int'
 
-async def create_notification_with_websocket(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None):
-    """Create a new notification and send via WebSocket"""
+def get_role_based_action_urls(userids, notification_type, base_path=None):
+    """Batch version of get_role_based_action_url: {userid: action_url}"""
+    levels = get_user_admin_levels(userids)
+    return {
+        userid: _resolve_action_url(levels.get(userid), notification_type, base_path)
+        for userid in userids
+    }
+
+def _resolve_action_url(is_admin_level, notification_type, base_path=None):
+    """Pick the action URL for a known role (None when the user was not found)"""
+    if is_admin_level is None:
+        return base_path or '/User/Clockin_int'
+    
+    # Get the appropriate URL based on role
+    role_key = 'admin' if is_admin_level else 'user'
+    
+    if notification_type in ACTION_URL_MAPPINGS:
+        return ACTION_URL_MAPPINGS[notification_type][role_key]
+    
+    # Fallback to base_path if provided
+    if base_path:
+        return base_path
+    
+    # Default fallback
+    return '/admin' if is_admin_level else '/User/Clockin_int'
+
+async def create_notification_with_websocket(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None, dedup_key=None):
+    """Create a new notification and send via WebSocket (nothing is sent for a duplicate dedup_key)"""
+    # Import here to avoid circular imports
+    from async_mongo import run_sync
     try:
         # Determine the appropriate action URL based on user role and notification type
         if action_url is None:
-            action_url = get_role_based_action_url(userid, notification_type)
+            action_url = await run_sync(get_role_based_action_url, userid, notification_type)
         
-        notification_id = create_notification(userid, title, message, notification_type, priority, action_url, related_id, metadata)
+        notification_id, created = await run_sync(upsert_notification, userid, title, message, notification_type, priority, action_url, related_id, metadata, dedup_key)
         
-        if notification_id:
+        if created:
             # Import here to avoid circular imports
             from websocket_manager import notification_manager
             
@@ -3933,90 +4193,487 @@ async def create_notification_with_websocket(userid, title, message, notificatio
             await notification_manager.send_personal_notification(userid, notification_data)
             
             # Update unread count
-            unread_count = get_unread_notification_count(userid)
+            unread_count = await run_sync(get_unread_notification_count, userid)
             await notification_manager.send_unread_count_update(userid, unread_count)
             
         return notification_id
     except Exception as e:
         print(f"Error creating notification with websocket: {e}")
-        return create_notification(userid, title, message, notification_type, priority, action_url, related_id, metadata)
+        return create_notification(userid, title, message, notification_type, priority, action_url, related_id, metadata, dedup_key)
+
+def _build_notification_doc(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None):
+    """Notification document as stored in the notifications collection"""
+    timestamp = get_current_timestamp_iso()
+    return {
+        "userid": userid,
+        "title": title,
+        "message": message,
+        "type": notification_type,
+        "priority": priority,
+        "action_url": action_url,
+        "related_id": related_id,
+        "metadata": metadata or {},
+        "is_read": False,
+        "created_at": timestamp,
+        "updated_at": timestamp,
+        # Real datetime for range queries, archival and TTL bookkeeping
+        "created_ts": datetime.utcnow()
+    }
 
-def create_notification(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None):
-    """Create a new notification with timezone-aware timestamps"""
+# Read notifications are removed by a TTL index on expires_at this many
+# days after they were read (see notification_retention.py)
+NOTIFICATION_READ_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_READ_RETENTION_DAYS", "30"))
+
+def _read_expiry():
+    return datetime.utcnow() + timedelta(days=NOTIFICATION_READ_RETENTION_DAYS)
+
+# Unread notification counters
+# notification_counters holds {_id: userid, unread: n}, adjusted with $inc on
+# create / mark read / mark all read / delete.  A counter is only adjusted
+# once it exists; missing counters are seeded with a count on first read and
+# reconcile_unread_counters() repairs any drift.  Values are also kept in a
+# short-lived in-process cache so badge polls rarely reach the database.
+UNREAD_COUNT_CACHE_TTL = int(os.environ.get("UNREAD_COUNT_CACHE_TTL", "30"))
+_unread_cache = TTLCache(UNREAD_COUNT_CACHE_TTL)
+
+def _seed_unread_counters(userids):
+    """Count unread notifications for users without a counter and store the result"""
+    counts = {userid: 0 for userid in userids}
+    if not counts:
+        return counts
+    for row in Notifications.aggregate([
+        {"$match": {"userid": {"$in": list(counts)}, "is_read": False}},
+        {"$group": {"_id": "$userid", "count": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["count"]
+    
+    now = datetime.now()
+    NotificationCounters.bulk_write([
+        UpdateOne({"_id": userid}, {"$set": {"unread": count, "updated_at": now}}, upsert=True)
+        for userid, count in counts.items()
+    ], ordered=False)
+    for userid, count in counts.items():
+        _unread_cache.set(userid, count)
+    return counts
+
+def _adjust_unread_counter(userid, delta):
+    """Atomically move one user's unread counter"""
+    if not userid or not delta:
+        return
     try:
-        # Determine the appropriate action URL based on user role and notification type
-        if action_url is None:
-            action_url = get_role_based_action_url(userid, notification_type)
-        
-        notification = {
+        counter = NotificationCounters.find_one_and_update(
+            {"_id": userid},
+            {"$inc": {"unread": delta}, "$set": {"updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if counter is None:
+            # Not seeded yet; the next read counts from the source
+            _unread_cache.invalidate(userid)
+        elif counter["unread"] < 0:
+            _seed_unread_counters([userid])
+        else:
+            _unread_cache.set(userid, counter["unread"])
+    except Exception as e:
+        print(f"Error adjusting unread counter for {userid}: {e}")
+        _unread_cache.invalidate(userid)
+
+def _adjust_unread_counters(deltas):
+    """Apply {userid: delta} with one bulk_write"""
+    deltas = {userid: delta for userid, delta in deltas.items() if userid and delta}
+    if not deltas:
+        return
+    now = datetime.now()
+    try:
+        NotificationCounters.bulk_write([
+            UpdateOne({"_id": userid}, {"$inc": {"unread": delta}, "$set": {"updated_at": now}})
+            for userid, delta in deltas.items()
+        ], ordered=False)
+    except Exception as e:
+        print(f"Error adjusting unread counters: {e}")
+    for userid in deltas:
+        _unread_cache.invalidate(userid)
+
+def insert_notifications(notifications):
+    """
+    Insert prepared notification documents with one unordered insert_many.
+    Returns the documents that were stored (with their _id as a string); on a
+    partial failure the failed documents are logged and left out.
+    """
+    if not notifications:
+        return []
+    try:
+        Notifications.insert_many(notifications, ordered=False)
+        inserted = notifications
+    except BulkWriteError as e:
+        # insert_many assigned every _id up front; drop the rejected ones
+        write_errors = e.details.get("writeErrors", [])
+        failed = {error["index"] for error in write_errors}
+        inserted = [n for i, n in enumerate(notifications) if i not in failed]
+        print(f"⚠️ {len(failed)} of {len(notifications)} notifications failed to insert: "
+              f"{write_errors[0].get('errmsg') if write_errors else e}")
+    for notification in inserted:
+        notification["_id"] = str(notification["_id"])
+    
+    deltas = {}
+    for notification in inserted:
+        deltas[notification["userid"]] = deltas.get(notification["userid"], 0) + 1
+    _adjust_unread_counters(deltas)
+    return inserted
+
+def get_unread_notification_counts(userids):
+    """Unread counts for many users from the counters: {userid: count}"""
+    counts = {}
+    misses = []
+    for userid in set(userids):
+        cached = _unread_cache.get(userid)
+        if cached is None:
+            misses.append(userid)
+        else:
+            counts[userid] = cached
+    if not misses:
+        return counts
+    
+    try:
+        for counter in NotificationCounters.find({"_id": {"$in": misses}}, {"unread": 1}):
+            counts[counter["_id"]] = counter["unread"]
+            _unread_cache.set(counter["_id"], counter["unread"])
+        unseeded = [userid for userid in misses if userid not in counts]
+        if unseeded:
+            counts.update(_seed_unread_counters(unseeded))
+    except Exception as e:
+        print(f"Error getting unread notification counts: {e}")
+        for userid in misses:
+            counts.setdefault(userid, 0)
+    return counts
+
+def reconcile_unread_counters():
+    """Rebuild every stored counter from the notifications collection"""
+    actual = {
+        row["_id"]: row["count"]
+        for row in Notifications.aggregate([
+            {"$match": {"is_read": False}},
+            {"$group": {"_id": "$userid", "count": {"$sum": 1}}}
+        ])
+    }
+    
+    operations = []
+    now = datetime.now()
+    for counter in NotificationCounters.find({}, {"unread": 1}):
+        expected = actual.pop(counter["_id"], 0)
+        if counter.get("unread") != expected:
+            operations.append(UpdateOne(
+                {"_id": counter["_id"]},
+                {"$set": {"unread": expected, "updated_at": now}}
+            ))
+    # Users with unread notifications but no counter yet
+    for userid, count in actual.items():
+        if userid:
+            operations.append(UpdateOne(
+                {"_id": userid},
+                {"$set": {"unread": count, "updated_at": now}},
+                upsert=True
+            ))
+    
+    if operations:
+        NotificationCounters.bulk_write(operations, ordered=False)
+    _unread_cache.invalidate()
+    print(f"Reconciled unread counters: {len(operations)} corrected")
+    return len(operations)
+
+def prepare_notifications(items):
+    """
+    Build and insert notification documents for a fan-out; returns the
+    documents that were stored.
+    items: dicts with userid, title, message, notification_type and optional
+    priority, action_url, related_id, metadata.  Missing action URLs are
+    resolved with one user lookup for all recipients.
+    """
+    unresolved = [item["userid"] for item in items if not item.get("action_url")]
+    levels = get_user_admin_levels(unresolved) if unresolved else {}
+    
+    notifications = []
+    for item in items:
+        action_url = item.get("action_url") or _resolve_action_url(
+            levels.get(item["userid"]), item["notification_type"]
+        )
+        notifications.append(_build_notification_doc(
+            item["userid"],
+            item["title"],
+            item["message"],
+            item["notification_type"],
+            item.get("priority", "medium"),
+            action_url,
+            item.get("related_id"),
+            item.get("metadata")
+        ))
+    return insert_notifications(notifications)
+
+async def fan_out_notifications(items, max_concurrency=None):
+    """
+    Create notifications for many recipients and deliver them in real time.
+    One role lookup, one insert_many, one unread-count aggregation for the
+    connected recipients, then concurrent websocket sends with bounded
+    parallelism.  Returns the list of created notification ids.
+    """
+    # Import here to avoid circular imports
+    from async_mongo import run_sync
+    from websocket_manager import notification_manager
+    
+    if not items:
+        return []
+    try:
+        notifications = await run_sync(prepare_notifications, items)
+    except Exception as e:
+        print(f"Error creating fan-out notifications: {e}")
+        return []
+    
+    connected = [n for n in notifications if n["userid"] in notification_manager.active_connections]
+    if connected:
+        try:
+            unread_counts = await run_sync(get_unread_notification_counts, list({n["userid"] for n in connected}))
+            await notification_manager.send_bulk_notifications(connected, unread_counts, max_concurrency)
+        except Exception as e:
+            print(f"Error delivering fan-out notifications: {e}")
+    
+    print(f"✅ Fan-out created {len(notifications)} notifications, {len(connected)} delivered live")
+    return [n["_id"] for n in notifications]
+
+# Digest notifications
+# Scheduled checks coalesce everything for one (recipient, type) into a
+# single digest per day.  The digest carries a dedup_key, so later runs on
+# the same day update the existing document instead of inserting another;
+# only newly created digests are pushed over the websocket.
+DIGEST_MAX_ITEMS = int(os.environ.get("NOTIFICATION_DIGEST_MAX_ITEMS", "50"))
+
+def _digest_period():
+    return datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%Y-%m-%d")
+
+def build_digests(entries, notification_type, title_fn, message_fn, priority="medium", action_url=None):
+    """
+    Group (userid, item) pairs into one digest per recipient.
+    title_fn(items) and message_fn(items) render the text from the item list.
+    """
+    grouped = {}
+    for userid, item in entries:
+        if userid:
+            grouped.setdefault(userid, []).append(item)
+    
+    return [
+        {
             "userid": userid,
-            "title": title,
-            "message": message,
-            "type": notification_type,
+            "notification_type": notification_type,
+            "title": title_fn(items),
+            "message": message_fn(items),
             "priority": priority,
             "action_url": action_url,
-            "related_id": related_id,
-            "metadata": metadata or {},
-            "is_read": False,
-            "created_at": get_current_timestamp_iso(),
-            "updated_at": get_current_timestamp_iso()
+            "items": items
         }
-        result = Notifications.insert_one(notification)
-        print(f"✅ Created notification with timestamp: {notification['created_at']}")
-        return str(result.inserted_id)
+        for userid, items in grouped.items()
+    ]
+
+def upsert_digest_notifications(digests):
+    """
+    Write digests keyed by (recipient, type, day) with one bulk upsert.
+    Returns the notification documents that were newly created.
+    """
+    if not digests:
+        return []
+    
+    period = _digest_period()
+    unresolved = [d["userid"] for d in digests if not d.get("action_url")]
+    levels = get_user_admin_levels(unresolved) if unresolved else {}
+    
+    operations = []
+    new_docs = []
+    for digest in digests:
+        action_url = digest.get("action_url") or _resolve_action_url(
+            levels.get(digest["userid"]), digest["notification_type"]
+        )
+        items = digest["items"]
+        doc = _build_notification_doc(
+            digest["userid"],
+            digest["title"],
+            digest["message"],
+            digest["notification_type"],
+            digest.get("priority", "medium"),
+            action_url,
+            None,
+            {
+                "digest": True,
+                "period": period,
+                "item_count": len(items),
+                "items": items[:DIGEST_MAX_ITEMS]
+            }
+        )
+        doc["dedup_key"] = f"{digest['userid']}:{digest['notification_type']}:{period}"
+        
+        changing = {k: doc[k] for k in ("title", "message", "priority", "action_url", "metadata", "updated_at")}
+        on_insert = {k: v for k, v in doc.items() if k not in changing}
+        operations.append(UpdateOne(
+            {"dedup_key": doc["dedup_key"]},
+            {"$set": changing, "$setOnInsert": on_insert},
+            upsert=True
+        ))
+        new_docs.append(doc)
+    
+    try:
+        result = Notifications.bulk_write(operations, ordered=False)
+        upserted = result.upserted_ids
+    except BulkWriteError as e:
+        # A concurrent run created the same digest first (unique dedup_key)
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+    
+    created = []
+    for index, inserted_id in upserted.items():
+        doc = new_docs[index]
+        doc["_id"] = str(inserted_id)
+        created.append(doc)
+    
+    deltas = {}
+    for doc in created:
+        deltas[doc["userid"]] = deltas.get(doc["userid"], 0) + 1
+    _adjust_unread_counters(deltas)
+    
+    print(f"📬 Digests: {len(created)} created, {len(digests) - len(created)} updated")
+    return created
+
+async def send_digest_notifications(digests):
+    """Upsert digests and push the newly created ones to connected users"""
+    # Import here to avoid circular imports
+    from async_mongo import run_sync
+    from websocket_manager import notification_manager
+    
+    created = await run_sync(upsert_digest_notifications, digests)
+    connected = [n for n in created if n["userid"] in notification_manager.active_connections]
+    if connected:
+        try:
+            unread_counts = await run_sync(get_unread_notification_counts, list({n["userid"] for n in connected}))
+            await notification_manager.send_bulk_notifications(connected, unread_counts)
+        except Exception as e:
+            print(f"Error delivering digest notifications: {e}")
+    return {"digests": len(digests), "created": len(created)}
+
+def notification_dedup_key(*parts, window_seconds=None):
+    """
+    Dedup key from the identifying parts of a notification.
+    window_seconds adds a fixed time bucket, for "at most once per window"
+    keys.  Buckets are aligned to the epoch, not to the first event: two
+    events a few seconds apart on either side of a bucket boundary get
+    different keys and are both delivered.
+    """
+    if window_seconds:
+        parts = parts + (int(datetime.now().timestamp() // window_seconds),)
+    return ":".join(str(part) for part in parts)
+
+def upsert_notification(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None, dedup_key=None):
+    """
+    Create a notification unless one with the same dedup_key exists.
+    Returns (notification_id, created): for a duplicate the id is the
+    existing document's and created is False, so callers skip the push.
+    """
+    # Determine the appropriate action URL based on user role and notification type
+    if action_url is None:
+        action_url = get_role_based_action_url(userid, notification_type)
+    
+    notification = _build_notification_doc(userid, title, message, notification_type, priority, action_url, related_id, metadata)
+    if dedup_key:
+        notification["_id"] = ObjectId()
+        notification["dedup_key"] = dedup_key
+        try:
+            existing = Notifications.find_one_and_update(
+                {"dedup_key": dedup_key},
+                {"$setOnInsert": notification},
+                projection={"_id": 1},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race to a concurrent writer
+            existing = Notifications.find_one({"dedup_key": dedup_key}, {"_id": 1}) or {"_id": None}
+        if existing:
+            print(f"⏭️ Notification {dedup_key} already exists. Skipping duplicate.")
+            return (str(existing["_id"]) if existing["_id"] else None), False
+        inserted_id = notification["_id"]
+    else:
+        inserted_id = Notifications.insert_one(notification).inserted_id
+    _adjust_unread_counter(userid, 1)
+    print(f"✅ Created notification with timestamp: {notification['created_at']}")
+    return str(inserted_id), True
+
+def create_notification(userid, title, message, notification_type, priority="medium", action_url=None, related_id=None, metadata=None, dedup_key=None):
+    """
+    Create a new notification with timezone-aware timestamps.
+    With a dedup_key the write is an upsert against the unique dedup_key
+    index: the first call creates the notification, repeated calls (other
+    scheduler runs, retries) return the existing notification's id.
+    """
+    try:
+        notification_id, _ = upsert_notification(userid, title, message, notification_type, priority, action_url, related_id, metadata, dedup_key)
+        return notification_id
     except Exception as e:
         print(f"Error creating notification: {e}")
         return None
 
+def _format_notification(notification):
+    """Make a notification document JSON friendly (string ids, ISO timestamps)"""
+    notification["_id"] = str(notification["_id"])
+    # Ensure timezone-aware timestamps are properly formatted
+    created_at = notification["created_at"]
+    updated_at = notification.get("updated_at")
+    
+    # Handle created_at timestamp
+    if isinstance(created_at, str):
+        # Already a string, keep as is
+        pass
+    elif isinstance(created_at, datetime):
+        # If datetime is not timezone-aware, make it timezone-aware
+        if created_at.tzinfo is None:
+            created_at = pytz.timezone("Asia/Kolkata").localize(created_at)
+        # Convert to ISO format with timezone info
+        notification["created_at"] = format_timestamp_iso(created_at)
+    
+    # Handle updated_at timestamp
+    if updated_at:
+        if isinstance(updated_at, str):
+            # Already a string, keep as is
+            pass
+        elif isinstance(updated_at, datetime):
+            # If datetime is not timezone-aware, make it timezone-aware
+            if updated_at.tzinfo is None:
+                updated_at = pytz.timezone("Asia/Kolkata").localize(updated_at)
+            # Convert to ISO format with timezone info
+            notification["updated_at"] = format_timestamp_iso(updated_at)
+    else:
+        # Set updated_at to created_at if not present
+        notification["updated_at"] = notification["created_at"]
+    return notification
+
+def get_notifications_page(userid, notification_type=None, priority=None, is_read=None, limit=50, cursor=None):
+    """
+    One page of a user's notifications, newest first.
+    Returns {"notifications": [...], "next_cursor": token or None};
+    raises pagination.InvalidCursor for a bad cursor.
+    """
+    query = {"userid": userid}
+    
+    if notification_type:
+        query["type"] = notification_type
+    if priority:
+        query["priority"] = priority
+    if is_read is not None:
+        query["is_read"] = is_read
+    
+    notifications, next_cursor = paginate(Notifications, query, limit, cursor)
+    return {
+        "notifications": [_format_notification(n) for n in notifications],
+        "next_cursor": next_cursor
+    }
+
 def get_notifications(userid, notification_type=None, priority=None, is_read=None, limit=50):
     """Get notifications for a user with optional filters"""
     try:
-        query = {"userid": userid}
-        
-        if notification_type:
-            query["type"] = notification_type
-        if priority:
-            query["priority"] = priority
-        if is_read is not None:
-            query["is_read"] = is_read
-            
-        notifications = list(Notifications.find(query)
-                           .sort("created_at", -1)
-                           .limit(limit))
-        
-        for notification in notifications:
-            notification["_id"] = str(notification["_id"])
-            # Ensure timezone-aware timestamps are properly formatted
-            created_at = notification["created_at"]
-            updated_at = notification.get("updated_at")
-            
-            # Handle created_at timestamp
-            if isinstance(created_at, str):
-                # Already a string, keep as is
-                pass
-            elif isinstance(created_at, datetime):
-                # If datetime is not timezone-aware, make it timezone-aware
-                if created_at.tzinfo is None:
-                    created_at = pytz.timezone("Asia/Kolkata").localize(created_at)
-                # Convert to ISO format with timezone info
-                notification["created_at"] = format_timestamp_iso(created_at)
-            
-            # Handle updated_at timestamp
-            if updated_at:
-                if isinstance(updated_at, str):
-                    # Already a string, keep as is
-                    pass
-                elif isinstance(updated_at, datetime):
-                    # If datetime is not timezone-aware, make it timezone-aware
-                    if updated_at.tzinfo is None:
-                        updated_at = pytz.timezone("Asia/Kolkata").localize(updated_at)
-                    # Convert to ISO format with timezone info
-                    notification["updated_at"] = format_timestamp_iso(updated_at)
-            else:
-                # Set updated_at to created_at if not present
-                notification["updated_at"] = notification["created_at"]
-            
-        return notifications
+        return get_notifications_page(userid, notification_type, priority, is_read, limit)["notifications"]
     except Exception as e:
         print(f"Error getting notifications: {e}")
         return []
@@ -4024,16 +4681,25 @@ def get_notifications(userid, notification_type=None, priority=None, is_read=Non
 def mark_notification_read(notification_id, is_read=True):
     """Mark a notification as read/unread"""
     try:
-        result = Notifications.update_one(
-            {"_id": ObjectId(notification_id)},
-            {
-                "$set": {
-                    "is_read": is_read,
-                    "updated_at": datetime.now(pytz.timezone("Asia/Kolkata"))
-                }
+        update = {
+            "$set": {
+                "is_read": is_read,
+                "updated_at": datetime.now(pytz.timezone("Asia/Kolkata"))
             }
+        }
+        if is_read:
+            update["$set"]["expires_at"] = _read_expiry()
+        else:
+            update["$unset"] = {"expires_at": ""}
+        previous = Notifications.find_one_and_update(
+            {"_id": ObjectId(notification_id), "is_read": {"$ne": is_read}},
+            update,
+            projection={"userid": 1}
         )
-        return result.modified_count > 0
+        if previous is None:
+            return False
+        _adjust_unread_counter(previous.get("userid"), -1 if is_read else 1)
+        return True
     except Exception as e:
         print(f"Error marking notification: {e}")
         return False
@@ -4046,10 +4712,12 @@ def mark_all_notifications_read(userid):
             {
                 "$set": {
                     "is_read": True,
-                    "updated_at": datetime.now(pytz.timezone("Asia/Kolkata"))
+                    "updated_at": datetime.now(pytz.timezone("Asia/Kolkata")),
+                    "expires_at": _read_expiry()
                 }
             }
         )
+        _adjust_unread_counter(userid, -result.modified_count)
         return result.modified_count
     except Exception as e:
         print(f"Error marking all notifications read: {e}")
@@ -4058,8 +4726,7 @@ def mark_all_notifications_read(userid):
 def get_unread_notification_count(userid):
     """Get count of unread notifications for a user"""
     try:
-        count = Notifications.count_documents({"userid": userid, "is_read": False})
-        return count
+        return get_unread_notification_counts([userid]).get(userid, 0)
     except Exception as e:
         print(f"Error getting unread count: {e}")
         return 0
@@ -4067,30 +4734,23 @@ def get_unread_notification_count(userid):
 def delete_notification(notification_id):
     """Delete a notification"""
     try:
-        result = Notifications.delete_one({"_id": ObjectId(notification_id)})
-        return result.deleted_count > 0
+        deleted = Notifications.find_one_and_delete(
+            {"_id": ObjectId(notification_id)},
+            projection={"userid": 1, "is_read": 1}
+        )
+        if deleted is None:
+            return False
+        if not deleted.get("is_read"):
+            _adjust_unread_counter(deleted.get("userid"), -1)
+        return True
     except Exception as e:
         print(f"Error deleting notification: {e}")
         return False
 
-def get_notifications_by_type(userid, notification_type):
-    """Get notifications by type for a user"""
+def get_notifications_by_type(userid, notification_type, limit=50, cursor=None):
+    """Get notifications by type for a user (one page)"""
     try:
-        notifications = list(Notifications.find(
-            {"userid": userid, "type": notification_type}
-        ).sort("created_at", -1))
-        
-        for notification in notifications:
-            notification["_id"] = str(notification["_id"])
-            # Ensure timezone-aware timestamps are properly formatted
-            created_at = notification["created_at"]
-            updated_at = notification["updated_at"]
-            
-            # Convert to ISO format with timezone info
-            notification["created_at"] = format_timestamp_iso(created_at)
-            notification["updated_at"] = format_timestamp_iso(updated_at)
-            
-        return notifications
+        return get_notifications_page(userid, notification_type, limit=limit, cursor=cursor)["notifications"]
     except Exception as e:
         print(f"Error getting notifications by type: {e}")
         return []
@@ -4130,22 +4790,9 @@ async def create_task_assignment_notification(userid, task_title, assigner_name,
         if due_date:
             message += f". Due date: {due_date}"
         
-        # Check for duplicate notifications (same user, task, and assigner within last minute)
-        one_minute_ago = datetime.now(pytz.timezone("Asia/Kolkata")) - timedelta(minutes=1)
-        existing_notification = Notifications.find_one({
-            "userid": userid,
-            "title": title,
-            "metadata.task_title": task_title,
-            "metadata.assigner_name": assigner_name,
-            "created_at": {"$gte": one_minute_ago}
-        })
-        
-        if existing_notification:
-            print(f"⚠️ Duplicate notification detected for user {userid}, task '{task_title}'. Skipping.")
-            return str(existing_notification["_id"])
-        
-        # Create notification in database
-        notification_id = create_notification(
+        # Create notification in database (once per user, task and assigner per minute)
+        notification_id, created = upsert_notification(
+            dedup_key=notification_dedup_key("task_assigned", userid, task_id or task_title, assigner_name, window_seconds=60),
             userid=userid,
             title=title,
             message=message,
@@ -4161,7 +4808,7 @@ async def create_task_assignment_notification(userid, task_title, assigner_name,
             }
         )
         
-        if notification_id:
+        if created:
             # Send real-time WebSocket notification
             from websocket_manager import notification_manager
             
@@ -4531,327 +5178,6 @@ async def notify_manager_leave_request(employee_name, employee_id, leave_type, l
         }
     )
 
-# Task Management and Deadline Notification System
-async def check_and_notify_overdue_tasks():
-    """Check for overdue tasks and notify users and managers"""
-    try:
-        current_time = datetime.now(pytz.timezone("Asia/Kolkata"))
-        current_date = current_time.strftime("%d-%m-%Y")
-        
-        print(f"🔍 Checking for overdue tasks at {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Find all incomplete tasks
-        incomplete_tasks = list(Tasks.find({"status": {"$ne": "Completed"}}))
-        overdue_tasks = []
-        
-        for task in incomplete_tasks:
-            due_date_str = task.get("due_date")
-            if due_date_str:
-                try:
-                    # Parse due date (format: DD-MM-YYYY)
-                    due_date = datetime.strptime(due_date_str, "%d-%m-%Y")
-                    current_date_obj = datetime.strptime(current_date, "%d-%m-%Y")
-                    
-                    if due_date < current_date_obj:
-                        overdue_tasks.append(task)
-                except ValueError:
-                    print(f"⚠️ Invalid date format for task {task.get('_id')}: {due_date_str}")
-        
-        print(f"📋 Found {len(overdue_tasks)} overdue tasks")
-        
-        # Process overdue tasks
-        for task in overdue_tasks:
-            await handle_overdue_task(task)
-        
-        return len(overdue_tasks)
-    except Exception as e:
-        print(f"Error checking overdue tasks: {e}")
-        return 0
-
-async def handle_overdue_task(task):
-    """Handle a single overdue task - notify user and manager"""
-    try:
-        task_id = str(task.get("_id"))
-        userid = task.get("userid")
-        task_title = task.get("task")
-        due_date = task.get("due_date")
-        tl_name = task.get("TL")
-        
-        # Get user information
-        user = Users.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
-        user_name = user.get("name", "User") if user else "User"
-        
-        # Check if we already notified about this overdue task today
-        today = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-        existing_notification = Notifications.find_one({
-            "userid": userid,
-            "type": "task_overdue",
-            "related_id": task_id,
-            "metadata.notification_date": today
-        })
-        
-        if existing_notification:
-            print(f"⏭️ Already notified user {userid} about overdue task {task_id} today")
-        else:
-            # Notify user about overdue task
-            await create_overdue_task_notification(userid, task_title, due_date, task_id)
-        
-        # Notify manager/TL about overdue task
-        await notify_manager_about_overdue_task(userid, user_name, task_title, due_date, tl_name, task_id)
-        
-    except Exception as e:
-        print(f"Error handling overdue task: {e}")
-
-async def create_overdue_task_notification(userid, task_title, due_date, task_id):
-    """Create notification for user about overdue task"""
-    try:
-        user = Users.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
-        user_name = user.get("name", "User") if user else "User"
-        
-        title = "Task Overdue"
-        message = f"Hi {user_name}, your task '{task_title}' was due on {due_date} and is now overdue. Please complete it as soon as possible."
-        
-        notification_id = create_notification(
-            userid=userid,
-            title=title,
-            message=message,
-            notification_type="task_overdue",
-            priority="high",
-            action_url="/user/todo",
-            related_id=task_id,
-            metadata={
-                "task_title": task_title,
-                "due_date": due_date,
-                "notification_date": datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-            }
-        )
-        
-        if notification_id:
-            # Send real-time WebSocket notification
-            from websocket_manager import notification_manager
-            
-            notification_data = {
-                "_id": notification_id,
-                "userid": userid,
-                "title": title,
-                "message": message,
-                "type": "task_overdue",
-                "priority": "high",
-                "action_url": "/user/todo",
-                "related_id": task_id,
-                "is_read": False,
-                "created_at": get_current_timestamp_iso()
-            }
-            
-            await notification_manager.send_personal_notification(userid, notification_data)
-            
-            # Update unread count
-            unread_count = get_unread_notification_count(userid)
-            await notification_manager.send_unread_count_update(userid, unread_count)
-            
-            print(f"🚨 Overdue task notification sent to {user_name} for task: {task_title}")
-        
-        return notification_id
-    except Exception as e:
-        print(f"Error creating overdue task notification: {e}")
-        return None
-
-async def notify_manager_about_overdue_task(userid, user_name, task_title, due_date, tl_name, task_id):
-    """Notify manager/TL about employee's overdue task"""
-    try:
-        # Find manager/TL by name first, then by position
-        manager = None
-        if tl_name:
-            manager = Users.find_one({"name": tl_name})
-        
-        # If no specific TL found, notify all managers
-        if not manager:
-            managers = list(Users.find({"position": "Manager"}))
-        else:
-            managers = [manager]
-        
-        for manager in managers:
-            manager_id = str(manager["_id"])
-            manager_name = manager.get("name", "Manager")
-            
-            # Check if already notified this manager today
-            today = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-            existing_notification = Notifications.find_one({
-                "userid": manager_id,
-                "type": "employee_task_overdue",
-                "related_id": task_id,
-                "metadata.notification_date": today
-            })
-            
-            if existing_notification:
-                continue
-            
-            title = "Employee Task Overdue"
-            message = f"Hi {manager_name}, {user_name}'s task '{task_title}' was due on {due_date} and is now overdue."
-            
-            notification_id = create_notification(
-                userid=manager_id,
-                title=title,
-                message=message,
-                notification_type="employee_task_overdue",
-                priority="high",
-                action_url="/Manager/tasks",
-                related_id=task_id,
-                metadata={
-                    "employee_name": user_name,
-                    "employee_id": userid,
-                    "task_title": task_title,
-                    "due_date": due_date,
-                    "notification_date": today
-                }
-            )
-            
-            if notification_id:
-                # Send real-time WebSocket notification
-                from websocket_manager import notification_manager
-                
-                notification_data = {
-                    "_id": notification_id,
-                    "userid": manager_id,
-                    "title": title,
-                    "message": message,
-                    "type": "employee_task_overdue",
-                    "priority": "high",
-                    "action_url": "/Manager/tasks",
-                    "related_id": task_id,
-                    "is_read": False,
-                    "created_at": get_current_timestamp_iso()
-                }
-                
-                await notification_manager.send_personal_notification(manager_id, notification_data)
-                
-                print(f"📢 Manager {manager_name} notified about {user_name}'s overdue task: {task_title}")
-        
-    except Exception as e:
-        print(f"Error notifying manager about overdue task: {e}")
-
-async def check_upcoming_deadlines_enhanced():
-    """Enhanced deadline checking with multiple reminder periods"""
-    try:
-        current_time = datetime.now(pytz.timezone("Asia/Kolkata"))
-        reminder_periods = [0, 1, 3, 7]  # Days before due date to send reminders
-        
-        total_notifications = 0
-        
-        for days_ahead in reminder_periods:
-            target_date = (current_time + timedelta(days=days_ahead)).strftime("%d-%m-%Y")
-            
-            # Find tasks due on the target date that are not completed
-            upcoming_tasks = list(Tasks.find({
-                "due_date": target_date,
-                "status": {"$ne": "Completed"}
-            }))
-            
-            print(f"📅 Found {len(upcoming_tasks)} tasks due in {days_ahead} days ({target_date})")
-            
-            for task in upcoming_tasks:
-                await create_task_due_soon_notification(
-                    userid=task.get("userid"),
-                    task_title=task.get("task"),
-                    task_id=str(task.get("_id")),
-                    days_remaining=days_ahead
-                )
-                total_notifications += 1
-        
-        return total_notifications
-    except Exception as e:
-        print(f"Error checking enhanced upcoming deadlines: {e}")
-        return 0
-
-async def check_upcoming_deadlines():
-    """Check for tasks due soon and notify users"""
-    try:
-        current_time = datetime.now(pytz.timezone("Asia/Kolkata"))
-        tomorrow = (current_time + timedelta(days=1)).strftime("%d-%m-%Y")
-        
-        # Find tasks due tomorrow that are not completed
-        upcoming_tasks = list(Tasks.find({
-            "due_date": tomorrow,
-            "status": {"$ne": "Completed"}
-        }))
-        
-        print(f"📅 Found {len(upcoming_tasks)} tasks due tomorrow")
-        
-        for task in upcoming_tasks:
-            await create_deadline_reminder_notification(task)
-        
-        return len(upcoming_tasks)
-    except Exception as e:
-        print(f"Error checking upcoming deadlines: {e}")
-        return 0
-
-async def create_deadline_reminder_notification(task):
-    """Create reminder notification for tasks due soon"""
-    try:
-        userid = task.get("userid")
-        task_title = task.get("task")
-        due_date = task.get("due_date")
-        task_id = str(task.get("_id"))
-        
-        # Check if already reminded today
-        today = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-        existing_notification = Notifications.find_one({
-            "userid": userid,
-            "type": "task_deadline_reminder",
-            "related_id": task_id,
-            "metadata.reminder_date": today
-        })
-        
-        if existing_notification:
-            return
-        
-        user = Users.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
-        user_name = user.get("name", "User") if user else "User"
-        
-        title = "Task Deadline Reminder"
-        message = f"Hi {user_name}, reminder: your task '{task_title}' is due tomorrow ({due_date}). Please ensure timely completion."
-        
-        notification_id = create_notification(
-            userid=userid,
-            title=title,
-            message=message,
-            notification_type="task_deadline_reminder",
-            priority="medium",
-            action_url="/user/todo",
-            related_id=task_id,
-            metadata={
-                "task_title": task_title,
-                "due_date": due_date,
-                "reminder_date": today
-            }
-        )
-        
-        if notification_id:
-            # Send real-time WebSocket notification
-            from websocket_manager import notification_manager
-            
-            notification_data = {
-                "_id": notification_id,
-                "userid": userid,
-                "title": title,
-                "message": message,
-                "type": "task_deadline_reminder",
-                "priority": "medium",
-                "action_url": "/user/todo",
-                "related_id": task_id,
-                "is_read": False,
-                "created_at": get_current_timestamp_iso()
-            }
-            
-            await notification_manager.send_personal_notification(userid, notification_data)
-            
-            print(f"⏰ Deadline reminder sent to {user_name} for task: {task_title}")
-        
-        return notification_id
-    except Exception as e:
-        print(f"Error creating deadline reminder: {e}")
-        return None
-
 # Enhanced Task Notification Functions
 async def create_task_created_notification(userid, task_title, creator_name, task_id=None, due_date=None, priority="medium"):
     """Create notification when a new task is created by user themselves"""
@@ -5056,20 +5382,11 @@ async def create_task_due_soon_notification(userid, task_title, task_id, days_re
             title = f"Task Due in {days_remaining} Days"
             message = f"Hi {user_name}, reminder: your task '{task_title}' is due in {days_remaining} days."
         
-        # Check if already reminded today for this specific timeframe
+        # Remind at most once per day for this specific timeframe
         today = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-        existing_notification = Notifications.find_one({
-            "userid": userid,
-            "type": "task_due_soon",
-            "related_id": task_id,
-            "metadata.days_remaining": days_remaining,
-            "metadata.reminder_date": today
-        })
-        
-        if existing_notification:
-            return str(existing_notification["_id"])
         
-        notification_id = create_notification(
+        notification_id, created = upsert_notification(
+            dedup_key=notification_dedup_key("task_due_soon", userid, task_id, days_remaining, today),
             userid=userid,
             title=title,
             message=message,
@@ -5084,7 +5401,7 @@ async def create_task_due_soon_notification(userid, task_title, task_id, days_re
             }
         )
         
-        if notification_id:
+        if created:
             from websocket_manager import notification_manager
             
             notification_data = {
@@ -5175,56 +5492,13 @@ async def notify_task_completion(userid, task_title, task_id, tl_name):
 
 # Scheduler setup for automatic task checking
 def setup_task_scheduler():
-    """Setup background scheduler for task deadline checking"""
-    try:
-        scheduler = BackgroundScheduler()
-        
-        # Check for overdue tasks every day at 9 AM
-        scheduler.add_job(
-            func=lambda: asyncio.create_task(check_and_notify_overdue_tasks()),
-            trigger="cron",
-            hour=9,
-            minute=0,
-            id="check_overdue_tasks",
-            replace_existing=True
-        )
-        
-        # Enhanced deadline checking (multiple reminder periods) every day at 6 PM
-        scheduler.add_job(
-            func=lambda: asyncio.create_task(check_upcoming_deadlines_enhanced()),
-            trigger="cron",
-            hour=18,
-            minute=0,
-            id="check_upcoming_deadlines_enhanced", 
-            replace_existing=True
-        )
-        
-        # Also check every 4 hours during work hours for overdue tasks
-        scheduler.add_job(
-            func=lambda: asyncio.create_task(check_and_notify_overdue_tasks()),
-            trigger="cron",
-            hour="9,13,17",
-            minute=0,
-            id="check_overdue_tasks_frequent",
-            replace_existing=True
-        )
-        
-        # Morning reminder check (8 AM) for tasks due today
-        scheduler.add_job(
-            func=lambda: asyncio.create_task(check_upcoming_deadlines_enhanced()),
-            trigger="cron",
-            hour=8,
-            minute=0,
-            id="morning_deadline_check",
-            replace_existing=True
-        )
-        
-        scheduler.start()
-        print("✅ Enhanced task deadline scheduler started successfully")
-        return scheduler
-    except Exception as e:
-        print(f"Error setting up task scheduler: {e}")
-        return None
+    """
+    Task deadline jobs are registered on the shared job scheduler in
+    Server.py (job_scheduler.py); this no longer starts a scheduler of its
+    own, which used to run the overdue/deadline checks a second time.
+    """
+    from job_scheduler import scheduler
+    return scheduler
 
 # Import asyncio for scheduler
 import asyncio
@@ -5406,36 +5680,30 @@ async def notify_hr_pending_leaves():
             print("No HR users found for notification")
             return {"message": "No HR users found"}
         
-        notification_count = 0
+        entries = []
         for leave in pending_leaves:
-            employee_name = leave.get("employeeName", "Unknown Employee")
-            leave_type = leave.get("leaveType", "Leave")
             leave_date = leave.get("selectedDate")
-            leave_date_str = leave_date.strftime("%d-%m-%Y") if leave_date else "Unknown Date"
-            leave_id = str(leave.get("_id"))
-            
-            for hr_id in hr_ids:
-                try:
-                    await create_notification_with_websocket(
-                        userid=hr_id,
-                        title="Pending Leave Review Required",
-                        message=f"{employee_name}'s {leave_type} request for {leave_date_str} is waiting for your review",
-                        notification_type="leave_hr_pending",
-                        priority="high",
-                        action_url=None,  # Will be determined by role-based system
-                        related_id=leave_id,
-                        metadata={
-                            "action": "hr_approval_needed",
-                            "employee_name": employee_name,
-                            "employee_id": leave.get("userid"),
-                            "leave_type": leave_type,
-                            "leave_date": leave_date_str,
-                            "status": "pending_hr_approval"
-                        }
-                    )
-                    notification_count += 1
-                except Exception as e:
-                    print(f"Error sending notification to HR {hr_id}: {e}")
+            item = {
+                "leave_id": str(leave.get("_id")),
+                "employee_name": leave.get("employeeName", "Unknown Employee"),
+                "employee_id": leave.get("userid"),
+                "leave_type": leave.get("leaveType", "Leave"),
+                "leave_date": leave_date.strftime("%d-%m-%Y") if leave_date else "Unknown Date"
+            }
+            entries.extend((hr_id, item) for hr_id in hr_ids)
+        
+        digests = build_digests(
+            entries,
+            "leave_hr_pending",
+            title_fn=lambda items: "Pending Leave Review Required" if len(items) == 1 else f"{len(items)} Leave Requests Awaiting Review",
+            message_fn=lambda items: (
+                f"{items[0]['employee_name']}'s {items[0]['leave_type']} request for {items[0]['leave_date']} is waiting for your review"
+                if len(items) == 1 else
+                f"{len(items)} leave requests are waiting for your review: " + ", ".join(i["employee_name"] for i in items[:5]) + ("..." if len(items) > 5 else "")
+            ),
+            priority="high"
+        )
+        notification_count = (await send_digest_notifications(digests))["digests"]
         
         print(f"✅ Sent {notification_count} HR notifications for pending leaves")
         return {"message": f"Sent {notification_count} notifications to HR", "pending_leaves": len(pending_leaves)}
@@ -5613,38 +5881,35 @@ async def notify_admin_pending_wfh():
             print("No admin users found for notification")
             return {"message": "No admin users found"}
         
-        notification_count = 0
+        entries = []
         for wfh in pending_wfh:
-            manager_name = wfh.get("employeeName", "Unknown Manager")
             from_date = wfh.get("fromDate")
             to_date = wfh.get("toDate")
             from_date_str = from_date.strftime("%d-%m-%Y") if from_date else "Unknown Date"
             to_date_str = to_date.strftime("%d-%m-%Y") if to_date else "Unknown Date"
-            date_range = f"from {from_date_str} to {to_date_str}" if from_date_str != to_date_str else f"for {from_date_str}"
-            wfh_id = str(wfh.get("_id"))
-            manager_id = wfh.get("userid")
-            
-            for admin_id in admin_ids:
-                try:
-                    await create_notification_with_websocket(
-                        userid=admin_id,
-                        title="Manager WFH Request Pending Approval",
-                        message=f"Manager {manager_name}'s work from home request {date_range} is waiting for your approval",
-                        notification_type="wfh_admin_pending",
-                        priority="high",
-                        action_url="/Admin/wfh_approval",
-                        related_id=wfh_id,
-                        metadata={
-                            "action": "admin_approval_needed",
-                            "manager_name": manager_name,
-                            "manager_id": manager_id,
-                            "request_date_from": from_date_str,
-                            "request_date_to": to_date_str
-                        }
-                    )
-                    notification_count += 1
-                except Exception as e:
-                    print(f"❌ Error sending notification to admin {admin_id}: {e}")
+            item = {
+                "wfh_id": str(wfh.get("_id")),
+                "manager_name": wfh.get("employeeName", "Unknown Manager"),
+                "manager_id": wfh.get("userid"),
+                "request_date_from": from_date_str,
+                "request_date_to": to_date_str,
+                "date_range": f"from {from_date_str} to {to_date_str}" if from_date_str != to_date_str else f"for {from_date_str}"
+            }
+            entries.extend((admin_id, item) for admin_id in admin_ids)
+        
+        digests = build_digests(
+            entries,
+            "wfh_admin_pending",
+            title_fn=lambda items: "Manager WFH Request Pending Approval" if len(items) == 1 else f"{len(items)} Manager WFH Requests Pending Approval",
+            message_fn=lambda items: (
+                f"Manager {items[0]['manager_name']}'s work from home request {items[0]['date_range']} is waiting for your approval"
+                if len(items) == 1 else
+                f"{len(items)} manager work from home requests are waiting for your approval: " + ", ".join(i["manager_name"] for i in items[:5]) + ("..." if len(items) > 5 else "")
+            ),
+            priority="high",
+            action_url="/Admin/wfh_approval"
+        )
+        notification_count = (await send_digest_notifications(digests))["digests"]
         
         print(f"✅ Sent {notification_count} admin notifications for pending manager WFH requests")
         return {"message": f"Sent {notification_count} notifications", "pending_count": len(pending_wfh)}
@@ -5671,6 +5936,8 @@ def insert_holidays(year: int, holidays: list):
         {"$set": {"year": year, "holidays": holidays}},
         upsert=True
     )
+    # Holidays changed, so the cached working-day calendar is stale
+    invalidate_working_day_calendar(year)
     return {"message": f"Holidays updated for {year}"}
 
 def get_holidays(year: int):
@@ -5697,136 +5964,359 @@ def calculate_working_days(year: int, holidays: list):
     
     return working_days
 
+# Working-day calendar
+# Per year we keep a prefix-sum array over day-of-year: prefix[i] is the
+# number of working days among the first i days of the year, so the count
+# between any two dates is prefix[b] - prefix[a].  Calendars of years with
+# holidays defined are stored in the WorkingDays collection; other years are
+# computed on demand and never written.  Both are cached in-process for
+# WORKING_DAY_CALENDAR_TTL seconds (other workers pick up holiday edits
+# after at most that long).  Years outside WORKING_DAY_MIN_YEAR..MAX_YEAR
+# get an empty calendar (zero working days) and are never built.
+WORKING_DAY_CALENDAR_TTL = int(os.environ.get("WORKING_DAY_CALENDAR_TTL", "300"))
+WORKING_DAY_MIN_YEAR = 1900
+WORKING_DAY_MAX_YEAR = 2100
+_working_day_calendars = TTLCache(WORKING_DAY_CALENDAR_TTL, max_size=WORKING_DAY_MAX_YEAR - WORKING_DAY_MIN_YEAR + 1)
+
+def _build_working_day_calendar(year: int):
+    """Compute the working-day calendar for a year, persisting it once holidays exist"""
+    holiday_doc = get_holidays(year)
+    holidays = holiday_doc["holidays"] if holiday_doc else []
+    working_days = calculate_working_days(year, holidays)
+    
+    working_set = set(working_days)
+    start = date(year, 1, 1)
+    days_in_year = (date(year, 12, 31) - start).days + 1
+    prefix = [0] * (days_in_year + 1)
+    for i in range(days_in_year):
+        is_working = (start + timedelta(days=i)).strftime("%Y-%m-%d") in working_set
+        prefix[i + 1] = prefix[i] + (1 if is_working else 0)
+    
+    calendar = {
+        "year": year,
+        "holidays_defined": holiday_doc is not None,
+        "holidays": holidays,
+        "working_days": working_days,
+        "total_working_days": len(working_days),
+        "prefix": prefix,
+        "updated_at": datetime.now()
+    }
+    if holiday_doc is not None:
+        WorkingDays.update_one({"year": year}, {"$set": calendar}, upsert=True)
+    return calendar
+
+def _empty_working_day_calendar(year: int):
+    """Calendar for a year outside the supported range: no holidays, no working days"""
+    return {
+        "year": year,
+        "holidays_defined": False,
+        "holidays": [],
+        "working_days": [],
+        "total_working_days": 0,
+        "prefix": None,
+    }
+
+def get_working_day_calendar(year: int):
+    """Return the (cached) working-day calendar for a year"""
+    if not WORKING_DAY_MIN_YEAR <= year <= WORKING_DAY_MAX_YEAR:
+        # Legacy or mistyped years count as having no working days
+        return _empty_working_day_calendar(year)
+    
+    calendar = _working_day_calendars.get(year)
+    if calendar is not None:
+        return calendar
+    
+    calendar = WorkingDays.find_one({"year": year, "prefix": {"$exists": True}}, {"_id": 0})
+    if not calendar:
+        calendar = _build_working_day_calendar(year)
+    
+    _working_day_calendars.set(year, calendar)
+    return calendar
+
+def invalidate_working_day_calendar(year: int):
+    """Drop and rebuild the calendar for a year (called when holidays change)"""
+    _working_day_calendars.invalidate(year)
+    WorkingDays.delete_one({"year": year})
+    return get_working_day_calendar(year)
+
+def count_working_days_between(start_date: date, end_date: date):
+    """Working days in [start_date, end_date], O(1) per calendar year"""
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    if end_date < start_date:
+        return 0
+    
+    total = 0
+    for year in range(start_date.year, end_date.year + 1):
+        prefix = get_working_day_calendar(year)["prefix"]
+        if not prefix:
+            continue
+        first = start_date if start_date.year == year else date(year, 1, 1)
+        last = end_date if end_date.year == year else date(year, 12, 31)
+        total += prefix[last.timetuple().tm_yday] - prefix[first.timetuple().tm_yday - 1]
+    return total
+
 def get_working_days_count_till_date(year: int, till_date: date = None):
     """Get working days count from start of year till specified date (or today)"""
     if till_date is None:
         till_date = date.today()
     
-    holiday_doc = get_holidays(year)
-    if not holiday_doc:
+    calendar = get_working_day_calendar(year)
+    if not calendar["holidays_defined"]:
         return 0
     
-    holidays = holiday_doc["holidays"]
-    holiday_dates = {h["date"] for h in holidays}
-    
-    start = datetime(year, 1, 1).date()
-    end = min(till_date, datetime(year, 12, 31).date())
-    
-    working_days_count = 0
-    current = start
-    
-    while current <= end:
-        is_sunday = current.weekday() == 6
-        is_holiday = current.strftime("%Y-%m-%d") in holiday_dates
-        if not is_sunday and not is_holiday:
-            working_days_count += 1
-        current += timedelta(days=1)
+    start = date(year, 1, 1)
+    end = min(till_date, date(year, 12, 31))
+    if end < start:
+        return 0
     
-    return working_days_count
+    return calendar["prefix"][end.timetuple().tm_yday]
 
 # New Attendance Calculation Functions
-
-def calculate_user_attendance_stats(userid: str, year: int = None):
-    """Calculate attendance statistics for a specific user"""
-    if year is None:
-        year = date.today().year
-    
-    # Get user info to get username
-    try:
-        user = Users.find_one({"_id": ObjectId(userid)}, {"name": 1})
-        username = user.get("name", "Unknown") if user else "Unknown"
-    except Exception as e:
-        print(f"Error fetching user info for {userid}: {e}")
-        username = "Unknown"
-    
-    # Get total working days till today
-    total_working_days = get_working_days_count_till_date(year)
-    
-    if total_working_days == 0:
-        return {
-            "userid": userid,
-            "username": username,
-            "year": year,
-            "total_working_days": 0,
-            "present_days": 0,
-            "attendance_percentage": 0,
-            "leave_days_taken": 0,
-            "leave_percentage": 0,
-            "last_updated": datetime.now()
-        }
-    
-    # Count present days (where status is "Present" or "Late")
-    start_date = f"{year}-01-01"
-    end_date = f"{year}-12-31"
-    
+#
+# AttendanceStats keeps one counters document per (userid, year):
+#   present_days      - Clock records with status Present/Late
+#   leave_days_taken  - approved leave days (see _leave_day_weight)
+# The counters are updated incrementally by Clockin and by leave status
+# changes (record_attendance_event).  A document is only trusted once
+# "counters_initialized" is set, either by a single-user recount or by the
+# aggregation-based rebuild_attendance_stats().
+
+def _leave_day_weight(leave):
+    """Number of leave days an approved leave contributes to the stats"""
+    days = 1
+    if leave.get("leaveType") == "Other Leave" and leave.get("ToDate") and leave.get("selectedDate"):
+        # Weekdays (excluding Sundays) between from_date and to_date
+        days += count_weekdays(leave["selectedDate"], leave["ToDate"])
+    return days
+
+def _recount_user_attendance(userid: str, year: int, username: str = None):
+    """Full recount of one user's counters (used to seed missing documents)"""
     present_days = Clock.count_documents({
         "userid": userid,
         "date": {
-            "$gte": start_date,
-            "$lte": end_date
+            "$gte": f"{year}-01-01",
+            "$lte": f"{year}-12-31"
         },
         "status": {"$in": ["Present", "Late"]}
     })
     
-    # Count leave days taken (approved leaves)
-    leave_days = Leave.count_documents({
+    leave_days = 0
+    for leave in Leave.find({
         "userid": userid,
         "status": "Approved",
         "selectedDate": {
             "$gte": datetime(year, 1, 1),
             "$lte": datetime(year, 12, 31)
         }
-    })
+    }, {"leaveType": 1, "selectedDate": 1, "ToDate": 1}):
+        leave_days += _leave_day_weight(leave)
+    
+    if username is None:
+        try:
+            user = Users.find_one({"_id": ObjectId(userid)}, {"name": 1})
+            username = user.get("name", "Unknown") if user else "Unknown"
+        except Exception as e:
+            print(f"Error fetching user info for {userid}: {e}")
+            username = "Unknown"
     
-    # Calculate multi-day leaves (LOP/Other Leave)
-    multi_day_leaves = Leave.find({
+    counters = {
         "userid": userid,
-        "status": "Approved",
-        "leaveType": "Other Leave",
-        "selectedDate": {
-            "$gte": datetime(year, 1, 1),
-            "$lte": datetime(year, 12, 31)
+        "username": username,
+        "year": year,
+        "present_days": present_days,
+        "leave_days_taken": leave_days,
+        "counters_initialized": True,
+        "last_updated": datetime.now()
+    }
+    AttendanceStats.update_one(
+        {"userid": userid, "year": year},
+        {"$set": counters},
+        upsert=True
+    )
+    return counters
+
+def record_attendance_event(userid: str, year: int, present_delta: int = 0, leave_delta: int = 0):
+    """Apply an attendance event (clock-in, leave approval/revocation) to the counters"""
+    if not userid or (present_delta == 0 and leave_delta == 0):
+        return
+    try:
+        result = AttendanceStats.update_one(
+            {"userid": userid, "year": year, "counters_initialized": True},
+            {
+                "$inc": {"present_days": present_delta, "leave_days_taken": leave_delta},
+                "$set": {"last_updated": datetime.now()}
+            }
+        )
+        if result.matched_count == 0:
+            # No trusted counters yet; the event is already in the source
+            # collections, so a recount includes it.
+            _recount_user_attendance(userid, year)
+    except Exception as e:
+        print(f"Error recording attendance event for {userid}: {e}")
+
+def _apply_leave_status_change(leave_request, new_status):
+    """Update leave counters when a leave moves into or out of Approved"""
+    if not leave_request or not leave_request.get("selectedDate"):
+        return
+    was_approved = leave_request.get("status") == "Approved"
+    is_approved = new_status == "Approved"
+    if was_approved == is_approved:
+        return
+    weight = _leave_day_weight(leave_request)
+    record_attendance_event(
+        leave_request.get("userid"),
+        leave_request["selectedDate"].year,
+        leave_delta=weight if is_approved else -weight
+    )
+
+def _format_attendance_stats(counters, userid: str, year: int, total_working_days: int):
+    """Build the stats dict returned by the attendance endpoints"""
+    if total_working_days == 0:
+        return {
+            "userid": userid,
+            "username": counters.get("username", "Unknown"),
+            "year": year,
+            "total_working_days": 0,
+            "present_days": 0,
+            "attendance_percentage": 0,
+            "leave_days_taken": 0,
+            "leave_percentage": 0,
+            "last_updated": counters.get("last_updated", datetime.now())
         }
-    })
-    
-    additional_leave_days = 0
-    for leave in multi_day_leaves:
-        if "ToDate" in leave:
-            from_date = leave["selectedDate"]
-            to_date = leave["ToDate"]
-            # Count weekdays between from_date and to_date
-            current = from_date
-            while current <= to_date:
-                if current.weekday() != 6:  # Not Sunday
-                    additional_leave_days += 1
-                current += timedelta(days=1)
     
-    total_leave_days = leave_days + additional_leave_days
+    present_days = counters.get("present_days", 0)
+    total_leave_days = counters.get("leave_days_taken", 0)
     
     # Calculate percentages
-    attendance_percentage = round((present_days / total_working_days) * 100, 2) if total_working_days > 0 else 0
-    leave_percentage = round((total_leave_days / total_working_days) * 100, 2) if total_working_days > 0 else 0
+    attendance_percentage = round((present_days / total_working_days) * 100, 2)
+    leave_percentage = round((total_leave_days / total_working_days) * 100, 2)
     
-    stats = {
+    return {
         "userid": userid,
-        "username": username,
+        "username": counters.get("username", "Unknown"),
         "year": year,
         "total_working_days": total_working_days,
         "present_days": present_days,
         "attendance_percentage": attendance_percentage,
         "leave_days_taken": total_leave_days,
         "leave_percentage": leave_percentage,
-        "last_updated": datetime.now()
+        "last_updated": counters.get("last_updated", datetime.now())
     }
+
+def calculate_user_attendance_stats(userid: str, year: int = None):
+    """Calculate attendance statistics for a specific user"""
+    if year is None:
+        year = date.today().year
     
-    # Cache the stats
-    AttendanceStats.update_one(
-        {"userid": userid, "year": year},
-        {"$set": stats},
-        upsert=True
-    )
+    counters = AttendanceStats.find_one({"userid": userid, "year": year, "counters_initialized": True})
+    if not counters:
+        counters = _recount_user_attendance(userid, year)
+    
+    # Get total working days till today
+    total_working_days = get_working_days_count_till_date(year)
+    
+    return _format_attendance_stats(counters, userid, year, total_working_days)
+
+def _aggregate_attendance_counters(year: int, userids: list = None):
+    """
+    Compute present/leave counters for many users with one aggregation over
+    Clock and one over Leave.  Returns {userid: {"present_days", "leave_days_taken"}}.
+    """
+    clock_match = {
+        "date": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"},
+        "status": {"$in": ["Present", "Late"]}
+    }
+    leave_match = {
+        "status": "Approved",
+        "selectedDate": {"$gte": datetime(year, 1, 1), "$lte": datetime(year, 12, 31)}
+    }
+    if userids is not None:
+        clock_match["userid"] = {"$in": userids}
+        leave_match["userid"] = {"$in": userids}
+    
+    counters = {}
+    for row in Clock.aggregate([
+        {"$match": clock_match},
+        {"$group": {"_id": "$userid", "present_days": {"$sum": 1}}}
+    ]):
+        counters.setdefault(row["_id"], {"present_days": 0, "leave_days_taken": 0})["present_days"] = row["present_days"]
+    
+    # Single-day leaves are counted in the database; only multi-day
+    # "Other Leave" ranges need their weekdays counted here.
+    for row in Leave.aggregate([
+        {"$match": leave_match},
+        {"$group": {
+            "_id": "$userid",
+            "leave_count": {"$sum": 1},
+            "ranges": {"$push": {
+                "$cond": [
+                    {"$eq": ["$leaveType", "Other Leave"]},
+                    {"from": "$selectedDate", "to": "$ToDate"},
+                    None
+                ]
+            }}
+        }}
+    ]):
+        extra_days = sum(
+            count_weekdays(r["from"], r["to"])
+            for r in row["ranges"] if r and r.get("from") and r.get("to")
+        )
+        entry = counters.setdefault(row["_id"], {"present_days": 0, "leave_days_taken": 0})
+        entry["leave_days_taken"] = row["leave_count"] + extra_days
+    
+    return counters
+
+def rebuild_attendance_stats(year: int = None):
+    """Recovery path: rebuild every active user's counters with bulk operations"""
+    if year is None:
+        year = date.today().year
+    
+    users = list(Users.find({"status": {"$ne": "Inactive"}}, {"_id": 1, "name": 1}))
+    counters = _aggregate_attendance_counters(year)
+    now = datetime.now()
     
-    return stats
+    operations = []
+    for user in users:
+        userid = str(user["_id"])
+        entry = counters.get(userid, {"present_days": 0, "leave_days_taken": 0})
+        operations.append(UpdateOne(
+            {"userid": userid, "year": year},
+            {"$set": {
+                "userid": userid,
+                "username": user.get("name", "Unknown"),
+                "year": year,
+                "present_days": entry["present_days"],
+                "leave_days_taken": entry["leave_days_taken"],
+                "counters_initialized": True,
+                "last_updated": now
+            }},
+            upsert=True
+        ))
+    
+    if operations:
+        AttendanceStats.bulk_write(operations, ordered=False)
+    return len(operations)
+
+def _population_attendance_stats(people: list, year: int, all_users: bool = False):
+    """
+    Stats for a list of Users documents, read-only: one aggregation over
+    Clock and one over Leave, joined in memory.  all_users skips the
+    userid filter when the list already covers (nearly) everyone.
+    """
+    userids = [str(person["_id"]) for person in people]
+    counters = _aggregate_attendance_counters(year, None if all_users else userids)
+    total_working_days = get_working_days_count_till_date(year)
+    now = datetime.now()
+    
+    results = []
+    for person, userid in zip(people, userids):
+        entry = counters.get(userid, {"present_days": 0, "leave_days_taken": 0})
+        entry = dict(entry, username=person.get("name", "Unknown"), last_updated=now)
+        results.append(_format_attendance_stats(entry, userid, year, total_working_days))
+    return results
 
 def get_user_attendance_dashboard(userid: str):
     """Get attendance dashboard for individual user"""
@@ -5862,9 +6352,7 @@ def get_team_attendance_stats(team_leader: str, year: int = None):
     team_stats = []
     total_attendance = 0
     
-    for member in team_members:
-        userid = str(member["_id"])
-        stats = calculate_user_attendance_stats(userid, year)
+    for member, stats in zip(team_members, _population_attendance_stats(team_members, year)):
         stats["user_info"] = {
             "name": member.get("name"),
             "email": member.get("email"),
@@ -5900,9 +6388,8 @@ def get_department_attendance_stats(department: str = None, year: int = None):
     total_attendance = 0
     department_stats = {}
     
-    for employee in employees:
-        userid = str(employee["_id"])
-        stats = calculate_user_attendance_stats(userid, year)
+    population_stats = _population_attendance_stats(employees, year, all_users=department is None)
+    for employee, stats in zip(employees, population_stats):
         stats["user_info"] = {
             "name": employee.get("name"),
             "email": employee.get("email"),
@@ -5976,23 +6463,18 @@ def get_manager_team_attendance(manager_userid: str, year: int = None):
 
 # Daily update function to recalculate stats
 def update_daily_attendance_stats():
-    """Run this daily to update attendance statistics for all users"""
+    """Run this daily to rebuild attendance statistics for all users"""
     current_year = date.today().year
     
-    # Get all active users
-    users = Users.find({"status": {"$ne": "Inactive"}}, {"_id": 1})
-    
-    updated_count = 0
-    for user in users:
-        userid = str(user["_id"])
-        try:
-            calculate_user_attendance_stats(userid, current_year)
-            updated_count += 1
-        except Exception as e:
-            print(f"Error updating stats for user {userid}: {e}")
+    try:
+        updated_count = rebuild_attendance_stats(current_year)
+    except Exception as e:
+        print(f"Error rebuilding attendance stats: {e}")
+        return 0
     
     print(f"Updated attendance stats for {updated_count} users")
     return updated_count
+
 def append_chat_message(chatId: str, message: dict):
     message_doc = message.copy()
     message_doc["chatId"] = chatId
@@ -6014,6 +6496,147 @@ def get_chat_history(chatId: str):
         })
     return messages
 
+# Chat history is loaded a page at a time.  `before` pages back through
+# older messages, `after` fetches only messages newer than the client's
+# last one; both are message timestamps as returned to the client.
+CHAT_HISTORY_PAGE_SIZE = 50
+
+def _message_timestamp(doc):
+    value = doc.get("timestamp")
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def get_chat_messages_page(collection, chatId, cursor=None, since=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """
+    One page of a conversation, keyset on (timestamp, _id) so messages
+    sharing a timestamp are never skipped.
+
+    Without arguments returns the latest `limit` messages; `cursor` pages
+    back through older ones and `since` returns only messages newer than
+    the message it points at.  Both are tokens returned by a previous page.
+    Returns (documents oldest first, has_more, next_cursor, since token).
+    Raises InvalidCursor for a malformed token.
+    """
+    if since:
+        docs, has_more = paginate_newer(collection, {"chatId": chatId}, limit, since, sort_field="timestamp")
+        next_cursor = None
+    else:
+        docs, next_cursor = paginate(collection, {"chatId": chatId}, limit, cursor, sort_field="timestamp")
+        docs.reverse()
+        has_more = next_cursor is not None
+    newest = cursor_for(docs[-1], "timestamp") if docs else since
+    return docs, has_more, next_cursor, newest
+
+# Root chat messages carry reply_count, last_reply_at and last_reply_from,
+# maintained when a reply is saved, so history pages need no thread queries.
+# rebuild_thread_reply_counters() recomputes them from threads.
+
+def _root_message_filter(root_id):
+    """Root messages are addressed by their client id, older ones by _id."""
+    if ObjectId.is_valid(root_id):
+        return {"$or": [{"id": root_id}, {"_id": ObjectId(root_id)}]}
+    return {"id": root_id}
+
+def save_thread_reply(reply):
+    """Store a thread reply and bump the counters on its root message."""
+    threads_collection.insert_one(reply.copy())
+    root_id = reply.get("rootId")
+    if root_id:
+        chats_collection.update_one(
+            _root_message_filter(str(root_id)),
+            {
+                "$inc": {"reply_count": 1},
+                "$set": {
+                    "last_reply_at": reply.get("timestamp"),
+                    "last_reply_from": reply.get("from_user"),
+                },
+            },
+        )
+    return reply
+
+def rebuild_thread_reply_counters(batch_size=500):
+    """Repair job: recompute every root message's reply counters from threads."""
+    pipeline = [
+        {"$sort": {"rootId": 1, "timestamp": 1}},
+        {"$group": {
+            "_id": "$rootId",
+            "count": {"$sum": 1},
+            "last_reply_at": {"$last": "$timestamp"},
+            "last_reply_from": {"$last": "$from_user"},
+        }},
+    ]
+    operations = []
+    updated = 0
+    for row in threads_collection.aggregate(pipeline, allowDiskUse=True):
+        if not row["_id"]:
+            continue
+        operations.append(UpdateOne(
+            _root_message_filter(str(row["_id"])),
+            {"$set": {
+                "reply_count": row["count"],
+                "last_reply_at": row["last_reply_at"],
+                "last_reply_from": row["last_reply_from"],
+            }},
+        ))
+        if len(operations) >= batch_size:
+            updated += chats_collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += chats_collection.bulk_write(operations, ordered=False).modified_count
+
+    print(f"Thread reply counters rebuilt: {updated} root messages updated")
+    return updated
+
+def get_direct_chat_history(chatId, cursor=None, since=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """A page of direct chat history with thread reply counters (see get_chat_messages_page)."""
+    docs, has_more, next_cursor, newest = get_chat_messages_page(chats_collection, chatId, cursor, since, limit)
+
+    messages = []
+    for doc in docs:
+        messages.append({
+            "id": str(doc.get("id") or doc.get("_id")),
+            "from_user": doc.get("from_user"),
+            "to_user": doc.get("to_user"),
+            "text": doc.get("text"),
+            "file": doc.get("file"),
+            "timestamp": _message_timestamp(doc),
+            "chatId": doc.get("chatId"),
+            "reply_count": doc.get("reply_count", 0),
+            "last_reply_at": doc.get("last_reply_at"),
+            "last_reply_from": doc.get("last_reply_from"),
+        })
+    return {
+        "chatId": chatId,
+        "messages": messages,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        # Pass back as `since` to fetch only newer messages
+        "since": newest,
+    }
+
+def _format_group_message(doc):
+    return {
+        "id": str(doc.get("_id")),
+        "from_user": doc.get("from_user"),
+        "text": doc.get("text"),
+        "file": doc.get("file"),
+        "timestamp": _message_timestamp(doc),
+        "chatId": doc.get("chatId"),
+    }
+
+def get_group_history(group_id, cursor=None, since=None, limit=CHAT_HISTORY_PAGE_SIZE):
+    """A page of group chat history (see get_chat_messages_page)."""
+    docs, has_more, next_cursor, newest = get_chat_messages_page(messages_collection, group_id, cursor, since, limit)
+
+    messages = [_format_group_message(doc) for doc in docs]
+    return {
+        "chatId": group_id,
+        "messages": messages,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+        # Pass back as `since` to fetch only newer messages
+        "since": newest,
+    }
+
 
     # Get allowed contacts for a given user
 def get_allowed_contacts(user_id: str):
@@ -6609,7 +7232,7 @@ async def create_deadline_approach_notification(userid, task_title, days_remaini
         print(f"Error creating deadline approach notification: {e}")
         return None
 
-async def create_overdue_task_notification(userid, task_title, days_overdue, task_id=None, priority="critical"):
+async def create_overdue_task_notification(userid, task_title, days_overdue, task_id=None, priority="critical", dedup_key=None):
     """Overdue tasks → Automatic overdue notifications"""
     try:
         user = Users.find_one({"_id": ObjectId(userid)}) if ObjectId.is_valid(userid) else None
@@ -6621,7 +7244,7 @@ async def create_overdue_task_notification(userid, task_title, days_overdue, tas
         else:
             message = f"Hi {user_name}, your task '{task_title}' is {days_overdue} days overdue. This requires immediate attention."
         
-        notification_id = create_notification(
+        notification_id, created = upsert_notification(
             userid=userid,
             title=title,
             message=message,
@@ -6633,8 +7256,11 @@ async def create_overdue_task_notification(userid, task_title, days_overdue, tas
                 "task_title": task_title,
                 "action": "Overdue",
                 "days_overdue": days_overdue
-            }
+            },
+            dedup_key=dedup_key
         )
+        if not created:
+            return notification_id
         
         # Send WebSocket notification
         from websocket_manager import notification_manager
@@ -6767,7 +7393,7 @@ async def notify_task_stakeholders(task_data, action, **kwargs):
 
 # ======================== CHAT NOTIFICATION FUNCTIONS ========================
 
-async def create_chat_message_notification(sender_id, receiver_id, sender_name, message_preview, chat_type="direct"):
+async def create_chat_message_notification(sender_id, receiver_id, sender_name, message_preview, chat_type="direct", chat_id=None):
     """
     Create notification when a new chat message is received
     
@@ -6777,8 +7403,15 @@ async def create_chat_message_notification(sender_id, receiver_id, sender_name,
         sender_name: Name of the sender
         message_preview: Preview of the message (first 50 chars)
         chat_type: Type of chat - 'direct' or 'group'
+        chat_id: Direct chat id (defaults to the sorted pair of user ids)
     """
     try:
+        # The receiver already sees the message in the open chat
+        conversation = direct_conversation(chat_id or direct_chat_id(sender_id, receiver_id))
+        if SKIP_PRESENT_USERS and presence.is_viewing(receiver_id, conversation):
+            metrics.chat_notifications_skipped_total.inc(chat_type=chat_type)
+            return None
+        
         print(f"💬 Creating chat notification from {sender_name} to user {receiver_id}")
         
         # Get receiver info
@@ -6796,21 +7429,10 @@ async def create_chat_message_notification(sender_id, receiver_id, sender_name,
         title = f"New Message from {sender_name}"
         message = f"Hi {receiver_name}, {sender_name} sent you a message"
         
-        # Check for duplicate notifications (same sender and receiver within last 30 seconds)
-        thirty_seconds_ago = datetime.now(pytz.timezone("Asia/Kolkata")) - timedelta(seconds=30)
-        existing_notification = Notifications.find_one({
-            "userid": receiver_id,
-            "type": "chat",
-            "metadata.sender_id": sender_id,
-            "created_at": {"$gte": thirty_seconds_ago.isoformat()}
-        })
-        
-        if existing_notification:
-            print(f"⚠️ Recent chat notification already exists. Skipping duplicate.")
-            return str(existing_notification["_id"])
-        
         # Create notification with WebSocket support
+        # (one per sender and receiver per 30 seconds)
         notification_id = await create_notification_with_websocket(
+            dedup_key=notification_dedup_key("chat", receiver_id, sender_id, window_seconds=30),
             userid=receiver_id,
             title=title,
             message=message,
@@ -6834,6 +7456,45 @@ async def create_chat_message_notification(sender_id, receiver_id, sender_name,
         traceback.print_exc()
         return None
 
+async def load_member_names(member_ids):
+    """get_user_names for async handlers: {member_id: name}, cache hits stay on the loop"""
+    from async_mongo import run_sync
+    
+    # Cache hits are answered on the loop; only misses go to the thread pool
+    names = {m: _user_name_cache.get(m) for m in member_ids}
+    missing = [m for m, name in names.items() if name is None]
+    if missing:
+        names.update(await run_sync(get_user_names, missing))
+    return {m: names[m] for m in member_ids if names.get(m) is not None}
+
+# Group metadata (name, members) for the group websocket hot path.  Each
+# worker caches its own copy; /update_group and /delete_group invalidate only
+# the worker that handled them, so other workers may use a stale member list
+# for up to GROUP_CACHE_TTL seconds.  Keep it short.
+GROUP_CACHE_TTL = int(os.environ.get("GROUP_CACHE_TTL", "30"))
+_group_cache = TTLCache(GROUP_CACHE_TTL)
+
+def invalidate_group(group_id=None):
+    _group_cache.invalidate(group_id)
+
+def get_group(group_id):
+    """Group name and members, through the group cache (None if it does not exist)"""
+    group = _group_cache.get(group_id)
+    if group is None:
+        group = groups_collection.find_one({"_id": group_id}, {"name": 1, "members": 1})
+        if group:
+            _group_cache.set(group_id, group)
+    return group
+
+async def load_group(group_id):
+    """get_group for async handlers: cache hits never leave the event loop"""
+    from async_mongo import run_sync
+    
+    group = _group_cache.get(group_id)
+    if group is None:
+        group = await run_sync(get_group, group_id)
+    return group
+
 async def create_group_chat_notification(sender_id, group_id, sender_name, group_name, message_preview, member_ids):
     """
     Create notifications for all group members when a new message is sent
@@ -6849,37 +7510,34 @@ async def create_group_chat_notification(sender_id, group_id, sender_name, group
     try:
         print(f"💬 Creating group chat notifications for group: {group_name}")
         
-        notifications_sent = []
-        
         # Truncate message preview
         if len(message_preview) > 50:
             message_preview = message_preview[:47] + "..."
         
-        for member_id in member_ids:
-            # Don't send notification to the sender
-            if member_id == sender_id:
-                continue
-            
-            # Get member info
-            member = Users.find_one({"_id": ObjectId(member_id)}) if ObjectId.is_valid(member_id) else Users.find_one({"userid": member_id})
-            if not member:
+        # Don't send notification to the sender or to members viewing the group
+        viewing = presence.viewers(group_conversation(group_id)) if SKIP_PRESENT_USERS else set()
+        recipients = [member_id for member_id in member_ids if member_id != sender_id and member_id not in viewing]
+        skipped = sum(1 for member_id in member_ids if member_id != sender_id and member_id in viewing)
+        if skipped:
+            metrics.chat_notifications_skipped_total.inc(skipped, chat_type="group")
+        
+        # Get member info for every recipient at once
+        member_names = await load_member_names(recipients)
+        
+        items = []
+        for member_id in recipients:
+            if member_id not in member_names:
                 continue
             
-            member_name = member.get("name", "User")
-            
-            title = f"New Message in {group_name}"
-            message = f"Hi {member_name}, {sender_name} posted in {group_name}: '{message_preview}'"
-            
-            # Create notification with WebSocket support
-            notification_id = await create_notification_with_websocket(
-                userid=member_id,
-                title=title,
-                message=message,
-                notification_type="chat",
-                priority="low",
-                action_url="/User/Chat",
-                related_id=group_id,
-                metadata={
+            items.append({
+                "userid": member_id,
+                "title": f"New Message in {group_name}",
+                "message": f"Hi {member_names[member_id]}, {sender_name} posted in {group_name}: '{message_preview}'",
+                "notification_type": "chat",
+                "priority": "low",
+                "action_url": "/User/Chat",
+                "related_id": group_id,
+                "metadata": {
                     "sender_id": sender_id,
                     "sender_name": sender_name,
                     "group_id": group_id,
@@ -6887,9 +7545,9 @@ async def create_group_chat_notification(sender_id, group_id, sender_name, group
                     "message_preview": message_preview,
                     "chat_type": "group"
                 }
-            )
-            
-            notifications_sent.append(notification_id)
+            })
+        
+        notifications_sent = await fan_out_notifications(items)
         
         print(f"✅ Group chat notifications sent to {len(notifications_sent)} members")
         return notifications_sent
@@ -6925,22 +7583,9 @@ async def create_document_assignment_notification(userid, doc_name, assigned_by_
         title = f"New Document Assigned"
         message = f"Hi {user_name}, '{doc_name}' has been assigned to you by Admin. Please review and upload the required documentation."
         
-        # Check for duplicate notifications
-        one_minute_ago = datetime.now(pytz.timezone("Asia/Kolkata")) - timedelta(minutes=1)
-        existing_notification = Notifications.find_one({
-            "userid": userid,
-            "type": "document",
-            "metadata.doc_name": doc_name,
-            "metadata.action": "assigned",
-            "created_at": {"$gte": one_minute_ago.isoformat()}
-        })
-        
-        if existing_notification:
-            print(f"⚠️ Duplicate document assignment notification detected. Skipping.")
-            return str(existing_notification["_id"])
-        
-        # Create notification with WebSocket support
+        # Create notification with WebSocket support (once per document per minute)
         notification_id = await create_notification_with_websocket(
+            dedup_key=notification_dedup_key("document_assigned", userid, doc_name, window_seconds=60),
             userid=userid,
             title=title,
             message=message,
@@ -11,6 +11,7 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Depends, FastAPI,Body
 from auth.auth_bearer import JWTBearer
+from auth.auth_handler import decodeJWT
 from http.client import HTTPException
 from datetime import datetime, timedelta, date
 from dateutil import parser
@@ -34,15 +35,10 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 # os.makedirs(UPLOAD_DIR, exist_ok=True)
 # GridFS setup
-from pymongo import MongoClient
 import gridfs
-mongo_url = os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
-client = MongoClient(
-    mongo_url,
-    serverSelectionTimeoutMS=30000,
-    connectTimeoutMS=30000,
-    socketTimeoutMS=30000
-) 
+from mongo_client import get_client, get_pool_stats
+# GridFS shares the process-wide client with Mongo.py
+client = get_client()
 db = client["RBG_AI"]  
 fs = gridfs.GridFS(db)
 
@@ -57,6 +53,8 @@ import shutil
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse
+from time import perf_counter
 import io
 import pytz
 from bson import Binary
@@ -84,6 +82,13 @@ from fastapi import (
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 from ws_manager import DirectChatManager, GeneralChatManager, NotifyManager,GroupChatManager
+from db_indexes import ensure_indexes_in_background, get_index_report
+import async_mongo
+import query_profiler
+import metrics
+from presence import presence, direct_conversation, direct_chat_id
+from pagination import InvalidCursor
+import notification_retention
 
 import Mongo
 from Mongo import (
@@ -260,6 +265,40 @@ async def add_security_headers(request: Request, call_next):
             status_code=500
         )
 
+# Per-request MongoDB query profile.  Wraps every route and the security
+# headers middleware; record_metrics, registered after it, is the outermost.
+@app.middleware("http")
+async def profile_queries(request: Request, call_next):
+    if not query_profiler.PROFILER_ENABLED:
+        return await call_next(request)
+    profile, token = query_profiler.start_profile(request.method, request.url.path)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        route = request.scope.get("route")
+        profile.route = getattr(route, "path", None)
+        server_timing = query_profiler.finish_profile(profile, token, status_code)
+    response.headers["Server-Timing"] = server_timing
+    return response
+
+# Request metrics per route template (outermost, so it times the whole request)
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    started = perf_counter()
+    status_code = 500
+    metrics.http_requests_in_progress.inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.http_requests_in_progress.dec()
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        metrics.http_request_duration_seconds.observe(perf_counter() - started, method=request.method, route=route)
+        metrics.http_requests_total.inc(method=request.method, route=route, status=status_code)
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: dict[str, WebSocket] = {}  # userid -> WebSocket
@@ -279,8 +318,11 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
-# Initialize APScheduler for background tasks
-scheduler = BackgroundScheduler()
+# Background jobs run on the shared job scheduler: one asyncio scheduler per
+# process on the app's event loop, with a MongoDB lease so each run happens
+# on exactly one worker. Async checks are registered directly.
+import job_scheduler
+from job_scheduler import register_job, scheduler
 
 # Import notification automation
 from notification_automation import (
@@ -293,122 +335,73 @@ from notification_automation import (
 
 # Schedule the auto-clockout task to run daily at 9:30 PM (21:30 IST)
 # This ensures employees who forget to clock out are automatically clocked out at end of day
-scheduler.add_job(auto_clockout, 'cron', hour=21, minute=30, id='auto_clockout')
-
-# Define sync wrapper functions for async tasks
-def sync_check_upcoming_deadlines():
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(check_upcoming_deadlines())
-        loop.close()
-    except Exception as e:
-        print(f"Error in sync_check_upcoming_deadlines: {e}")
+register_job('auto_clockout', auto_clockout, 'cron', description="Auto clock-out", hour=21, minute=30)
 
-def sync_check_missed_attendance():
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(check_missed_attendance())
-        loop.close()
-    except Exception as e:
-        print(f"Error in sync_check_missed_attendance: {e}")
-
-def sync_check_and_notify_overdue_tasks():
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(check_and_notify_overdue_tasks())
-        loop.close()
-    except Exception as e:
-        print(f"Error in sync_check_and_notify_overdue_tasks: {e}")
-
-def sync_run_all_automated_checks():
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(run_all_automated_checks())
-        loop.close()
-    except Exception as e:
-        print(f"Error in sync_run_all_automated_checks: {e}")
+# Repair drift in the stored unread-notification counters
+register_job('reconcile_unread_counters', Mongo.reconcile_unread_counters, 'cron',
+             description="Reconcile unread notification counters", hour=3, minute=15)
 
-def sync_check_pending_approvals():
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(check_pending_approvals())
-        loop.close()
-    except Exception as e:
-        print(f"Error in sync_check_pending_approvals: {e}")
+# Notification retention: archive old notifications nightly, keep status stats fresh
+register_job('notification_retention', notification_retention.run_notification_retention, 'cron',
+             description="Notification backfill and archival", hour=2, minute=30)
+register_job('notification_stats', notification_retention.refresh_notification_stats, 'interval',
+             description="Notification stats snapshot", minutes=15)
 
 # Schedule notification automation tasks
+# These replace the duplicate jobs Mongo.setup_task_scheduler used to add
+# (overdue checks at 9/13/17 and deadline checks at 8/18).
 # Morning checks at 8:00 AM (upcoming deadlines, missed attendance)
-scheduler.add_job(
-    sync_check_upcoming_deadlines,
-    'cron', hour=8, minute=0, id='morning_deadline_check'
-)
+register_job('morning_deadline_check', check_upcoming_deadlines, 'cron',
+             description="Upcoming task deadlines", hour=8, minute=0)
 
-scheduler.add_job(
-    sync_check_missed_attendance,
-    'cron', hour=10, minute=0, id='missed_attendance_check'
-)
+register_job('missed_attendance_check', check_missed_attendance, 'cron',
+             description="Missed attendance", hour=10, minute=0)
 
 # Midday overdue tasks check at 12:00 PM
-scheduler.add_job(
-    sync_check_and_notify_overdue_tasks,
-    'cron', hour=12, minute=0, id='midday_overdue_check'
-)
+register_job('midday_overdue_check', check_and_notify_overdue_tasks, 'cron',
+             description="Overdue tasks", hour=12, minute=0)
 
 # Evening comprehensive check at 6:00 PM
-scheduler.add_job(
-    sync_run_all_automated_checks,
-    'cron', hour=18, minute=0, id='evening_comprehensive_check'
-)
+register_job('evening_comprehensive_check', run_all_automated_checks, 'cron',
+             description="All automated notification checks", hour=18, minute=0)
 
-# Pending approvals check twice daily (10 AM and 3 PM)
-scheduler.add_job(
-    sync_check_pending_approvals,
-    'cron', hour=10, minute=30, id='morning_approvals_check'
-)
+# Pending approvals check twice daily (10:30 AM and 3 PM)
+register_job('morning_approvals_check', check_pending_approvals, 'cron',
+             description="Pending leave/WFH approvals", hour=10, minute=30)
 
-scheduler.add_job(
-    sync_check_pending_approvals,
-    'cron', hour=15, minute=0, id='afternoon_approvals_check'
-)
+register_job('afternoon_approvals_check', check_pending_approvals, 'cron',
+             description="Pending leave/WFH approvals", hour=15, minute=0)
 
+# Rebuild attendance stats daily at 11:59 PM
+register_job('daily_attendance_update', update_daily_attendance_stats, 'cron',
+             description="Attendance stats rebuild", hour=23, minute=59)
 
-# Add new job for daily attendance stats update
-scheduler.add_job(
-    update_daily_attendance_stats,
-    'cron',
-    hour=23,
-    minute=59,  # Run at 11:59 PM daily
-    id='daily_attendance_update'
-)
+# Also rebuild attendance stats once at startup
+register_job('startup_attendance_update', update_daily_attendance_stats, 'date',
+             description="Attendance stats rebuild at startup", misfire_grace_time=600)
 
+# Repair the denormalized thread reply counters on root chat messages
+register_job('thread_reply_counters_repair', Mongo.rebuild_thread_reply_counters, 'cron',
+             description="Rebuild thread reply counters", hour=3, minute=45)
+register_job('startup_thread_reply_counters', Mongo.rebuild_thread_reply_counters, 'date',
+             description="Thread reply counters rebuild at startup", misfire_grace_time=600)
 
-# Add job to run attendance update at startup
-scheduler.add_job(
-    update_daily_attendance_stats,
-    'date',  # Run once at startup
-    id='startup_attendance_update'
-)
-
-
-# Start the scheduler
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown())
+# One-off migration: add due_at to tasks created before it existed
+register_job('task_due_at_backfill', Mongo.backfill_task_due_at, 'date',
+             description="Backfill task due_at", misfire_grace_time=600)
 
 # Initialize task scheduler on application startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize task deadline scheduler when the application starts"""
     try:
-        task_scheduler = Mongo.setup_task_scheduler()
-        if task_scheduler:
-            print("✅ Task deadline monitoring system initialized")
-        else:
-            print("⚠️ Failed to initialize task deadline scheduler")
+        # Make sure every registered index exists (runs in the background)
+        ensure_indexes_in_background()
+
+        # Let scheduler threads push websocket messages on this loop
+        notification_manager.bind_loop(asyncio.get_running_loop())
+
+        job_scheduler.start()
         
         # Log scheduled jobs
         print("\n📅 Scheduled Background Jobs:")
@@ -425,13 +418,73 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup scheduler when application shuts down"""
     try:
-        if scheduler:
-            scheduler.shutdown()
-            print("✅ Background scheduler shut down successfully")
+        job_scheduler.shutdown()
+        print("✅ Background scheduler shut down successfully")
+        async_mongo.shutdown()
     except Exception as e:
         print(f"⚠️ Error shutting down scheduler: {e}")
 
 
+# Operational endpoints live under /internal: they require a valid token and
+# the prefix is meant to be blocked for public traffic at the proxy.
+@app.get("/internal/db/index-report", dependencies=[Depends(JWTBearer())])
+def index_report():
+    """Report missing, unused and redundant MongoDB indexes"""
+    try:
+        return serialize_mongo_doc(get_index_report())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/internal/jobs", dependencies=[Depends(JWTBearer())])
+def scheduled_jobs_status(history: int = Query(10, ge=1, le=100)):
+    """Scheduled jobs with their lease and recent run history"""
+    try:
+        return serialize_mongo_doc(job_scheduler.get_job_status(history))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/internal/db/pool-stats", dependencies=[Depends(JWTBearer())])
+def pool_stats():
+    """MongoDB connection pool settings and statistics for this worker"""
+    return get_pool_stats()
+
+
+def _websocket_connection_counts():
+    return {
+        ("notification",): sum(len(sockets) for sockets in notification_manager.active_connections.values()),
+        ("direct_chat",): sum(len(sockets) for sockets in direct_chat_manager.active_connections.values()),
+        ("group_chat",): sum(len(sockets) for sockets in group_ws_manager.active_connections.values()),
+        ("notify",): len(notify_manager.connections),
+        ("general_chat",): sum(len(sockets) for sockets in chat_manager.rooms.values()),
+    }
+
+metrics.websocket_connections.set_callback(_websocket_connection_counts)
+
+
+# Async so the connection-count callback reads the managers' dicts on the
+# event loop that mutates them, not from a threadpool worker
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker (in-process counters only, no database queries)"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/internal/slow-requests", dependencies=[Depends(JWTBearer())])
+def slow_requests(limit: int = Query(50, ge=1, le=500), clear: bool = False):
+    """Slow requests on this worker with the MongoDB commands they issued"""
+    entries = query_profiler.get_slow_requests(limit)
+    if clear:
+        query_profiler.clear_slow_requests()
+    return {
+        "pid": os.getpid(),
+        "slow_ms": query_profiler.SLOW_REQUEST_MS,
+        "slow_count": query_profiler.SLOW_COMMAND_COUNT,
+        "requests": entries,
+    }
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
@@ -454,24 +507,12 @@ async def notification_system_status():
         active_users = notification_manager.get_active_users()
         total_connections = sum(notification_manager.get_user_connection_count(user_id) for user_id in active_users)
         
-        # Check notification database
-        total_notifications = Notifications.count_documents({})
-        
-        # Check recent notifications (last 24 hours)
-        yesterday = current_time - timedelta(hours=24)
-        recent_notifications = Notifications.count_documents({
-            "created_at": {"$gte": yesterday.isoformat()}
-        })
+        # Pre-aggregated notification counts (refreshed by the scheduler)
+        notification_stats = await async_mongo.run_sync(notification_retention.get_notification_stats)
         
         # Check scheduler status
         scheduler_status = "running" if scheduler.running else "stopped"
         
-        # Get some sample stats
-        notification_types = {}
-        for notif_type in ["task", "leave", "wfh", "attendance", "system"]:
-            count = Notifications.count_documents({"type": notif_type})
-            notification_types[notif_type] = count
-        
         return {
             "status": "operational",
             "timestamp": current_time.isoformat(),
@@ -481,9 +522,12 @@ async def notification_system_status():
                 "active_user_ids": active_users[:10]  # Show first 10
             },
             "notifications": {
-                "total": total_notifications,
-                "recent_24h": recent_notifications,
-                "by_type": notification_types
+                "total": notification_stats["total"],
+                "unread": notification_stats.get("unread", 0),
+                "recent_24h": notification_stats["recent_24h"],
+                "by_type": notification_stats["by_type"],
+                "archived_total": notification_stats.get("archived_total", 0),
+                "stats_generated_at": notification_stats["generated_at"].isoformat()
             },
             "scheduler": {
                 "status": scheduler_status,
@@ -513,7 +557,7 @@ async def test_notifications(userid: str):
     """Test endpoint to create a sample notification"""
     try:
         # Create a test notification with WebSocket
-        notification_id = create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Test Notification",
             message="This is a test notification to verify the enhanced system is working perfectly!",
@@ -582,7 +626,7 @@ async def get_notification_stats(userid: str):
     """Get notification statistics for a user"""
     try:
         total_notifications = Notifications.count_documents({"userid": userid})
-        unread_count = get_unread_notification_count(userid)
+        unread_count = await async_mongo.get_unread_notification_count(userid)
         read_count = total_notifications - unread_count
         
         # Get notifications by type
@@ -603,7 +647,7 @@ async def get_notification_stats(userid: str):
         raise HTTPException(status_code=500, detail=str(e))
         
         # Create notification in database
-        result = create_notification(notification_data)
+        result = await async_mongo.create_notification(notification_data)
         
         # Send real-time notification if user is connected
         asyncio.create_task(notification_manager.send_personal_notification(userid, notification_data))
@@ -770,7 +814,7 @@ def previous_day_clockout(Data: CT):
 @app.get("/clock-records/{userid}/")  # Also handle requests with trailing slash
 async def get_clock_records(userid: str = Path(..., title="The name of the user whose clock records you want to fetch")):
     try:
-        clock_records = attendance_details(userid)
+        clock_records = await async_mongo.attendance_details(userid)
         return {"clock_records": clock_records}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -778,7 +822,7 @@ async def get_clock_records(userid: str = Path(..., title="The name of the user
 # Admin Dashboard Attendance
 @app.get("/attendance/")
 async def fetch_attendance_by_date():
-    attendance_data = get_attendance_by_date()
+    attendance_data = await async_mongo.get_attendance_by_date()
     if not attendance_data:
         return "No attendance data found for the selected date"
 
@@ -790,7 +834,7 @@ async def fetch_attendance_by_date():
 @app.get("/get_EmployeeId/{name}")
 async def get_employee_id(name: str = Path(..., title="The username of the user")):
     try:
-        employee_id = get_employee_id_from_db(name)
+        employee_id = await async_mongo.get_employee_id_from_db(name)
         if employee_id:
             return {"Employee_ID": employee_id}
         else:
@@ -811,7 +855,7 @@ async def leave_request(item: Item6):
         time = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%I:%M:%S %p")
 
         # Store the leave request in MongoDB
-        result = Mongo.store_leave_request(
+        result = await async_mongo.store_leave_request(
             item.userid,
             item.employeeName,
             time,
@@ -914,7 +958,7 @@ async def bonus_leave_request(item: Item9):
         time = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%I:%M:%S %p")
 
         # Store bonus leave request
-        result = store_sunday_request(
+        result = await async_mongo.store_sunday_request(
             item.userid,
             item.employeeName,
             time,
@@ -1095,7 +1139,7 @@ async def force_admin_notification_refresh():
 @app.put("/updated_user_leave_requests")
 async def updated_user_leave_requests_status(leave_id: str = Form(...), status: str = Form(...)):
     try:
-        response = updated_user_leave_requests_status_in_mongo(leave_id, status)
+        response = await async_mongo.updated_user_leave_requests_status_in_mongo(leave_id, status)
         
         # Create notification for leave status update
         if response and "userid" in response:
@@ -1114,7 +1158,7 @@ async def updated_user_leave_requests_status(leave_id: str = Form(...), status:
                 action = status  # Use the original status for any other case
                 priority = "medium"
             
-            create_leave_notification(
+            await async_mongo.create_leave_notification(
                 userid=response["userid"],
                 leave_type=response.get("leave_type", "Leave"),
                 action=action,
@@ -1130,7 +1174,7 @@ async def updated_user_leave_requests_status(leave_id: str = Form(...), status:
 @app.put("/recommend_users_leave_requests")
 async def recommend_managers_leave_requests_status(leave_id: str = Form(...), status: str = Form(...)):
     try:
-        response = recommend_manager_leave_requests_status_in_mongo(leave_id, status)
+        response = await async_mongo.recommend_manager_leave_requests_status_in_mongo(leave_id, status)
         
         # Create notification for leave recommendation
         if response and "userid" in response:
@@ -1138,7 +1182,7 @@ async def recommend_managers_leave_requests_status(leave_id: str = Form(...), st
             recommender_name = response.get("recommender_name", "Admin")
             
             # Notify the employee about the recommendation
-            create_leave_notification(
+            await async_mongo.create_leave_notification(
                 userid=response["userid"],
                 leave_type=response.get("leave_type", "Leave"),
                 action=action,
@@ -1228,7 +1272,7 @@ async def remote_work_request(request: RemoteWorkRequest):
         time = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%I:%M:%S %p")
 
 
-        result = Mongo.store_remote_work_request(
+        result = await async_mongo.store_remote_work_request(
             request.userid,
             request.employeeName,
             time,
@@ -1581,7 +1625,7 @@ async def other_leave_request(item: Item7):
         time = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%I:%M:%S %p")
 
         # Store the leave request in MongoDB
-        result = store_Other_leave_request(
+        result = await async_mongo.store_Other_leave_request(
             item.userid,
             item.employeeName,
             time,  # Use the generated time
@@ -1676,7 +1720,7 @@ async def other_leave_request(item: Item7):
 @app.post('/Permission-request')
 async def permission_request(item: Item8):
     try:
-        result = store_Permission_request(
+        result = await async_mongo.store_Permission_request(
                 item.userid,
                 item.employeeName,
                 item.time,
@@ -2473,7 +2517,7 @@ async def get_all_users_remote_work_details(
 @app.get("/get_all_users")
 async def get_all_users_route():
         # Fetch all users using the function from Mongo.py
-        users = get_all_users()
+        users = await async_mongo.get_all_users()
         if users:
             return users  # Return the list of users
         else:
@@ -2599,12 +2643,15 @@ async def task_delete(taskid: str):
 async def trigger_deadline_check():
     """Manually trigger deadline checking for testing/immediate needs"""
     try:
-        overdue_count = await Mongo.check_and_notify_overdue_tasks()
-        upcoming_count = await Mongo.check_upcoming_deadlines()
+        # Same digest-based checks the scheduler runs
+        overdue_result = await check_and_notify_overdue_tasks()
+        upcoming_result = await check_upcoming_deadlines()
+        overdue_count = overdue_result.get("overdue_count", 0)
+        upcoming_count = upcoming_result.get("notifications_sent", 0)
         
         return {
             "status": "success",
-            "overdue_notifications_sent": overdue_count,
+            "overdue_notifications_sent": overdue_result.get("notifications_sent", 0),
             "upcoming_deadline_notifications_sent": upcoming_count,
             "message": f"Processed {overdue_count} overdue tasks and {upcoming_count} upcoming deadline reminders"
         }
@@ -2634,24 +2681,11 @@ async def get_task_notification_stats(userid: str):
         })
         
         # Get overdue tasks
-        current_date = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
-        current_date_obj = datetime.strptime(current_date, "%d-%m-%Y")
-        
-        overdue_tasks = list(Mongo.Tasks.find({
+        overdue_count = Mongo.Tasks.count_documents({
             "userid": userid,
-            "status": {"$ne": "Completed"}
-        }))
-        
-        overdue_count = 0
-        for task in overdue_tasks:
-            due_date_str = task.get("due_date")
-            if due_date_str:
-                try:
-                    due_date = datetime.strptime(due_date_str, "%d-%m-%Y")
-                    if due_date < current_date_obj:
-                        overdue_count += 1
-                except ValueError:
-                    continue
+            "status": {"$ne": "Completed"},
+            "due_at": {"$lt": Mongo.task_today()}
+        })
         
         # Get notifications by type
         notification_types = {}
@@ -2679,7 +2713,7 @@ async def task_delete(taskid: str):
 @app.get("/get_tasks/{userid}")
 @app.get("/get_tasks/{userid}/")  # Also handle requests with trailing slash
 async def get_tasks(userid: str):
-    result = get_the_tasks(userid)
+    result = await async_mongo.get_the_tasks(userid)
     if not result:
         return {"message": "No tasks found for the given user"}
 
@@ -2693,7 +2727,7 @@ async def get_tasks(userid: str):
 
 @app.get("/get_tasks/{userid}/{date}")
 async def get_tasks(userid: str, date: str):
-    result = get_the_tasks(userid, date)
+    result = await async_mongo.get_the_tasks(userid, date)
     if not result:
         return {"message": "No tasks found for the given user in selected date"}
 
@@ -2823,7 +2857,7 @@ async def upload_task_file(
                 
                 # Notify task owner if file uploaded by someone else
                 if task_userid and uploaded_by != task_userid:
-                    Mongo.create_notification(
+                    await async_mongo.create_notification(
                         userid=task_userid,
                         title="File Uploaded",
                         message=f"{uploader_name} uploaded a file '{file.filename}' to your task '{task_title}'.",
@@ -2842,7 +2876,7 @@ async def upload_task_file(
                 # Notify manager if they exist and didn't upload the file
                 assigned_by = task.get("assigned_by")
                 if assigned_by and assigned_by != "self" and assigned_by != uploaded_by and assigned_by != task_userid:
-                    Mongo.create_notification(
+                    await async_mongo.create_notification(
                         userid=assigned_by,
                         title="File Uploaded to Assigned Task",
                         message=f"{uploader_name} uploaded a file '{file.filename}' to the task '{task_title}'.",
@@ -3081,10 +3115,10 @@ async def debug_notifications(userid: str):
 async def manually_check_upcoming_deadlines():
     """Manually trigger upcoming deadline check"""
     try:
-        upcoming_count = await Mongo.check_upcoming_deadlines()
+        upcoming_result = await check_upcoming_deadlines()
         return {
             "message": f"Checked upcoming deadlines successfully",
-            "upcoming_tasks_found": upcoming_count
+            "upcoming_tasks_found": upcoming_result.get("notifications_sent", 0)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking upcoming deadlines: {str(e)}")
@@ -3093,38 +3127,31 @@ async def manually_check_upcoming_deadlines():
 async def get_overdue_tasks_summary():
     """Get summary of all overdue tasks"""
     try:
-        current_time = datetime.now(pytz.timezone("Asia/Kolkata"))
-        current_date = current_time.strftime("%d-%m-%Y")
+        current_date_obj = Mongo.task_today()
+        current_date = current_date_obj.strftime("%d-%m-%Y")
+        tomorrow = current_date_obj + timedelta(days=1)
         
-        # Find all incomplete tasks
-        incomplete_tasks = list(Mongo.Tasks.find({"status": {"$ne": "Completed"}}))
+        # Incomplete tasks due before today or tomorrow, from one indexed range query
         overdue_tasks = []
         upcoming_tasks = []
         
-        for task in incomplete_tasks:
-            due_date_str = task.get("due_date")
-            if due_date_str:
-                try:
-                    due_date = datetime.strptime(due_date_str, "%d-%m-%Y")
-                    current_date_obj = datetime.strptime(current_date, "%d-%m-%Y")
-                    tomorrow = current_date_obj + timedelta(days=1)
-                    
-                    task_info = {
-                        "task_id": str(task["_id"]),
-                        "userid": task.get("userid"),
-                        "task": task.get("task"),
-                        "due_date": due_date_str,
-                        "status": task.get("status"),
-                        "TL": task.get("TL")
-                    }
-                    
-                    if due_date < current_date_obj:
-                        overdue_tasks.append(task_info)
-                    elif due_date.strftime("%d-%m-%Y") == tomorrow.strftime("%d-%m-%Y"):
-                        upcoming_tasks.append(task_info)
-                        
-                except ValueError:
-                    pass
+        for task in Mongo.Tasks.find(
+            {"status": {"$ne": "Completed"}, "due_at": {"$lte": tomorrow}},
+            {"userid": 1, "task": 1, "due_date": 1, "due_at": 1, "status": 1, "TL": 1}
+        ):
+            task_info = {
+                "task_id": str(task["_id"]),
+                "userid": task.get("userid"),
+                "task": task.get("task"),
+                "due_date": task.get("due_date"),
+                "status": task.get("status"),
+                "TL": task.get("TL")
+            }
+            
+            if task["due_at"] < current_date_obj:
+                overdue_tasks.append(task_info)
+            elif task["due_at"] == tomorrow:
+                upcoming_tasks.append(task_info)
         
         return {
             "current_date": current_date,
@@ -3153,7 +3180,7 @@ def fetch_ip_info():
 async def create_notification_endpoint(notification: NotificationModel):
     """Create a new notification"""
     try:
-        result = create_notification(
+        result = await async_mongo.create_notification(
             userid=notification.userid,
             title=notification.title,
             message=notification.message,
@@ -3176,18 +3203,21 @@ async def get_user_notifications(
     type: str = None,
     priority: str = None,
     is_read: bool = None,
-    limit: int = 50
+    limit: int = 50,
+    cursor: str = None
 ):
-    """Get notifications for a user with optional filters"""
+    """Get notifications for a user with optional filters (pass next_cursor back for the next page)"""
     try:
-        notifications = get_notifications(
+        return await async_mongo.get_notifications_page(
             userid=userid,
             notification_type=type,
             priority=priority,
             is_read=is_read,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
-        return {"notifications": notifications}
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3195,7 +3225,7 @@ async def get_user_notifications(
 async def mark_notification_as_read(notification_id: str, update: NotificationUpdate):
     """Mark a notification as read/unread"""
     try:
-        success = mark_notification_read(notification_id, update.is_read)
+        success = await async_mongo.mark_notification_read(notification_id, update.is_read)
         if success:
             return {"message": "Notification updated successfully"}
         else:
@@ -3207,7 +3237,7 @@ async def mark_notification_as_read(notification_id: str, update: NotificationUp
 async def mark_all_user_notifications_read(userid: str):
     """Mark all notifications as read for a user"""
     try:
-        count = mark_all_notifications_read(userid)
+        count = await async_mongo.mark_all_notifications_read(userid)
         return {"message": f"Marked {count} notifications as read"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3216,7 +3246,7 @@ async def mark_all_user_notifications_read(userid: str):
 async def get_user_unread_count(userid: str):
     """Get count of unread notifications for a user"""
     try:
-        count = get_unread_notification_count(userid)
+        count = await async_mongo.get_unread_notification_count(userid)
         return {"unread_count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3225,7 +3255,7 @@ async def get_user_unread_count(userid: str):
 async def delete_notification_endpoint(notification_id: str):
     """Delete a notification"""
     try:
-        success = delete_notification(notification_id)
+        success = await async_mongo.delete_notification(notification_id)
         if success:
             return {"message": "Notification deleted successfully"}
         else:
@@ -3234,11 +3264,14 @@ async def delete_notification_endpoint(notification_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/notifications/{userid}/type/{notification_type}")
-async def get_notifications_by_type_endpoint(userid: str, notification_type: str):
-    """Get notifications by type for a user"""
+async def get_notifications_by_type_endpoint(userid: str, notification_type: str, limit: int = 50, cursor: str = None):
+    """Get notifications by type for a user (pass next_cursor back for the next page)"""
     try:
-        notifications = get_notifications_by_type(userid, notification_type)
-        return {"notifications": notifications}
+        return await async_mongo.get_notifications_page(
+            userid, notification_type=notification_type, limit=limit, cursor=cursor
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3250,7 +3283,7 @@ async def create_test_notification(userid: str):
         from websocket_manager import notification_manager
         
         # Create test notification in database
-        notification_id = create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Test Notification",
             message="This is a test notification to verify the system is working correctly.",
@@ -3278,7 +3311,7 @@ async def create_test_notification(userid: str):
             await notification_manager.send_personal_notification(userid, notification_data)
             
             # Update unread count
-            unread_count = get_unread_notification_count(userid)
+            unread_count = await async_mongo.get_unread_notification_count(userid)
             await notification_manager.send_unread_count_update(userid, unread_count)
             
         return {"message": "Test notification created successfully", "notification_id": notification_id}
@@ -3293,16 +3326,24 @@ async def websocket_endpoint(websocket: WebSocket, userid: str):
         await notification_manager.connect(websocket, userid)
         print(f"WebSocket connected successfully for user: {userid}")
         
+        async def send_backlog(cursor=None):
+            """Send one page of unread notifications plus the cursor for the next"""
+            page = await async_mongo.get_notifications_page(userid, is_read=False, limit=10, cursor=cursor)
+            for notification in page["notifications"]:
+                if websocket.client_state.value == 1:  # WebSocketState.CONNECTED
+                    await websocket.send_text(json.dumps({
+                        "type": "notification",
+                        "data": notification
+                    }))
+            if websocket.client_state.value == 1:
+                await websocket.send_text(json.dumps({
+                    "type": "notification_backlog",
+                    "next_cursor": page["next_cursor"]
+                }))
+        
         # Send existing unread notifications on connection
         try:
-            notifications = get_notifications(userid, is_read=False, limit=10)
-            if notifications:
-                for notification in notifications:
-                    if websocket.client_state.value == 1:  # WebSocketState.CONNECTED
-                        await websocket.send_text(json.dumps({
-                            "type": "notification",
-                            "data": notification
-                        }))
+            await send_backlog()
         except Exception as e:
             print(f"Error sending initial notifications: {e}")
         
@@ -3317,6 +3358,18 @@ async def websocket_endpoint(websocket: WebSocket, userid: str):
                 data = await websocket.receive_text()
                 print(f"Received message from {userid}: {data}")
                 
+                # Client asks for the next page of the unread backlog
+                try:
+                    request = json.loads(data)
+                except ValueError:
+                    request = None
+                if isinstance(request, dict) and request.get("type") == "load_backlog" and request.get("cursor"):
+                    try:
+                        await send_backlog(request["cursor"])
+                    except InvalidCursor as e:
+                        await websocket.send_text(json.dumps({"type": "error", "message": str(e)}))
+                    continue
+                
                 # Only send response if connection is still open
                 if websocket.client_state.value == 1:  # WebSocketState.CONNECTED
                     await websocket.send_text(json.dumps({"type": "pong", "message": "Connection alive"}))
@@ -3345,7 +3398,7 @@ async def create_test_notification(data: dict):
         message = data.get("message", "Testing timestamp display")
         
         # Create notification using the fixed create_notification function
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title=title,
             message=message,
@@ -3828,27 +3881,24 @@ def get_holidays_for_year(year: int):
 
 
 @app.get("/working-days/{year}")
-def get_working_days(year: int):
+def get_working_days(year: int = Path(..., ge=Mongo.WORKING_DAY_MIN_YEAR, le=Mongo.WORKING_DAY_MAX_YEAR)):
     """Get working days calculation for a year"""
-    holiday_doc = get_holidays(year)
-    if not holiday_doc:
+    calendar = Mongo.get_working_day_calendar(year)
+    if not calendar["holidays_defined"]:
         raise HTTPException(status_code=404, detail=f"No holidays defined for {year}")
    
-    holidays = holiday_doc["holidays"]
-    working_days = calculate_working_days(year, holidays)
-   
     return {
         "year": year,
-        "totalWorkingDays": len(working_days),
-        "workingDays": working_days,
-        "holidays": holidays
+        "totalWorkingDays": calendar["total_working_days"],
+        "workingDays": calendar["working_days"],
+        "holidays": calendar["holidays"]
     }
 
 @app.get("/attendance/user/{userid}/year/{year}")
 async def get_user_attendance_by_year(userid: str, year: int):
     """User can see their attendance stats for a specific year"""
     try:
-        stats = calculate_user_attendance_stats(userid, year)
+        stats = await async_mongo.calculate_user_attendance_stats(userid, year)
         user = Users.find_one({"_id": ObjectId(userid)}, {"name": 1, "email": 1})
         
         return {
@@ -3871,7 +3921,7 @@ async def get_team_attendance(team_leader: str, year: int = Query(None)):
         if year is None:
             year = date.today().year
         
-        team_stats = get_team_attendance_stats(team_leader, year)
+        team_stats = await async_mongo.get_team_attendance_stats(team_leader, year)
         return team_stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3882,7 +3932,7 @@ async def get_team_attendance(team_leader: str, year: int = Query(None)):
 async def get_user_attendance(userid: str):
     """User can see only their own attendance statistics"""
     try:
-        dashboard_data = get_user_attendance_dashboard(userid)
+        dashboard_data = await async_mongo.get_user_attendance_dashboard(userid)
         return dashboard_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3900,7 +3950,7 @@ async def get_team_member_attendance(team_leader: str, userid: str, year: int =
         if not user:
             raise HTTPException(status_code=403, detail="User is not in your team")
        
-        stats = calculate_user_attendance_stats(userid, year)
+        stats = await async_mongo.calculate_user_attendance_stats(userid, year)
         stats["user_info"] = {
             "name": user.get("name"),
             "email": user.get("email"),
@@ -3925,7 +3975,7 @@ async def get_manager_attendance_overview(manager_userid: str, year: int = Query
         if year is None:
             year = date.today().year
        
-        manager_stats = get_manager_team_attendance(manager_userid, year)
+        manager_stats = await async_mongo.get_manager_team_attendance(manager_userid, year)
         return manager_stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3938,7 +3988,7 @@ async def get_department_attendance(department: str, year: int = Query(None)):
         if year is None:
             year = date.today().year
        
-        dept_stats = get_department_attendance_stats(department, year)
+        dept_stats = await async_mongo.get_department_attendance_stats(department, year)
         return dept_stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3952,7 +4002,7 @@ async def get_admin_attendance_overview(year: int = Query(None)):
         if year is None:
             year = date.today().year
        
-        company_stats = get_department_attendance_stats(year=year)  # All departments
+        company_stats = await async_mongo.get_department_attendance_stats(year=year)  # All departments
         return company_stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3963,7 +4013,7 @@ async def get_admin_attendance_overview(year: int = Query(None)):
 async def refresh_attendance_stats():
     """Manually trigger attendance statistics refresh (Admin only)"""
     try:
-        updated_count = update_daily_attendance_stats()
+        updated_count = await async_mongo.update_daily_attendance_stats()
         return {"message": f"Successfully updated attendance stats for {updated_count} users"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3974,7 +4024,7 @@ async def get_attendance_summary(userid: str):
     """Get a quick summary of user's attendance (for dashboard cards)"""
     try:
         current_year = date.today().year
-        stats = calculate_user_attendance_stats(userid, current_year)
+        stats = await async_mongo.calculate_user_attendance_stats(userid, current_year)
        
         return {
             "userid": userid,
@@ -4049,16 +4099,22 @@ async def websocket_endpoint(websocket: WebSocket, userid: str):
 
             msg_type = msg.get("type", "chat")
 
+            if msg_type == "viewing":
+                # Client opened (to_user) or closed (no to_user) a conversation; the
+                # chatId is derived from this socket's user so it can only mark its own chats
+                chat_id = direct_chat_id(userid, msg["to_user"]) if msg.get("to_user") else None
+                presence.set_viewing(websocket, direct_conversation(chat_id) if chat_id else None)
+                continue
+
             if msg_type == "thread":
                 msg["id"] = msg.get("id") or str(ObjectId())
-                threads_collection.insert_one(msg.copy())
-                msg.pop("_id", None)
+                await async_mongo.save_thread_reply(msg)
 
                 # send to both sender and recipient
                 await direct_chat_manager.send_message(msg["to_user"], msg)
 
             else:  # normal chat
-                msg["chatId"] = msg.get("chatId") or "_".join(sorted([userid, msg["to_user"]]))
+                msg["chatId"] = msg.get("chatId") or direct_chat_id(userid, msg["to_user"])
                 chats_collection.insert_one(msg.copy())
                 msg.pop("_id", None)
 
@@ -4078,42 +4134,43 @@ async def websocket_endpoint(websocket: WebSocket, userid: str):
                             receiver_id=msg["to_user"],
                             sender_name=sender_name,
                             message_preview=message_text,
-                            chat_type="direct"
+                            chat_type="direct",
+                            chat_id=direct_chat_id(userid, msg["to_user"])
                         )
                 except Exception as e:
                     print(f"Error creating chat notification: {e}")
 
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Always drop the socket so a dead connection never counts as present
         direct_chat_manager.disconnect(userid, websocket)
 
 
 
 
 @app.get("/history/{chatId}")
-async def history(chatId: str):
-    cursor = chats_collection.find({"chatId": chatId}).sort("timestamp", 1)
-    messages = []
-    for doc in cursor:
-        mid = str(doc.get("id") or doc.get("_id"))
-        reply_count = threads_collection.count_documents({"rootId": mid})
-        messages.append({
-            "id": mid,
-            "from_user": doc.get("from_user"),
-            "to_user": doc.get("to_user"),
-            "text": doc.get("text"),
-            "file": doc.get("file"),
-            "timestamp": doc["timestamp"].isoformat() if isinstance(doc.get("timestamp"), datetime) else doc.get("timestamp"),
-            "chatId": doc.get("chatId"),
-            "reply_count": reply_count,   # ✅ so frontend can show "💬 3 replies"
-        })
-    return messages
+async def history(
+    chatId: str,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, for older messages"),
+    since: Optional[str] = Query(None, description="since from a previous page, for newer messages only"),
+    limit: int = Query(Mongo.CHAT_HISTORY_PAGE_SIZE, ge=1, le=200),
+):
+    """
+    Direct chat history, one page at a time (oldest first within the page).
+    reply_count on each message lets the frontend show "💬 3 replies".
+    """
+    try:
+        return await async_mongo.get_direct_chat_history(chatId, cursor, since, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/thread")
 async def save_thread(payload: dict = Body(...)):
     payload["id"] = payload.get("id") or str(ObjectId())
     payload["timestamp"] = datetime.utcnow().isoformat() +"Z"
-    threads_collection.insert_one(payload.copy())
+    await async_mongo.save_thread_reply(payload)
     return {"status": "success", "thread": payload}
 
 @app.get("/thread/{rootId}")
@@ -4483,7 +4540,7 @@ async def get_user_groups(user_id: str):
 
 @app.get("/group_members/{group_id}")
 async def get_group_members(group_id: str):
-    group = groups_collection.find_one({"_id": group_id})
+    group = await Mongo.load_group(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
@@ -4496,8 +4553,12 @@ async def get_group_members(group_id: str):
 
 
 @app.websocket("/ws/group/{group_id}")
-async def websocket_group(websocket: WebSocket, group_id: str):
-    await group_ws_manager.connect(group_id, websocket)
+async def websocket_group(websocket: WebSocket, group_id: str, token: Optional[str] = None):
+    # Presence is bound only to the user of a valid ?token= (the login JWT);
+    # anonymous sockets still chat but never suppress notifications
+    claims = decodeJWT(token) if token else None
+    viewer_id = claims.get("client_id") if claims else None
+    await group_ws_manager.connect(group_id, websocket, viewer_id)
     try:
         while True:
             data = await websocket.receive_json()
@@ -4522,15 +4583,14 @@ async def websocket_group(websocket: WebSocket, group_id: str):
                 sender_id = data.get("from_user")
                 message_text = data.get("text", "")
                 
-                # Get group info
-                group = groups_collection.find_one({"_id": group_id})
+                # Group and sender name come from the in-process caches
+                group = await Mongo.load_group(group_id)
                 if group and message_text:
                     group_name = group.get("name", "Group")
                     member_ids = group.get("members", [])
                     
-                    # Get sender name
-                    sender = Users.find_one({"userid": sender_id})
-                    sender_name = sender.get("name", "Unknown User") if sender else "Unknown User"
+                    sender_names = await Mongo.load_member_names([sender_id]) if sender_id else {}
+                    sender_name = sender_names.get(sender_id, "Unknown User")
                     
                     # Send notifications to all members except sender
                     await Mongo.create_group_chat_notification(
@@ -4552,23 +4612,22 @@ async def websocket_group(websocket: WebSocket, group_id: str):
 
 # Fetch group chat history
 @app.get("/group_history/{group_id}")
-async def group_history(group_id: str):
-    cursor = messages_collection.find({"chatId": group_id}).sort("timestamp", 1)
-    messages = []
-    for doc in cursor:
-        messages.append({
-            "id": str(doc.get("_id")),
-            "from_user": doc.get("from_user"),
-            "text": doc.get("text"),
-            "file": doc.get("file"),
-            "timestamp": doc.get("timestamp").isoformat() if isinstance(doc.get("timestamp"), datetime) else doc.get("timestamp"),
-            "chatId": doc.get("chatId")
-        })
-    return messages
+async def group_history(
+    group_id: str,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, for older messages"),
+    since: Optional[str] = Query(None, description="since from a previous page, for newer messages only"),
+    limit: int = Query(Mongo.CHAT_HISTORY_PAGE_SIZE, ge=1, le=200),
+):
+    """Group chat history, one page at a time (oldest first within the page)"""
+    try:
+        return await async_mongo.get_group_history(group_id, cursor, since, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/delete_group/{group_id}")
 async def delete_group(group_id: str):
     result = groups_collection.delete_one({"_id": group_id})
+    Mongo.invalidate_group(group_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Group not found")
     
@@ -4583,6 +4642,7 @@ async def update_group(group_id: str, group: GroupUpdate):
         {"_id": group_id},
         {"$set": {"name": group.name, "members": group.members, "updated_at": datetime.utcnow()}}
     )
+    Mongo.invalidate_group(group_id)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Group not found")
     return {"status": "success", "group_id": group_id, "name": group.name}
@@ -4634,7 +4694,7 @@ async def add_task_comment(
         
         # Notify task owner if comment is by someone else
         if task_userid and userid != task_userid:
-            Mongo.create_notification(
+            await async_mongo.create_notification(
                 userid=task_userid,
                 title="New Comment Added",
                 message=f"{commenter_name} added a comment to your task '{task_title}': '{comment[:100]}{'...' if len(comment) > 100 else ''}'",
@@ -4653,7 +4713,7 @@ async def add_task_comment(
         # Notify manager if they exist and didn't make the comment
         assigned_by = task.get("assigned_by")
         if assigned_by and assigned_by != "self" and assigned_by != userid and assigned_by != task_userid:
-            Mongo.create_notification(
+            await async_mongo.create_notification(
                 userid=assigned_by,
                 title="Comment Added to Assigned Task",
                 message=f"{commenter_name} added a comment to the task '{task_title}': '{comment[:100]}{'...' if len(comment) > 100 else ''}'",
@@ -4711,7 +4771,7 @@ async def add_task_subtask(
         assigner_name = assigner.get("name", "Manager") if assigner else "Manager"
         
         if task_userid:
-            Mongo.create_notification(
+            await async_mongo.create_notification(
                 userid=task_userid,
                 title="Subtask Added",
                 message=f"{assigner_name} added a new subtask '{subtask_text}' to your task '{task_title}'.",
@@ -4749,7 +4809,7 @@ async def test_task_notifications(taskid: str):
         # Test different notification types
         
         # 1. Task Creation Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Task Created Successfully",
             message=f"Your task '{task_title}' has been created successfully.",
@@ -4762,7 +4822,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "creation", "id": notification_id})
         
         # 2. Task Update Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Task Updated",
             message=f"Your task '{task_title}' has been updated. Changes: status to In Progress, priority to High",
@@ -4775,7 +4835,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "update", "id": notification_id})
         
         # 3. Comment Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="New Comment Added",
             message=f"Test User added a comment to your task '{task_title}': 'This is a test comment for notification testing'",
@@ -4788,7 +4848,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "comment", "id": notification_id})
         
         # 4. File Upload Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="File Uploaded",
             message=f"Test User uploaded a file 'test_document.pdf' to your task '{task_title}'.",
@@ -4801,7 +4861,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "file_upload", "id": notification_id})
         
         # 5. Status Change Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Task Status Updated",
             message=f"Your task '{task_title}' status has been changed from 'Not completed' to 'Completed'.",
@@ -4814,7 +4874,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "status_change", "id": notification_id})
         
         # 6. Deadline Approach Notification (due tomorrow)
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Task Deadline Approaching",
             message=f"Your task '{task_title}' is due tomorrow. Please ensure it's completed on time.",
@@ -4827,7 +4887,7 @@ async def test_task_notifications(taskid: str):
         notifications_sent.append({"type": "deadline_approach", "id": notification_id})
         
         # 7. Overdue Task Notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Task Overdue",
             message=f"Your task '{task_title}' is 2 days overdue. This requires immediate attention.",
@@ -4960,7 +5020,7 @@ async def test_simple_notification(userid: str):
     """Create a simple test notification to verify the system is working"""
     try:
         # Create a simple notification
-        notification_id = Mongo.create_notification(
+        notification_id = await async_mongo.create_notification(
             userid=userid,
             title="Test Notification",
             message="This is a test notification to verify the system is working correctly.",
@@ -5026,7 +5086,7 @@ async def debug_notifications(userid: str):
             "active_users": notification_manager.get_active_users(),
             "total_db_notifications": len(db_notifications),
             "recent_notifications": db_notifications,
-            "unread_count": Mongo.get_unread_notification_count(userid)
+            "unread_count": await async_mongo.get_unread_notification_count(userid)
         }
         
     except Exception as e:
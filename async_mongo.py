@@ -0,0 +1,94 @@
+"""
+Asynchronous data-access layer for the FastAPI handlers.
+
+The business logic lives in the synchronous functions of Mongo.py.  Calling
+them directly from an ``async def`` route blocks the event loop for every
+database round trip, so one slow aggregation stalls every websocket and HTTP
+request on the worker.  The coroutines below run the same Mongo.py functions
+on a dedicated thread pool and can be awaited from async routes and
+websocket handlers.  Sync (``def``) routes are already executed in
+Starlette's threadpool and keep calling Mongo.py directly.
+
+The pool size is controlled by MONGO_ASYNC_WORKERS and should not exceed
+the MongoClient's maxPoolSize, otherwise threads just queue for sockets.
+Calls run in a copy of the caller's context, so the query profiler still
+attributes their commands to the request.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import Mongo
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("MONGO_ASYNC_WORKERS", "32")),
+    thread_name_prefix="mongo-async",
+)
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking function on the Mongo thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def _to_async(name):
+    """Build the async equivalent of Mongo.<name>."""
+    func = getattr(Mongo, name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        # Resolve at call time so the wrapper always follows Mongo.py
+        return await run_sync(getattr(Mongo, name), *args, **kwargs)
+
+    return wrapper
+
+
+def shutdown():
+    """Release the worker threads (called on application shutdown)."""
+    _executor.shutdown(wait=False)
+
+
+# Attendance
+attendance_details = _to_async("attendance_details")
+get_attendance_by_date = _to_async("get_attendance_by_date")
+get_employee_id_from_db = _to_async("get_employee_id_from_db")
+calculate_user_attendance_stats = _to_async("calculate_user_attendance_stats")
+get_user_attendance_dashboard = _to_async("get_user_attendance_dashboard")
+get_team_attendance_stats = _to_async("get_team_attendance_stats")
+get_department_attendance_stats = _to_async("get_department_attendance_stats")
+get_manager_team_attendance = _to_async("get_manager_team_attendance")
+update_daily_attendance_stats = _to_async("update_daily_attendance_stats")
+
+# Leave / WFH
+store_leave_request = _to_async("store_leave_request")
+store_sunday_request = _to_async("store_sunday_request")
+store_Other_leave_request = _to_async("store_Other_leave_request")
+store_Permission_request = _to_async("store_Permission_request")
+store_remote_work_request = _to_async("store_remote_work_request")
+updated_user_leave_requests_status_in_mongo = _to_async("updated_user_leave_requests_status_in_mongo")
+recommend_manager_leave_requests_status_in_mongo = _to_async("recommend_manager_leave_requests_status_in_mongo")
+
+# Users / tasks
+get_all_users = _to_async("get_all_users")
+get_the_tasks = _to_async("get_the_tasks")
+
+# Chat
+get_direct_chat_history = _to_async("get_direct_chat_history")
+save_thread_reply = _to_async("save_thread_reply")
+get_group_history = _to_async("get_group_history")
+
+# Notifications
+create_notification = _to_async("create_notification")
+get_notifications = _to_async("get_notifications")
+get_notifications_page = _to_async("get_notifications_page")
+mark_notification_read = _to_async("mark_notification_read")
+mark_all_notifications_read = _to_async("mark_all_notifications_read")
+get_unread_notification_count = _to_async("get_unread_notification_count")
+delete_notification = _to_async("delete_notification")
+get_notifications_by_type = _to_async("get_notifications_by_type")
+create_leave_notification = _to_async("create_leave_notification")
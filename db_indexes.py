@@ -0,0 +1,350 @@
+"""
+Central index registry for the E-Connect MongoDB collections.
+
+Every hot query shape in Mongo.py, Server.py and notification_automation.py
+declares the compound index it needs here.  ensure_indexes() is run once at
+application startup (in a background thread, so a slow build never delays
+the first request) and is idempotent: create_indexes() is a no-op for
+indexes that already exist with the same key pattern and options.
+
+get_index_report() compares the registry with what is actually on the
+server and uses $indexStats to flag unused and redundant indexes.
+"""
+
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+from Mongo import db
+
+
+# collection name -> list of index declarations
+# Each entry: keys (list of (field, direction)), name, query (what it serves)
+# and optional extra IndexModel options (unique, sparse, ...).
+INDEX_REGISTRY = {
+    "Attendance": [
+        {
+            "keys": [("date", ASCENDING), ("name", ASCENDING)],
+            "name": "date_name",
+            "query": "Clockin/Clockout/PreviousDayClockout: Clock.find_one({'date','name'}); check_missed_attendance distinct userid by date",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("date", ASCENDING)],
+            "name": "userid_date",
+            "query": "attendance_details, attendance stats per user and year",
+        },
+        {
+            "keys": [("name", ASCENDING), ("clockout", ASCENDING)],
+            "name": "name_clockout",
+            "query": "Clockout: open clock-in lookup for previous days",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("bonus_leave", ASCENDING)],
+            "name": "userid_bonus_leave",
+            "query": "store_leave_request/store_sunday_request combo leave check",
+        },
+    ],
+    "Leave_Details": [
+        {
+            "keys": [("userid", ASCENDING), ("selectedDate", ASCENDING), ("leaveType", ASCENDING)],
+            "name": "userid_selectedDate_leaveType",
+            "query": "check_leave_conflict, is_leave_taken, monthly leave count",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("status", ASCENDING), ("selectedDate", ASCENDING)],
+            "name": "userid_status_selectedDate",
+            "query": "attendance stats: approved leaves per user and year",
+        },
+        {
+            "keys": [("status", ASCENDING), ("leaveType", ASCENDING)],
+            "name": "status_leaveType",
+            "query": "HR/admin pending leave listings and reminders",
+        },
+    ],
+    "RemoteWork": [
+        {
+            "keys": [("userid", ASCENDING), ("fromDate", ASCENDING), ("toDate", ASCENDING)],
+            "name": "userid_fromDate_toDate",
+            "query": "leave/WFH conflict checks",
+        },
+        {
+            "keys": [("status", ASCENDING)],
+            "name": "status",
+            "query": "pending WFH approvals",
+        },
+    ],
+    "notifications": [
+        {
+            "keys": [("userid", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            "name": "userid_is_read_created_at_id",
+            "query": "unread counts, mark_all_notifications_read, websocket unread backlog pages",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            "name": "userid_created_at_id",
+            "query": "get_notifications_page keyset pagination",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            "name": "userid_type_created_at_id",
+            "query": "notifications by type (keyset pagination), chat notification dedup window",
+        },
+        {
+            "keys": [("userid", ASCENDING), ("type", ASCENDING), ("related_id", ASCENDING)],
+            "name": "userid_type_related_id",
+            "query": "overdue/deadline reminder duplicate checks",
+        },
+        {
+            "keys": [("dedup_key", ASCENDING)],
+            "name": "dedup_key_unique",
+            "query": "digest / idempotent notification upserts by dedup_key",
+            "unique": True,
+            "partialFilterExpression": {"dedup_key": {"$exists": True}},
+        },
+        {
+            "keys": [("expires_at", ASCENDING)],
+            "name": "expires_at_ttl",
+            "query": "TTL expiry of read notifications",
+            "expireAfterSeconds": 0,
+        },
+        {
+            "keys": [("created_ts", ASCENDING)],
+            "name": "created_ts",
+            "query": "archive_old_notifications cutoff, recent_24h stats",
+        },
+    ],
+    "notifications_archive": [
+        {
+            "keys": [("userid", ASCENDING), ("created_ts", DESCENDING)],
+            "name": "userid_created_ts",
+            "query": "archived notifications per user",
+        },
+    ],
+    "tasks": [
+        {
+            "keys": [("userid", ASCENDING), ("date", ASCENDING)],
+            "name": "userid_date",
+            "query": "get_the_tasks / get_manager_only_tasks",
+        },
+        {
+            "keys": [("assigned_by", ASCENDING), ("userid", ASCENDING)],
+            "name": "assigned_by_userid",
+            "query": "get_assigned_tasks",
+        },
+        {
+            "keys": [("status", ASCENDING), ("due_at", ASCENDING)],
+            "name": "status_due_at",
+            "query": "overdue / upcoming deadline checks: range on due_at",
+        },
+    ],
+    "chat_app": [
+        {
+            "keys": [("chatId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+            "name": "chatId_timestamp_id",
+            "query": "/history/{chatId}: keyset pages on (timestamp, _id) and since deltas",
+        },
+        {
+            "keys": [("id", ASCENDING)],
+            "name": "id",
+            "query": "save_thread_reply: reply counters on the root message",
+        },
+    ],
+    "threads": [
+        {
+            "keys": [("rootId", ASCENDING), ("timestamp", ASCENDING)],
+            "name": "rootId_timestamp",
+            "query": "/thread/{rootId} and the per-page reply count $group",
+        },
+    ],
+    "messages": [
+        {
+            "keys": [("chatId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+            "name": "chatId_timestamp_id",
+            "query": "/group_history/{group_id}: keyset pages on (timestamp, _id) and since deltas",
+        },
+    ],
+    "groups": [
+        {
+            "keys": [("members", ASCENDING)],
+            "name": "members",
+            "query": "/get_user_groups/{user_id}",
+        },
+    ],
+    "Users": [
+        {
+            "keys": [("userid", ASCENDING)],
+            "name": "userid",
+            "query": "get_user_info, chat sender lookup, edit_an_employee",
+        },
+        {
+            "keys": [("email", ASCENDING)],
+            "name": "email",
+            "query": "signin / Gsignin",
+        },
+        {
+            "keys": [("name", ASCENDING)],
+            "name": "name",
+            "query": "get_employee_id_from_db, manager lookup by TL name",
+        },
+        {
+            "keys": [("TL", ASCENDING), ("position", ASCENDING)],
+            "name": "TL_position",
+            "query": "team members / team attendance dashboards",
+        },
+        {
+            "keys": [("position", ASCENDING)],
+            "name": "position",
+            "query": "get_managers, get_user_by_position",
+        },
+    ],
+    "admin": [
+        {
+            "keys": [("email", ASCENDING)],
+            "name": "email",
+            "query": "signin / admin_signin",
+        },
+    ],
+    "attendance_stats": [
+        {
+            "keys": [("userid", ASCENDING), ("year", ASCENDING)],
+            "name": "userid_year",
+            "query": "AttendanceStats upsert per user and year",
+        },
+    ],
+    "holidays": [
+        {
+            "keys": [("year", ASCENDING)],
+            "name": "year",
+            "query": "get_holidays / insert_holidays",
+        },
+    ],
+    "job_runs": [
+        {
+            "keys": [("job_id", ASCENDING), ("started_at", DESCENDING)],
+            "name": "job_id_started_at",
+            "query": "/internal/jobs recent run history",
+        },
+        {
+            "keys": [("started_at", ASCENDING)],
+            "name": "started_at_ttl",
+            "query": "expire job run history after 30 days",
+            "expireAfterSeconds": 30 * 24 * 3600,
+        },
+    ],
+    "working_days": [
+        {
+            "keys": [("year", ASCENDING)],
+            "name": "year",
+            "query": "get_working_day_calendar: cached calendar per year",
+        },
+    ],
+}
+
+_ensure_status = {"started_at": None, "finished_at": None, "created": {}, "errors": {}}
+
+
+def _index_models(specs):
+    models = []
+    for spec in specs:
+        options = {k: v for k, v in spec.items() if k not in ("keys", "name", "query")}
+        models.append(IndexModel(spec["keys"], name=spec["name"], background=True, **options))
+    return models
+
+
+def ensure_indexes():
+    """Create every registered index. Safe to call repeatedly."""
+    _ensure_status["started_at"] = datetime.now()
+    _ensure_status["created"] = {}
+    _ensure_status["errors"] = {}
+
+    for collection_name, specs in INDEX_REGISTRY.items():
+        try:
+            created = db[collection_name].create_indexes(_index_models(specs))
+            _ensure_status["created"][collection_name] = created
+        except OperationFailure as e:
+            # Usually an existing index with the same keys but a different
+            # name/options; report it instead of dropping anything.
+            print(f"⚠️ Index creation conflict on {collection_name}: {e}")
+            _ensure_status["errors"][collection_name] = str(e)
+        except PyMongoError as e:
+            print(f"❌ Error creating indexes on {collection_name}: {e}")
+            _ensure_status["errors"][collection_name] = str(e)
+
+    _ensure_status["finished_at"] = datetime.now()
+    print(f"✅ Index registry applied to {len(INDEX_REGISTRY)} collections")
+    return _ensure_status
+
+
+def ensure_indexes_in_background():
+    """Run ensure_indexes() on a daemon thread so startup is never blocked."""
+    thread = threading.Thread(target=ensure_indexes, name="ensure-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def _key_tuple(key_spec):
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in key_spec)
+
+
+def get_index_report():
+    """
+    Compare the registry against the server.
+
+    missing:   registered indexes whose key pattern does not exist
+    unused:    existing indexes with zero accesses since the server started
+    redundant: existing indexes whose keys are a prefix of another index
+    """
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "ensure_status": _ensure_status,
+        "collections": {},
+    }
+
+    for collection_name, specs in INDEX_REGISTRY.items():
+        collection = db[collection_name]
+        entry = {"missing": [], "unused": [], "redundant": [], "indexes": {}}
+
+        try:
+            info = collection.index_information()
+        except PyMongoError as e:
+            entry["error"] = str(e)
+            report["collections"][collection_name] = entry
+            continue
+
+        existing = {name: _key_tuple(idx["key"]) for name, idx in info.items()}
+        existing_keys = set(existing.values())
+
+        for spec in specs:
+            if _key_tuple(spec["keys"]) not in existing_keys:
+                entry["missing"].append({"name": spec["name"], "keys": spec["keys"], "query": spec["query"]})
+
+        try:
+            stats = {s["name"]: s for s in collection.aggregate([{"$indexStats": {}}])}
+        except PyMongoError as e:
+            stats = {}
+            entry["index_stats_error"] = str(e)
+
+        for name, keys in existing.items():
+            accesses = stats.get(name, {}).get("accesses", {})
+            entry["indexes"][name] = {
+                "keys": list(keys),
+                "ops": accesses.get("ops"),
+                "since": accesses.get("since").isoformat() if accesses.get("since") else None,
+            }
+            if name == "_id_":
+                continue
+            if name in stats and accesses.get("ops", 0) == 0:
+                entry["unused"].append(name)
+            if info[name].get("unique"):
+                continue
+            for other_name, other_keys in existing.items():
+                if other_name != name and len(other_keys) > len(keys) and other_keys[:len(keys)] == keys:
+                    entry["redundant"].append({"name": name, "covered_by": other_name})
+                    break
+
+        report["collections"][collection_name] = entry
+
+    return report
@@ -0,0 +1,253 @@
+"""
+Background job scheduling for E-Connect.
+
+All periodic jobs are registered here on one APScheduler instance per
+process.  With several uvicorn workers (or nodes) every process schedules
+every job, so each run first claims its time slot in MongoDB:
+
+  job_runs   one document per (job, slot); the unique _id means only the
+             first worker to fire claims the run, the others skip it.  The
+             document records worker, status, duration, result and error.
+  job_locks  one lease per job so a long run is never overlapped by the
+             next slot; it also keeps the last status for quick inspection.
+
+Slots are the scheduled minute for cron jobs and the interval bucket for
+interval jobs, both taken from the fire time APScheduler scheduled (not
+the wall clock when the run starts), so a late start on one worker cannot
+land in a different slot than the others.  One-shot "date" jobs (startup
+work) fire whenever each worker boots, so their slot is the deploy id
+instead: DEPLOY_ID when set, otherwise the host and the parent process
+shared by the uvicorn workers of one launch.
+
+The scheduler is an AsyncIOScheduler running on the application's event
+loop: coroutine jobs (the notification automation checks) are awaited
+directly and share the websocket managers, while blocking jobs and the
+lock bookkeeping run on the async_mongo thread pool.
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+from Mongo import db
+from async_mongo import run_sync
+
+SCHEDULER_TIMEZONE = os.environ.get("SCHEDULER_TIMEZONE", "Asia/Kolkata")
+DEFAULT_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "1800"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+DEPLOY_ID = os.environ.get("DEPLOY_ID") or f"{socket.gethostname()}:{os.getppid()}"
+
+JobLocks = db["job_locks"]
+JobRuns = db["job_runs"]
+
+scheduler = AsyncIOScheduler(timezone=SCHEDULER_TIMEZONE)
+
+# job_id -> registration details
+_jobs = {}
+# job_id -> scheduled fire time of the submitted run, read by run_job
+_scheduled_run_times = {}
+_start_lock = threading.Lock()
+
+
+def _remember_scheduled_run_time(event):
+    """Submission listener: dispatched before the submitted coroutine starts."""
+    if event.job_id in _jobs and event.scheduled_run_times:
+        _scheduled_run_times[event.job_id] = event.scheduled_run_times[-1]
+
+
+scheduler.add_listener(_remember_scheduled_run_time, EVENT_JOB_SUBMITTED)
+
+
+def _slot_seconds(trigger, trigger_args):
+    if trigger == "interval":
+        seconds = (
+            trigger_args.get("weeks", 0) * 604800
+            + trigger_args.get("days", 0) * 86400
+            + trigger_args.get("hours", 0) * 3600
+            + trigger_args.get("minutes", 0) * 60
+            + trigger_args.get("seconds", 0)
+        )
+        return max(int(seconds), 1)
+    return 60
+
+
+def _summarize(result):
+    """Keep job results small enough for the run history."""
+    if result is None or isinstance(result, (bool, int, float)):
+        return result
+    text = str(result)
+    return text if len(text) <= 500 else text[:497] + "..."
+
+
+def _claim_run(job_id, slot):
+    """Insert the run document for this slot; False if another worker has it."""
+    try:
+        JobRuns.insert_one({
+            "_id": f"{job_id}:{slot}",
+            "job_id": job_id,
+            "slot": slot,
+            "worker": WORKER_ID,
+            "status": "running",
+            "started_at": datetime.utcnow(),
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _acquire_lease(job_id, lease_seconds):
+    """Take the per-job lease unless another worker holds an unexpired one."""
+    now = datetime.utcnow()
+    try:
+        lock = JobLocks.find_one_and_update(
+            {"_id": job_id, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": None}]},
+            {"$set": {"owner": WORKER_ID, "lease_until": now + timedelta(seconds=lease_seconds), "acquired_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Document exists and the lease is still held
+        return False
+    return lock is not None and lock.get("owner") == WORKER_ID
+
+
+def _release_lease(job_id, status, duration_ms, error):
+    JobLocks.update_one(
+        {"_id": job_id, "owner": WORKER_ID},
+        {"$set": {
+            "lease_until": None,
+            "last_status": status,
+            "last_duration_ms": duration_ms,
+            "last_error": error,
+            "last_finished_at": datetime.utcnow(),
+            "last_worker": WORKER_ID,
+        }},
+    )
+
+
+def _begin_run(job_id, slot, lease_seconds):
+    """Claim the slot and the lease; True when this worker should run the job."""
+    if not _claim_run(job_id, slot):
+        return False
+    if not _acquire_lease(job_id, lease_seconds):
+        JobRuns.update_one(
+            {"_id": f"{job_id}:{slot}"},
+            {"$set": {"status": "skipped", "error": "previous run still holds the lease",
+                      "finished_at": datetime.utcnow()}},
+        )
+        print(f"⏭️ Job {job_id} skipped: previous run still in progress")
+        return False
+    return True
+
+
+def _finish_run(job_id, slot, status, duration_ms, error, result):
+    JobRuns.update_one(
+        {"_id": f"{job_id}:{slot}"},
+        {"$set": {
+            "status": status,
+            "finished_at": datetime.utcnow(),
+            "duration_ms": duration_ms,
+            "error": error,
+            "result": _summarize(result),
+        }},
+    )
+    _release_lease(job_id, status, duration_ms, error)
+
+
+async def run_job(job_id):
+    """Run a registered job once for its scheduled slot (if this worker wins it)."""
+    job = _jobs[job_id]
+    scheduled = _scheduled_run_times.pop(job_id, None)
+    if job["trigger"] == "date":
+        slot = DEPLOY_ID
+    else:
+        fired_at = scheduled.timestamp() if scheduled else time.time()
+        slot = int(fired_at // job["slot_seconds"])
+
+    try:
+        if not await run_sync(_begin_run, job_id, slot, job["lease_seconds"]):
+            return None
+    except Exception as e:
+        print(f"❌ Could not claim job {job_id}: {e}")
+        return None
+
+    started = time.perf_counter()
+    status, error, result = "success", None, None
+    try:
+        if asyncio.iscoroutinefunction(job["func"]):
+            result = await job["func"]()
+        else:
+            result = await run_sync(job["func"])
+    except Exception as e:
+        status, error = "failed", f"{e.__class__.__name__}: {e}"
+        print(f"❌ Job {job_id} failed: {error}")
+        traceback.print_exc()
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    metrics.job_runs_total.inc(job=job_id, status=status)
+    metrics.job_duration_seconds.observe(duration_ms / 1000, job=job_id)
+
+    try:
+        await run_sync(_finish_run, job_id, slot, status, duration_ms, error, result)
+    except Exception as e:
+        print(f"⚠️ Could not record run of job {job_id}: {e}")
+    return result
+
+
+def register_job(job_id, func, trigger, description="", lease_seconds=None, **trigger_args):
+    """
+    Add a job to the shared scheduler.  trigger/trigger_args are passed to
+    APScheduler's add_job (e.g. "cron", hour=8, minute=0).
+    """
+    _jobs[job_id] = {
+        "func": func,
+        "trigger": trigger,
+        "trigger_args": trigger_args,
+        "description": description,
+        "lease_seconds": lease_seconds or DEFAULT_LEASE_SECONDS,
+        "slot_seconds": _slot_seconds(trigger, trigger_args),
+    }
+    scheduler.add_job(run_job, trigger, args=[job_id], id=job_id, replace_existing=True, **trigger_args)
+
+
+def start():
+    """Start the scheduler once per process (call from the app's startup event)."""
+    with _start_lock:
+        if not scheduler.running:
+            scheduler.start()
+            print(f"✅ Job scheduler started on {WORKER_ID} with {len(_jobs)} jobs")
+    return scheduler
+
+
+def shutdown():
+    with _start_lock:
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+
+
+def get_job_status(history=10):
+    """Registered jobs with next run time, current lease and recent runs."""
+    locks = {lock["_id"]: lock for lock in JobLocks.find({"_id": {"$in": list(_jobs)}})}
+    jobs = []
+    for job_id, job in _jobs.items():
+        scheduled = scheduler.get_job(job_id)
+        jobs.append({
+            "id": job_id,
+            "description": job["description"],
+            "trigger": str(scheduled.trigger) if scheduled else job["trigger"],
+            "next_run_time": scheduled.next_run_time.isoformat() if scheduled and scheduled.next_run_time else None,
+            "lock": locks.get(job_id),
+            "recent_runs": list(
+                JobRuns.find({"job_id": job_id}).sort("started_at", DESCENDING).limit(history)
+            ),
+        })
+    return {"worker": WORKER_ID, "running": scheduler.running, "jobs": jobs}
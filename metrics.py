@@ -0,0 +1,234 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain thread-safe objects updated by
+the code paths that own them (HTTP middleware, job scheduler, websocket
+fan-out, Mongo pool listener).  Values that already live elsewhere, such as
+open websocket connections or pool sizes, are read when /metrics is
+scraped through gauge callbacks, so nothing is queried from MongoDB.
+
+Every uvicorn worker keeps its own metrics; scrape each worker (or run one
+worker per container) to get the full picture.
+"""
+
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """callback, if given, returns {label_values_tuple: value} at scrape time."""
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callback = callback
+
+    def set_callback(self, callback):
+        self._callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                print(f"⚠️ Metrics callback for {self.name} failed: {e}")
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# HTTP
+http_requests_total = Counter(
+    "econnect_http_requests_total",
+    "HTTP requests by method, route template and status code",
+    ("method", "route", "status"),
+)
+http_request_duration_seconds = Histogram(
+    "econnect_http_request_duration_seconds",
+    "HTTP request latency by method and route template",
+    ("method", "route"),
+)
+http_requests_in_progress = Gauge(
+    "econnect_http_requests_in_progress",
+    "HTTP requests currently being handled",
+)
+
+# Websockets (callback set by Server.py, which owns the managers)
+websocket_connections = Gauge(
+    "econnect_websocket_connections",
+    "Open websocket connections per manager",
+    ("manager",),
+)
+
+# Scheduler
+job_runs_total = Counter(
+    "econnect_job_runs_total",
+    "Scheduled job runs executed by this worker, by outcome",
+    ("job", "status"),
+)
+job_duration_seconds = Histogram(
+    "econnect_job_duration_seconds",
+    "Scheduled job run duration",
+    ("job",),
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800),
+)
+
+# Notifications
+notification_fanout_size = Histogram(
+    "econnect_notification_fanout_size",
+    "Notifications per bulk websocket fan-out",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+
+chat_notifications_skipped_total = Counter(
+    "econnect_chat_notifications_skipped_total",
+    "Chat notifications not created because the recipient had the conversation open",
+    ("chat_type",),
+)
+
+# Mongo connection pool
+mongo_pool_connections = Gauge(
+    "econnect_mongo_pool_connections",
+    "MongoDB pool connections per server, open or checked out",
+    ("address", "state"),
+)
+mongo_pool_checkout_failures = Gauge(
+    "econnect_mongo_pool_checkout_failures",
+    "Failed connection checkouts per server since start",
+    ("address",),
+)
+mongo_pool_checkout_wait_seconds = Histogram(
+    "econnect_mongo_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the MongoDB pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
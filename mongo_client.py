@@ -0,0 +1,196 @@
+"""
+Shared MongoClient factory.
+
+Mongo.py, Server.py (GridFS) and notification_automation.py (through Mongo.py)
+all use the single client returned by get_client(), so each worker process
+keeps one connection pool instead of one per module.  Pool sizing,
+timeouts, compression and read preference come from environment settings
+so multi-worker uvicorn deployments can be sized without code changes:
+
+    MONGODB_URI                        (default mongodb://localhost:27017)
+    MONGO_MAX_POOL_SIZE                (default 50)
+    MONGO_MIN_POOL_SIZE                (default 0)
+    MONGO_MAX_IDLE_TIME_MS             (default 300000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        (default 10000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  (default 30000)
+    MONGO_CONNECT_TIMEOUT_MS           (default 30000)
+    MONGO_SOCKET_TIMEOUT_MS            (default 30000)
+    MONGO_COMPRESSORS                  (e.g. "zstd,snappy,zlib"; default none)
+    MONGO_READ_PREFERENCE              (default primary)
+
+Pool activity is tracked with a CMAP ConnectionPoolListener and exposed via
+get_pool_stats().  Commands are attributed to the current HTTP request by
+query_profiler's CommandListener.
+"""
+
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+import metrics
+from query_profiler import query_listener
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_client_settings():
+    """Read the client settings from the environment."""
+    settings = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 30000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "readPreference": os.environ.get("MONGO_READ_PREFERENCE", "primary"),
+    }
+    compressors = os.environ.get("MONGO_COMPRESSORS", "").strip()
+    if compressors:
+        settings["compressors"] = compressors
+    return settings
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool statistics per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}" if address else "unknown"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = {
+                "open_connections": 0,
+                "checked_out": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "failure_reasons": {},
+                "wait_time_total_ms": 0.0,
+                "wait_time_max_ms": 0.0,
+                "pool_cleared": 0,
+            }
+            self._pools[key] = pool
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["pool_cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open_connections"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)["open_connections"] -= 1
+
+    def connection_check_out_started(self, event):
+        # Check-out happens on the requesting thread, so a thread-local
+        # start time is enough to measure the wait.
+        self._local.started = time.perf_counter()
+
+    def _wait_ms(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms()
+        metrics.mongo_pool_checkout_wait_seconds.observe(wait_ms / 1000)
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkout_failures"] += 1
+            reason = str(event.reason)
+            pool["failure_reasons"][reason] = pool["failure_reasons"].get(reason, 0) + 1
+            pool["wait_time_max_ms"] = max(pool["wait_time_max_ms"], wait_ms)
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        metrics.mongo_pool_checkout_wait_seconds.observe(wait_ms / 1000)
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkouts"] += 1
+            pool["checked_out"] += 1
+            pool["wait_time_total_ms"] += wait_ms
+            pool["wait_time_max_ms"] = max(pool["wait_time_max_ms"], wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)["checked_out"] -= 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for address, pool in self._pools.items():
+                data = dict(pool, failure_reasons=dict(pool["failure_reasons"]))
+                checkouts = pool["checkouts"]
+                data["wait_time_avg_ms"] = round(pool["wait_time_total_ms"] / checkouts, 3) if checkouts else 0.0
+                result[address] = data
+            return result
+
+
+pool_stats_listener = PoolStatsListener()
+
+
+def _pool_connection_metrics():
+    values = {}
+    for address, pool in pool_stats_listener.snapshot().items():
+        values[(address, "open")] = pool["open_connections"]
+        values[(address, "checked_out")] = pool["checked_out"]
+    return values
+
+
+metrics.mongo_pool_connections.set_callback(_pool_connection_metrics)
+metrics.mongo_pool_checkout_failures.set_callback(
+    lambda: {(address,): pool["checkout_failures"] for address, pool in pool_stats_listener.snapshot().items()}
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    os.environ.get("MONGODB_URI", "mongodb://localhost:27017"),
+                    event_listeners=[pool_stats_listener, query_listener],
+                    **get_client_settings()
+                )
+    return _client
+
+
+def get_pool_stats():
+    """Pool configuration and live CMAP statistics for this process."""
+    return {
+        "pid": os.getpid(),
+        "settings": get_client_settings(),
+        "pools": pool_stats_listener.snapshot(),
+    }
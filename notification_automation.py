@@ -10,8 +10,10 @@ from datetime import datetime, timedelta
 from Mongo import (
     Tasks, Users, admin, Notifications, Clock, Leave, RemoteWork,
     create_notification_with_websocket, get_unread_notification_count,
-    ObjectId
+    build_digests, send_digest_notifications, fan_out_notifications, ObjectId,
+    task_today, iter_task_batches
 )
+from async_mongo import run_sync
 from websocket_manager import notification_manager
 
 # Helper functions
@@ -27,166 +29,186 @@ def format_date_readable(date_str):
     except:
         return date_str
 
+def _get_user_names(userids, default):
+    """{userid: name} for valid ObjectId strings, in one query"""
+    if not userids:
+        return {}
+    return {
+        str(user["_id"]): user.get("name", default)
+        for user in Users.find({"_id": {"$in": [ObjectId(u) for u in userids]}}, {"name": 1})
+    }
+
+def _collect_overdue_entries(current_date_obj):
+    """
+    Scan pending tasks due before today (blocking; run via run_sync).
+    Returns (overdue_count, assignee_entries, manager_entries) with the
+    employee names filled in for the manager digests.
+    """
+    # Pending tasks due before today, selected by the (status, due_at) index
+    overdue_tasks = (
+        task
+        for batch in iter_task_batches(
+            {
+                "status": {"$in": ["Pending", "In Progress", "pending", "in progress"]},
+                "due_at": {"$lt": current_date_obj}
+            },
+            {"userid": 1, "task": 1, "due_date": 1, "due_at": 1, "manager_id": 1, "assigned_to": 1}
+        )
+        for task in batch
+    )
+    
+    overdue_count = 0
+    assignee_entries = []
+    manager_entries = []
+    
+    for task in overdue_tasks:
+        try:
+            due_date_str = task.get("due_date")
+            days_overdue = (current_date_obj - task["due_at"]).days
+            
+            overdue_count += 1
+            userid = task.get("userid")
+            manager_id = task.get("manager_id")
+            item = {
+                "task_id": str(task["_id"]),
+                "task_title": task.get("task", "Untitled Task"),
+                "due_date": due_date_str,
+                "days_overdue": days_overdue,
+                "employee_id": userid
+            }
+            
+            # Task owner/assignee and assigned users
+            recipients = {userid} if userid else set()
+            recipients.update(task.get("assigned_to", []))
+            assignee_entries.extend((recipient, item) for recipient in recipients)
+            
+            # Manager of the employee
+            if manager_id and manager_id != userid:
+                manager_entries.append((manager_id, item))
+                    
+        except Exception as e:
+            print(f"❌ Error processing task {task.get('_id', 'unknown')}: {e}")
+            continue
+    
+    # Employee names for the manager digests, in one query
+    employee_ids = {item["employee_id"] for _, item in manager_entries if item["employee_id"] and ObjectId.is_valid(item["employee_id"])}
+    names = _get_user_names(employee_ids, "Employee")
+    for _, item in manager_entries:
+        item["employee_name"] = names.get(item["employee_id"], "Employee")
+    
+    return overdue_count, assignee_entries, manager_entries
+
 async def check_and_notify_overdue_tasks():
-    """Check for overdue tasks and send notifications"""
+    """Check for overdue tasks and send one daily digest per assignee and manager"""
     try:
         current_time = get_current_timestamp_ist()
         current_date = current_time.strftime("%d-%m-%Y")
+        current_date_obj = task_today()
         
         print(f"🔍 Checking overdue tasks for date: {current_date}")
         
-        # Find all pending tasks
-        overdue_tasks = list(Tasks.find({
-            "status": {"$in": ["Pending", "In Progress", "pending", "in progress"]},
-            "due_date": {"$exists": True, "$ne": ""}
-        }))
+        # Task scan and employee name lookup run on the thread pool
+        overdue_count, assignee_entries, manager_entries = await run_sync(
+            _collect_overdue_entries, current_date_obj
+        )
         
-        overdue_count = 0
-        notifications_sent = 0
+        digests = build_digests(
+            assignee_entries,
+            "task_overdue",
+            title_fn=lambda items: "Task Overdue" if len(items) == 1 else f"{len(items)} Tasks Overdue",
+            message_fn=lambda items: (
+                f"Your task '{items[0]['task_title']}' is {items[0]['days_overdue']} day(s) overdue. Please complete it immediately."
+                if len(items) == 1 else
+                f"You have {len(items)} overdue tasks: {_summarize(items, 'task_title')}"
+            ),
+            priority="critical",
+            action_url="/user/todo"
+        ) + build_digests(
+            manager_entries,
+            "employee_task_overdue",
+            title_fn=lambda items: f"Employee Task Overdue: {items[0]['employee_name']}" if len(items) == 1 else f"{len(items)} Employee Tasks Overdue",
+            message_fn=lambda items: (
+                f"{items[0]['employee_name']}'s task '{items[0]['task_title']}' is {items[0]['days_overdue']} day(s) overdue. Immediate attention required."
+                if len(items) == 1 else
+                f"{len(items)} tasks of your team are overdue: {_summarize(items, 'employee_name')}"
+            ),
+            priority="critical",
+            action_url="/admin/task"
+        )
+        notifications_sent = (await send_digest_notifications(digests))["digests"]
         
-        for task in overdue_tasks:
-            try:
-                task_id = str(task["_id"])
-                userid = task.get("userid")
-                task_title = task.get("task", "Untitled Task")
-                due_date_str = task.get("due_date")
-                assigned_to = task.get("assigned_to", [])
-                manager_id = task.get("manager_id")
-                
-                if not due_date_str:
-                    continue
-                
-                # Parse due date
-                due_date = datetime.strptime(due_date_str, "%d-%m-%Y")
-                current_date_obj = datetime.strptime(current_date, "%d-%m-%Y")
-                days_overdue = (current_date_obj - due_date).days
-                
-                if days_overdue > 0:
-                    overdue_count += 1
-                    
-                    # Use enhanced overdue task notification
-                    from Mongo import create_overdue_task_notification
-                    
-                    # Notify task owner/assignee
-                    if userid:
-                        await create_overdue_task_notification(
-                            userid=userid,
-                            task_title=task_title,
-                            days_overdue=days_overdue,
-                            task_id=task_id,
-                            priority="critical"
-                        )
-                        notifications_sent += 1
-                    
-                    # Notify assigned users
-                    for assigned_user_id in assigned_to:
-                        if assigned_user_id != userid:
-                            await create_overdue_task_notification(
-                                userid=assigned_user_id,
-                                task_title=task_title,
-                                days_overdue=days_overdue,
-                                task_id=task_id,
-                                priority="critical"
-                            )
-                            notifications_sent += 1
-                    
-                    # Notify manager about employee's overdue task
-                    if manager_id and manager_id != userid:
-                        # Get employee name
-                        employee = Users.find_one({"_id": ObjectId(userid)}) if userid else None
-                        employee_name = employee.get("name", "Employee") if employee else "Employee"
-                        
-                        await create_notification_with_websocket(
-                            userid=manager_id,
-                            title=f"Employee Task Overdue: {employee_name}",
-                            message=f"{employee_name}'s task '{task_title}' is {days_overdue} day(s) overdue. Immediate attention required.",
-                            notification_type="employee_task_overdue",
-                            priority="critical",
-                            action_url=f"/admin/task",
-                            related_id=task_id,
-                            metadata={
-                                "task_id": task_id,
-                                "employee_id": userid,
-                                "employee_name": employee_name,
-                                "days_overdue": days_overdue
-                            }
-                        )
-                        notifications_sent += 1
-                        
-            except Exception as e:
-                print(f"❌ Error processing task {task.get('_id', 'unknown')}: {e}")
-                continue
-        
-        print(f"✅ Overdue task check completed: {overdue_count} overdue tasks, {notifications_sent} notifications sent")
+        print(f"✅ Overdue task check completed: {overdue_count} overdue tasks, {notifications_sent} digests sent")
         return {"overdue_count": overdue_count, "notifications_sent": notifications_sent}
         
     except Exception as e:
         print(f"❌ Error in check_and_notify_overdue_tasks: {e}")
         return {"error": str(e)}
 
+def _collect_deadline_items(today, target_dates):
+    """Reminder items for tasks due on target_dates (blocking; run via run_sync)"""
+    # Tasks due today, tomorrow, or in 3 days, streamed from one query
+    upcoming_tasks = [
+        task
+        for batch in iter_task_batches(
+            {
+                "status": {"$in": ["Pending", "In Progress", "pending", "in progress"]},
+                "due_at": {"$in": target_dates}
+            },
+            {"userid": 1, "task": 1, "due_at": 1, "assigned_to": 1}
+        )
+        for task in batch
+    ]
+    
+    # Task owner plus assigned users, names loaded in one query
+    recipients_by_task = []
+    for task in upcoming_tasks:
+        userid = task.get("userid")
+        recipients = [userid] if userid else []
+        recipients.extend(u for u in task.get("assigned_to", []) if u and u != userid)
+        recipients_by_task.append((task, recipients))
+    names = _get_user_names({u for _, recipients in recipients_by_task for u in recipients if ObjectId.is_valid(u)}, "User")
+    
+    items = []
+    for task, recipients in recipients_by_task:
+        task_title = task.get("task", "Untitled Task")
+        days_remaining = (task["due_at"] - today).days
+        for recipient in recipients:
+            user_name = names.get(recipient, "User")
+            if days_remaining == 0:
+                message = f"Hi {user_name}, your task '{task_title}' is due today! Please complete it as soon as possible."
+                priority = "critical"
+            elif days_remaining == 1:
+                message = f"Hi {user_name}, your task '{task_title}' is due tomorrow. Please ensure it's completed on time."
+                priority = "high"
+            else:
+                message = f"Hi {user_name}, your task '{task_title}' is due in {days_remaining} days. Please plan accordingly."
+                priority = "medium"
+            items.append({
+                "userid": recipient,
+                "title": "Task Deadline Approaching",
+                "message": message,
+                "notification_type": "task",
+                "priority": priority,
+                "related_id": str(task["_id"]),
+                "metadata": {
+                    "task_title": task_title,
+                    "action": "Deadline Approaching",
+                    "days_remaining": days_remaining
+                }
+            })
+    return items
+
 async def check_upcoming_deadlines():
     """Check for tasks due soon and send reminders"""
     try:
-        current_time = get_current_timestamp_ist()
-        today = current_time.strftime("%d-%m-%Y")
-        tomorrow = (current_time + timedelta(days=1)).strftime("%d-%m-%Y")
-        in_3_days = (current_time + timedelta(days=3)).strftime("%d-%m-%Y")
+        today = task_today()
+        target_dates = [today + timedelta(days=days) for days in (0, 1, 3)]
         
-        print(f"🔍 Checking upcoming deadlines for: {today}, {tomorrow}, {in_3_days}")
+        print(f"🔍 Checking upcoming deadlines for: {', '.join(d.strftime('%d-%m-%Y') for d in target_dates)}")
         
-        # Find tasks due today, tomorrow, or in 3 days
-        upcoming_tasks = list(Tasks.find({
-            "status": {"$in": ["Pending", "In Progress", "pending", "in progress"]},
-            "due_date": {"$in": [today, tomorrow, in_3_days]}
-        }))
-        
-        notifications_sent = 0
-        
-        for task in upcoming_tasks:
-            try:
-                task_id = str(task["_id"])
-                userid = task.get("userid")
-                task_title = task.get("task", "Untitled Task")
-                due_date_str = task.get("due_date")
-                assigned_to = task.get("assigned_to", [])
-                
-                if not due_date_str:
-                    continue
-                
-                # Determine urgency and calculate days remaining
-                due_date_obj = datetime.strptime(due_date_str, "%d-%m-%Y")
-                current_date_obj = datetime.strptime(current_time.strftime("%d-%m-%Y"), "%d-%m-%Y")
-                days_remaining = (due_date_obj - current_date_obj).days
-                
-                # Use enhanced deadline approach notification
-                from Mongo import create_deadline_approach_notification
-                
-                # Notify task owner
-                if userid:
-                    await create_deadline_approach_notification(
-                        userid=userid,
-                        task_title=task_title,
-                        days_remaining=days_remaining,
-                        task_id=task_id,
-                        priority="high" if days_remaining == 0 else "medium"
-                    )
-                    notifications_sent += 1
-                
-                # Notify assigned users
-                for assigned_user_id in assigned_to:
-                    if assigned_user_id != userid:
-                        await create_deadline_approach_notification(
-                            userid=assigned_user_id,
-                            task_title=task_title,
-                            days_remaining=days_remaining,
-                            task_id=task_id,
-                            priority="high" if days_remaining == 0 else "medium"
-                        )
-                        notifications_sent += 1
-                        
-            except Exception as e:
-                print(f"❌ Error processing upcoming task {task.get('_id', 'unknown')}: {e}")
-                continue
+        # Task scan and recipient name lookup run on the thread pool, then one fan-out
+        items = await run_sync(_collect_deadline_items, today, target_dates)
+        notifications_sent = len(await fan_out_notifications(items))
         
         print(f"✅ Upcoming deadline check completed: {notifications_sent} notifications sent")
         return {"notifications_sent": notifications_sent}
@@ -195,6 +217,34 @@ async def check_upcoming_deadlines():
         print(f"❌ Error in check_upcoming_deadlines: {e}")
         return {"error": str(e)}
 
+def _collect_missed_clockin_items(current_time):
+    """Reminder items for active users without a clock-in today (blocking; run via run_sync)"""
+    current_date = current_time.strftime("%d-%m-%Y")
+    
+    # Everyone who clocked in today, in one query (Clockin stores date as YYYY-MM-DD)
+    clocked_in = set(Clock.distinct("userid", {
+        "date": current_time.strftime("%Y-%m-%d"),
+        "clockin": {"$exists": True, "$ne": ""}
+    }))
+    
+    # Active users without a clock-in, diffed in memory
+    return [
+        {
+            "userid": str(user["_id"]),
+            "title": "Missed Clock-In Reminder",
+            "message": f"Hi {user.get('name', 'Employee')}, you haven't clocked in today. Please clock in as soon as possible.",
+            "notification_type": "attendance",
+            "priority": "medium",
+            "action_url": "/User/Clockin_int",
+            "metadata": {
+                "date": current_date,
+                "type": "missed_clock_in"
+            }
+        }
+        for user in Users.find({"status": {"$ne": "inactive"}}, {"name": 1})
+        if str(user["_id"]) not in clocked_in
+    ]
+
 async def check_missed_attendance():
     """Check for employees who haven't clocked in by 10 AM"""
     try:
@@ -207,42 +257,10 @@ async def check_missed_attendance():
         
         print(f"🔍 Checking missed attendance for date: {current_date}")
         
-        # Get all active users
-        all_users = list(Users.find({"status": {"$ne": "inactive"}}))
-        notifications_sent = 0
+        # Clock-in lookup and user scan run on the thread pool
+        items = await run_sync(_collect_missed_clockin_items, current_time)
         
-        for user in all_users:
-            try:
-                userid = str(user["_id"])
-                user_name = user.get("name", "Employee")
-                
-                # Check if user has clocked in today
-                attendance_today = Clock.find_one({
-                    "userid": userid,
-                    "date": current_date,
-                    "clockin": {"$exists": True, "$ne": ""}
-                })
-                
-                # Only send notification if user hasn't clocked in
-                if not attendance_today:
-                    # Send missed clock-in notification
-                    await create_notification_with_websocket(
-                        userid=userid,
-                        title="Missed Clock-In Reminder",
-                        message=f"Hi {user_name}, you haven't clocked in today. Please clock in as soon as possible.",
-                        notification_type="attendance",
-                        priority="medium",
-                        action_url="/User/Clockin_int",
-                        metadata={
-                            "date": current_date,
-                            "type": "missed_clock_in"
-                        }
-                    )
-                    notifications_sent += 1
-                    
-            except Exception as e:
-                print(f"❌ Error checking attendance for user {user.get('_id', 'unknown')}: {e}")
-                continue
+        notifications_sent = len(await fan_out_notifications(items))
         
         print(f"✅ Missed attendance check completed: {notifications_sent} notifications sent")
         return {"notifications_sent": notifications_sent}
@@ -251,6 +269,14 @@ async def check_missed_attendance():
         print(f"❌ Error in check_missed_attendance: {e}")
         return {"error": str(e)}
 
+def _load_open_clock_records(current_date):
+    """Today's clock records without a clock-out (blocking; run via run_sync)"""
+    return list(Clock.find({
+        "date": current_date,
+        "clockin": {"$exists": True, "$ne": ""},
+        "clockout": {"$exists": False}
+    }, {"userid": 1, "name": 1, "clockin": 1}))
+
 async def check_missed_clock_out():
     """Check for users who clocked in but forgot to clock out"""
     try:
@@ -259,7 +285,6 @@ async def check_missed_clock_out():
         
         current_time = datetime.now(pytz.timezone("Asia/Kolkata"))
         current_date = current_time.strftime("%Y-%m-%d")
-        notifications_sent = 0
         
         # Only check after office hours (after 7 PM)
         office_end_time = time(19, 0)  # 7:00 PM
@@ -270,40 +295,26 @@ async def check_missed_clock_out():
         print("🔍 Checking for missed clock-out...")
         
         # Find all users who clocked in today but haven't clocked out
-        users_without_clockout = list(Clock.find({
-            "date": current_date,
-            "clockin": {"$exists": True, "$ne": ""},
-            "clockout": {"$exists": False}
-        }))
-        
-        for record in users_without_clockout:
-            try:
-                userid = record.get("userid")
-                user_name = record.get("name", "User")
-                clockin_time = record.get("clockin", "")
-                
-                if not userid:
-                    continue
-                
-                # Send missed clock-out notification
-                await create_notification_with_websocket(
-                    userid=userid,
-                    title="Missed Clock-Out Reminder",
-                    message=f"Hi {user_name}, you clocked in at {clockin_time} but haven't clocked out yet. Please remember to clock out.",
-                    notification_type="attendance",
-                    priority="medium",
-                    action_url="/User/Clockin_int",
-                    metadata={
-                        "date": current_date,
-                        "type": "missed_clock_out",
-                        "clockin_time": clockin_time
-                    }
-                )
-                notifications_sent += 1
-                
-            except Exception as e:
-                print(f"❌ Error checking clock-out for user {record.get('userid', 'unknown')}: {e}")
-                continue
+        users_without_clockout = await run_sync(_load_open_clock_records, current_date)
+        
+        items = [
+            {
+                "userid": record["userid"],
+                "title": "Missed Clock-Out Reminder",
+                "message": f"Hi {record.get('name', 'User')}, you clocked in at {record.get('clockin', '')} but haven't clocked out yet. Please remember to clock out.",
+                "notification_type": "attendance",
+                "priority": "medium",
+                "action_url": "/User/Clockin_int",
+                "metadata": {
+                    "date": current_date,
+                    "type": "missed_clock_out",
+                    "clockin_time": record.get("clockin", "")
+                }
+            }
+            for record in users_without_clockout
+            if record.get("userid")
+        ]
+        notifications_sent = len(await fan_out_notifications(items))
         
         print(f"✅ Missed clock-out check completed: {notifications_sent} notifications sent")
         return {"notifications_sent": notifications_sent}
@@ -312,117 +323,90 @@ async def check_missed_clock_out():
         print(f"❌ Error in check_missed_clock_out: {e}")
         return {"error": str(e)}
 
+def _summarize(items, key, limit=5):
+    """'A, B, C...' from the first few items of a digest"""
+    names = ", ".join(str(item.get(key)) for item in items[:limit])
+    return names + ("..." if len(items) > limit else "")
+
+def _get_approver_ids():
+    """Admin and HR user ids that review leave/WFH requests"""
+    admin_users = list(admin.find({}, {"_id": 1}))
+    hr_users = list(Users.find({
+        "$or": [
+            {"position": {"$regex": "HR", "$options": "i"}},
+            {"department": {"$regex": "HR", "$options": "i"}}
+        ]
+    }, {"_id": 1}))
+    return [str(approver["_id"]) for approver in admin_users + hr_users]
+
+def _load_pending_approvals():
+    """Approver ids and pending leave/WFH requests (blocking; run via run_sync)"""
+    pending = {"status": {"$in": ["Pending", "pending", "Recommended"]}}
+    return _get_approver_ids(), list(Leave.find(pending)), list(RemoteWork.find(pending))
+
 async def check_pending_approvals():
-    """Check for pending leave/WFH approvals that need attention"""
+    """Check for pending leave/WFH approvals and send one daily digest per approver"""
     try:
-        current_time = get_current_timestamp_ist()
         notifications_sent = 0
         
         print("🔍 Checking pending approvals...")
         
-        # Check pending leave requests
-        pending_leaves = list(Leave.find({
-            "status": {"$in": ["Pending", "pending", "Recommended"]}
-        }))
+        # Admin/HR users to notify and the pending leave/WFH requests
+        approver_ids, pending_leaves, pending_wfh = await run_sync(_load_pending_approvals)
         
+        leave_entries = []
         for leave in pending_leaves:
-            try:
-                leave_id = str(leave["_id"])
-                userid = leave.get("userid")
-                employee_name = leave.get("name", "Employee")
-                leave_type = leave.get("leave_type", "Leave")
-                from_date = leave.get("from_date")
-                to_date = leave.get("to_date")
-                status = leave.get("status", "Pending")
-                
-                # Get admin/HR users to notify
-                admin_users = list(admin.find({}, {"_id": 1}))
-                hr_users = list(Users.find({
-                    "$or": [
-                        {"position": {"$regex": "HR", "$options": "i"}},
-                        {"department": {"$regex": "HR", "$options": "i"}}
-                    ]
-                }, {"_id": 1}))
-                
-                approval_users = admin_users + hr_users
-                
-                for approver in approval_users:
-                    approver_id = str(approver["_id"])
-                    
-                    await create_notification_with_websocket(
-                        userid=approver_id,
-                        title=f"Pending Leave Approval: {employee_name}",
-                        message=f"{employee_name} has requested {leave_type} from {from_date} to {to_date}. Status: {status}",
-                        notification_type="leave_approval_required",
-                        priority="medium",
-                        action_url="/admin/leaveapproval",
-                        related_id=leave_id,
-                        metadata={
-                            "leave_id": leave_id,
-                            "employee_id": userid,
-                            "employee_name": employee_name,
-                            "leave_type": leave_type,
-                            "from_date": from_date,
-                            "to_date": to_date
-                        }
-                    )
-                    notifications_sent += 1
-                    
-            except Exception as e:
-                print(f"❌ Error processing leave {leave.get('_id', 'unknown')}: {e}")
-                continue
-        
-        # Check pending WFH requests
-        pending_wfh = list(RemoteWork.find({
-            "status": {"$in": ["Pending", "pending", "Recommended"]}
-        }))
+            item = {
+                "leave_id": str(leave["_id"]),
+                "employee_id": leave.get("userid"),
+                "employee_name": leave.get("name", "Employee"),
+                "leave_type": leave.get("leave_type", "Leave"),
+                "from_date": str(leave.get("from_date")),
+                "to_date": str(leave.get("to_date")),
+                "status": leave.get("status", "Pending")
+            }
+            leave_entries.extend((approver_id, item) for approver_id in approver_ids)
+        
+        leave_digests = build_digests(
+            leave_entries,
+            "leave_approval_required",
+            title_fn=lambda items: f"Pending Leave Approval: {items[0]['employee_name']}" if len(items) == 1 else f"{len(items)} Pending Leave Approvals",
+            message_fn=lambda items: (
+                f"{items[0]['employee_name']} has requested {items[0]['leave_type']} from {items[0]['from_date']} to {items[0]['to_date']}. Status: {items[0]['status']}"
+                if len(items) == 1 else
+                f"{len(items)} leave requests need your approval: {_summarize(items, 'employee_name')}"
+            ),
+            action_url="/admin/leaveapproval"
+        )
+        notifications_sent += (await send_digest_notifications(leave_digests))["digests"]
         
+        # Pending WFH requests
+        wfh_entries = []
         for wfh in pending_wfh:
-            try:
-                wfh_id = str(wfh["_id"])
-                userid = wfh.get("userid")
-                employee_name = wfh.get("name", "Employee")
-                from_date = wfh.get("from_date")
-                to_date = wfh.get("to_date")
-                status = wfh.get("status", "Pending")
-                
-                # Get admin/HR users to notify
-                admin_users = list(admin.find({}, {"_id": 1}))
-                hr_users = list(Users.find({
-                    "$or": [
-                        {"position": {"$regex": "HR", "$options": "i"}},
-                        {"department": {"$regex": "HR", "$options": "i"}}
-                    ]
-                }, {"_id": 1}))
-                
-                approval_users = admin_users + hr_users
-                
-                for approver in approval_users:
-                    approver_id = str(approver["_id"])
-                    
-                    await create_notification_with_websocket(
-                        userid=approver_id,
-                        title=f"Pending WFH Approval: {employee_name}",
-                        message=f"{employee_name} has requested Work From Home from {from_date} to {to_date}. Status: {status}",
-                        notification_type="wfh_approval_required",
-                        priority="medium",
-                        action_url="/admin/wfh",
-                        related_id=wfh_id,
-                        metadata={
-                            "wfh_id": wfh_id,
-                            "employee_id": userid,
-                            "employee_name": employee_name,
-                            "from_date": from_date,
-                            "to_date": to_date
-                        }
-                    )
-                    notifications_sent += 1
-                    
-            except Exception as e:
-                print(f"❌ Error processing WFH {wfh.get('_id', 'unknown')}: {e}")
-                continue
+            item = {
+                "wfh_id": str(wfh["_id"]),
+                "employee_id": wfh.get("userid"),
+                "employee_name": wfh.get("name", "Employee"),
+                "from_date": str(wfh.get("from_date")),
+                "to_date": str(wfh.get("to_date")),
+                "status": wfh.get("status", "Pending")
+            }
+            wfh_entries.extend((approver_id, item) for approver_id in approver_ids)
+        
+        wfh_digests = build_digests(
+            wfh_entries,
+            "wfh_approval_required",
+            title_fn=lambda items: f"Pending WFH Approval: {items[0]['employee_name']}" if len(items) == 1 else f"{len(items)} Pending WFH Approvals",
+            message_fn=lambda items: (
+                f"{items[0]['employee_name']} has requested Work From Home from {items[0]['from_date']} to {items[0]['to_date']}. Status: {items[0]['status']}"
+                if len(items) == 1 else
+                f"{len(items)} work from home requests need your approval: {_summarize(items, 'employee_name')}"
+            ),
+            action_url="/admin/wfh"
+        )
+        notifications_sent += (await send_digest_notifications(wfh_digests))["digests"]
         
-        print(f"✅ Pending approvals check completed: {notifications_sent} notifications sent")
+        print(f"✅ Pending approvals check completed: {notifications_sent} digests sent")
         return {"notifications_sent": notifications_sent}
         
     except Exception as e:
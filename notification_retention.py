@@ -0,0 +1,161 @@
+"""
+Notification retention for E-Connect.
+
+Keeps the hot notifications collection small:
+  - read notifications carry an expires_at datetime and are deleted by a
+    TTL index NOTIFICATION_READ_RETENTION_DAYS after being read
+  - anything older than NOTIFICATION_ARCHIVE_DAYS is moved in batches to
+    notifications_archive
+  - per-type counts are pre-aggregated into notification_stats so the
+    status endpoint never counts the whole collection
+
+Older documents only have the ISO string created_at; backfill_retention_fields()
+adds created_ts (and expires_at for read ones) so they fall under the same rules.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from dateutil import parser
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from Mongo import (
+    db, Notifications, NOTIFICATION_READ_RETENTION_DAYS, _adjust_unread_counters
+)
+
+NOTIFICATION_ARCHIVE_DAYS = int(os.environ.get("NOTIFICATION_ARCHIVE_DAYS", "90"))
+RETENTION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_RETENTION_BATCH_SIZE", "1000"))
+
+NotificationsArchive = db["notifications_archive"]
+NotificationStats = db["notification_stats"]
+
+
+def _to_utc_naive(value):
+    """Parse a stored created_at (ISO string or datetime) into naive UTC."""
+    if isinstance(value, str):
+        value = parser.isoparse(value)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    return value
+
+
+def backfill_retention_fields(batch_size=RETENTION_BATCH_SIZE):
+    """Add created_ts / expires_at to notifications written before retention existed."""
+    updated = 0
+    while True:
+        batch = list(Notifications.find(
+            {"created_ts": {"$exists": False}},
+            {"created_at": 1, "is_read": 1}
+        ).limit(batch_size))
+        if not batch:
+            break
+
+        operations = []
+        for notification in batch:
+            try:
+                created_ts = _to_utc_naive(notification.get("created_at"))
+            except (ValueError, OverflowError):
+                created_ts = None
+            # Unparseable timestamps are treated as "now" so they still age out
+            fields = {"created_ts": created_ts or datetime.utcnow()}
+            if notification.get("is_read"):
+                fields["expires_at"] = fields["created_ts"] + timedelta(days=NOTIFICATION_READ_RETENTION_DAYS)
+            operations.append(UpdateOne({"_id": notification["_id"]}, {"$set": fields}))
+
+        result = Notifications.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+        if len(batch) < batch_size:
+            break
+
+    print(f"Notification retention backfill: {updated} documents updated")
+    return updated
+
+
+def archive_old_notifications(older_than_days=NOTIFICATION_ARCHIVE_DAYS, batch_size=RETENTION_BATCH_SIZE):
+    """Move notifications older than the cutoff to notifications_archive, batch by batch."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+
+    while True:
+        batch = list(Notifications.find({"created_ts": {"$lt": cutoff}}).limit(batch_size))
+        if not batch:
+            break
+
+        now = datetime.utcnow()
+        for notification in batch:
+            notification["archived_at"] = now
+        try:
+            NotificationsArchive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys mean an earlier run copied them but was interrupted
+            # before deleting; anything else aborts this run.
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+        ids = [notification["_id"] for notification in batch]
+        Notifications.delete_many({"_id": {"$in": ids}})
+
+        # Archived unread notifications leave the unread badge
+        deltas = {}
+        for notification in batch:
+            if not notification.get("is_read"):
+                deltas[notification["userid"]] = deltas.get(notification["userid"], 0) - 1
+        _adjust_unread_counters(deltas)
+
+        archived += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    print(f"Archived {archived} notifications older than {older_than_days} days")
+    return archived
+
+
+def refresh_notification_stats():
+    """Pre-aggregate per-type counts for the status endpoint (one pass over the collection)."""
+    since = datetime.utcnow() - timedelta(hours=24)
+    by_type = {}
+    total = 0
+    unread = 0
+    for row in Notifications.aggregate([
+        {"$group": {
+            "_id": "$type",
+            "count": {"$sum": 1},
+            "unread": {"$sum": {"$cond": [{"$eq": ["$is_read", False]}, 1, 0]}},
+        }}
+    ]):
+        by_type[row["_id"] or "unknown"] = row["count"]
+        total += row["count"]
+        unread += row["unread"]
+
+    stats = {
+        "total": total,
+        "unread": unread,
+        "recent_24h": Notifications.count_documents({"created_ts": {"$gte": since}}),
+        "by_type": by_type,
+        "archived_total": NotificationsArchive.estimated_document_count(),
+        "generated_at": datetime.utcnow(),
+    }
+    NotificationStats.update_one({"_id": "current"}, {"$set": stats}, upsert=True)
+    return stats
+
+
+def get_notification_stats():
+    """Latest stats snapshot, computed on first use."""
+    stats = NotificationStats.find_one({"_id": "current"}, {"_id": 0})
+    return stats or refresh_notification_stats()
+
+
+def run_notification_retention():
+    """Nightly maintenance: backfill, archive, then refresh the stats snapshot."""
+    started = datetime.now()
+    report = {
+        "backfilled": backfill_retention_fields(),
+        "archived": archive_old_notifications(),
+    }
+    refresh_notification_stats()
+    report["duration_ms"] = round((datetime.now() - started).total_seconds() * 1000, 1)
+    print(f"Notification retention completed: {report}")
+    return report
@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are ordered by (<sort_field> desc, _id desc) and continue strictly
+after the last document of the previous page, so every page is an index
+range scan no matter how deep the client scrolls.  Cursors are opaque
+url-safe tokens; clients just send back the next_cursor they received.
+paginate_newer() walks the other way, for clients catching up on documents
+added after the newest one they hold.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from bson import json_util
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded."""
+
+
+def encode_cursor(values):
+    """Encode a dict of key values (datetimes and ObjectIds allowed) as a token."""
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor()."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(values, dict) or "_id" not in values:
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def clamp_limit(limit, default=50):
+    """Keep page sizes between 1 and MAX_PAGE_SIZE."""
+    if not limit or limit < 1:
+        return default
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_after(sort_field, cursor):
+    """Filter selecting documents that sort after the cursor (descending order)."""
+    value = cursor.get(sort_field)
+    conditions = [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "_id": {"$lt": cursor["_id"]}},
+    ]
+    # Comparison operators only match values of the same BSON type; legacy
+    # string timestamps sort below dates, so include them after a date cursor.
+    if isinstance(value, datetime):
+        conditions.append({sort_field: {"$type": "string"}})
+    return {"$or": conditions}
+
+
+def keyset_newer(sort_field, cursor):
+    """Filter selecting documents that sort before the cursor (newer ones)."""
+    value = cursor.get(sort_field)
+    return {"$or": [
+        {sort_field: {"$gt": value}},
+        {sort_field: value, "_id": {"$gt": cursor["_id"]}},
+    ]}
+
+
+def cursor_for(document, sort_field="created_at"):
+    """Cursor token positioned at `document`."""
+    return encode_cursor({sort_field: document.get(sort_field), "_id": document["_id"]})
+
+
+def paginate(collection, query, limit, cursor=None, sort_field="created_at", projection=None):
+    """
+    Fetch one page of `collection` matching `query`.
+
+    Returns (documents, next_cursor); next_cursor is None on the last page.
+    Raises InvalidCursor for a malformed cursor token.
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        query = {"$and": [query, keyset_after(sort_field, decode_cursor(cursor))]}
+
+    documents = list(
+        collection.find(query, projection)
+        .sort([(sort_field, -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = cursor_for(documents[-1], sort_field)
+    return documents, next_cursor
+
+
+def paginate_newer(collection, query, limit, cursor, sort_field="created_at", projection=None):
+    """
+    Fetch up to `limit` documents of `collection` matching `query` that sort
+    before `cursor` (newer ones), oldest first.
+
+    Returns (documents, has_more).  Raises InvalidCursor for a malformed cursor.
+    """
+    limit = clamp_limit(limit)
+    query = {"$and": [query, keyset_newer(sort_field, decode_cursor(cursor))]}
+
+    documents = list(
+        collection.find(query, projection)
+        .sort([(sort_field, 1), ("_id", 1)])
+        .limit(limit + 1)
+    )
+    return documents[:limit], len(documents) > limit
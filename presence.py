@@ -0,0 +1,96 @@
+"""
+Presence registry shared by the websocket managers.
+
+Every socket registered here belongs to a user and may be viewing one
+conversation:
+
+  direct:<chatId>   the user has that direct chat open on /ws/{userid}
+                    (the client sends {"type": "viewing", "to_user": ...})
+  group:<group_id>  the user is connected to /ws/group/{group_id}?token=...
+
+The user is fixed when the socket connects, from the identity the endpoint
+itself trusts (the /ws/{userid} path, the group socket's login token), and
+never from message fields.  Group sockets without a valid token are
+registered without a user and never count as viewers.  Chat notifications
+use is_viewing() to skip users who already see the message in the open
+conversation.
+
+Presence is per worker process: a user connected to another worker is
+treated as absent and still gets the notification.
+"""
+
+import os
+import threading
+
+# Set CHAT_NOTIFICATIONS_SKIP_PRESENT=0 to notify present users anyway
+SKIP_PRESENT_USERS = os.environ.get("CHAT_NOTIFICATIONS_SKIP_PRESENT", "1") != "0"
+
+
+def direct_conversation(chat_id):
+    return f"direct:{chat_id}"
+
+
+def group_conversation(group_id):
+    return f"group:{group_id}"
+
+
+def direct_chat_id(user_a, user_b):
+    """chatId used for direct chats (same rule as the /ws/{userid} handler)."""
+    return "_".join(sorted([user_a, user_b]))
+
+
+class PresenceRegistry:
+    """Which user each socket belongs to and which conversation it is viewing."""
+
+    def __init__(self):
+        # Notifications may be created on worker threads, so guard the maps
+        self._lock = threading.Lock()
+        self._sockets = {}   # websocket -> [userid, conversation]
+        self._viewers = {}   # conversation -> {userid: socket count}
+
+    def _add_viewer(self, userid, conversation):
+        if userid and conversation:
+            viewers = self._viewers.setdefault(conversation, {})
+            viewers[userid] = viewers.get(userid, 0) + 1
+
+    def _remove_viewer(self, userid, conversation):
+        viewers = self._viewers.get(conversation)
+        if not viewers or userid not in viewers:
+            return
+        viewers[userid] -= 1
+        if viewers[userid] <= 0:
+            del viewers[userid]
+        if not viewers:
+            del self._viewers[conversation]
+
+    def connect(self, websocket, userid=None, conversation=None):
+        with self._lock:
+            self._sockets[websocket] = [userid, conversation]
+            self._add_viewer(userid, conversation)
+
+    def set_viewing(self, websocket, conversation):
+        """Record the conversation a socket has open (None when it closes it)."""
+        with self._lock:
+            entry = self._sockets.get(websocket)
+            if entry is None or entry[1] == conversation:
+                return
+            self._remove_viewer(entry[0], entry[1])
+            entry[1] = conversation
+            self._add_viewer(entry[0], conversation)
+
+    def disconnect(self, websocket):
+        with self._lock:
+            entry = self._sockets.pop(websocket, None)
+            if entry is not None:
+                self._remove_viewer(entry[0], entry[1])
+
+    def is_viewing(self, userid, conversation):
+        with self._lock:
+            return userid in self._viewers.get(conversation, {})
+
+    def viewers(self, conversation):
+        with self._lock:
+            return set(self._viewers.get(conversation, {}))
+
+
+presence = PresenceRegistry()
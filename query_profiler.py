@@ -0,0 +1,160 @@
+"""
+Per-request MongoDB query profiler.
+
+A pymongo CommandListener attributes every command to the request that
+issued it through a context variable set by the HTTP middleware in
+Server.py.  The context follows the request into Starlette's threadpool
+(sync routes) and into async_mongo.run_sync, so commands run on worker
+threads are counted too.
+
+For each request the profiler records the number of commands, their total
+time and the slowest one, and the middleware reports them in a
+Server-Timing header:
+
+    Server-Timing: db;dur=12.4;desc="7 queries", db-slowest;dur=4.1;desc="find tasks", app;dur=31.0
+
+Requests slower than QUERY_PROFILER_SLOW_MS (or issuing more than
+QUERY_PROFILER_SLOW_COUNT commands) are kept with their command list in a
+ring buffer of QUERY_PROFILER_BUFFER entries, served by /internal/slow-requests.
+Set QUERY_PROFILER_ENABLED=0 to switch the middleware off.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from pymongo import monitoring
+
+PROFILER_ENABLED = os.environ.get("QUERY_PROFILER_ENABLED", "1") != "0"
+SLOW_REQUEST_MS = float(os.environ.get("QUERY_PROFILER_SLOW_MS", "500"))
+SLOW_COMMAND_COUNT = int(os.environ.get("QUERY_PROFILER_SLOW_COUNT", "50"))
+SLOW_BUFFER_SIZE = int(os.environ.get("QUERY_PROFILER_BUFFER", "100"))
+# Commands kept per request for the slow log (the count keeps going)
+MAX_COMMANDS_RECORDED = 100
+
+_current_profile = contextvars.ContextVar("query_profile", default=None)
+_slow_requests = deque(maxlen=SLOW_BUFFER_SIZE)
+_slow_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Commands issued while handling one request."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = None
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def record(self, name, collection, duration_ms, failed=False):
+        entry = {
+            "command": name,
+            "collection": collection,
+            "duration_ms": round(duration_ms, 3),
+            "failed": failed,
+        }
+        # Concurrent commands of one request (gather over run_sync) share it
+        with self._lock:
+            self.count += 1
+            self.total_ms += duration_ms
+            if self.slowest is None or duration_ms > self.slowest["duration_ms"]:
+                self.slowest = entry
+            if len(self.commands) < MAX_COMMANDS_RECORDED:
+                self.commands.append(entry)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, elapsed_ms):
+        parts = [f'db;dur={self.total_ms:.1f};desc="{self.count} queries"']
+        if self.slowest:
+            desc = f"{self.slowest['command']} {self.slowest['collection'] or ''}".strip()
+            parts.append(f'db-slowest;dur={self.slowest["duration_ms"]:.1f};desc="{desc}"')
+        parts.append(f"app;dur={elapsed_ms:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self, elapsed_ms, status_code):
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status_code": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(elapsed_ms, 1),
+            "db_count": self.count,
+            "db_total_ms": round(self.total_ms, 1),
+            "slowest": self.slowest,
+            "commands": list(self.commands),
+        }
+
+
+class QueryProfilerListener(monitoring.CommandListener):
+    """Attributes command durations to the current request profile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        profile = _current_profile.get()
+        if profile is None:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = None
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (profile, collection)
+
+    def _finish(self, event, failed):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            profile, collection = pending
+            profile.record(event.command_name, collection, event.duration_micros / 1000, failed)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+query_listener = QueryProfilerListener()
+
+
+def start_profile(method, path):
+    """Begin profiling a request; returns (profile, token) for finish_profile."""
+    profile = RequestProfile(method, path)
+    return profile, _current_profile.set(profile)
+
+
+def finish_profile(profile, token, status_code):
+    """Stop profiling; logs slow requests and returns the Server-Timing value."""
+    _current_profile.reset(token)
+    elapsed_ms = profile.elapsed_ms()
+    if elapsed_ms >= SLOW_REQUEST_MS or profile.count >= SLOW_COMMAND_COUNT:
+        with _slow_lock:
+            _slow_requests.append(profile.to_dict(elapsed_ms, status_code))
+    return profile.server_timing(elapsed_ms)
+
+
+def get_slow_requests(limit=None):
+    """Most recent slow requests first."""
+    with _slow_lock:
+        entries = list(_slow_requests)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def clear_slow_requests():
+    with _slow_lock:
+        _slow_requests.clear()
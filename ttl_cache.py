@@ -0,0 +1,68 @@
+"""
+Small thread-safe in-process cache with per-entry expiry.
+
+Used for hot lookups that change rarely (user roles for notification
+routing).  Each worker process has its own cache, so entries are kept short
+lived and the owning code invalidates them explicitly on writes it performs.
+"""
+
+import threading
+import time
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Mapping with a time-to-live per entry and a bounded size."""
+
+    def __init__(self, ttl_seconds, max_size=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_size and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [k for k, (expires, _) in self._data.items() if expires <= now]
+        for k in expired:
+            del self._data[k]
+        if len(self._data) >= self.max_size:
+            # Still full: drop the entry closest to expiry
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
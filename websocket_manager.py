@@ -1,9 +1,17 @@
+import asyncio
 import json
+import os
 from typing import Dict, Set
 from fastapi import WebSocket
 from datetime import datetime
 import pytz
 
+import metrics
+from presence import presence
+
+# Upper bound on concurrent websocket sends during a fan-out
+FANOUT_CONCURRENCY = int(os.environ.get("NOTIFICATION_FANOUT_CONCURRENCY", "50"))
+
 # Helper function for timezone-aware timestamps
 def get_current_timestamp_iso():
     """Get current timestamp in IST timezone with proper ISO format"""
@@ -13,6 +21,12 @@ class NotificationManager:
     def __init__(self):
         # Store active connections: {userid: set_of_websockets}
         self.active_connections: Dict[str, Set[WebSocket]] = {}
+        # Event loop of the web app, so scheduler threads can push messages
+        self.loop = None
+
+    def bind_loop(self, loop):
+        """Remember the application event loop (called on startup)"""
+        self.loop = loop
 
     async def connect(self, websocket: WebSocket, userid: str, name: str = None):
         """Accept new WebSocket connection for a user"""
@@ -22,10 +36,12 @@ class NotificationManager:
             self.active_connections[userid] = set()
 
         self.active_connections[userid].add(websocket)
+        presence.connect(websocket, userid)
         display_name = name if name else userid
         print(f"✅ User {display_name} connected. Connections: {len(self.active_connections[userid])}")
     def disconnect(self, websocket: WebSocket, userid: str):
         """Remove WebSocket connection for a user"""
+        presence.disconnect(websocket)
         if userid in self.active_connections:
             self.active_connections[userid].discard(websocket)
 
@@ -129,6 +145,45 @@ class NotificationManager:
         for conn in disconnected:
             self.active_connections[userid].discard(conn)
 
+    async def send_bulk_notifications(self, notifications: list, unread_counts: dict = None, max_concurrency: int = None):
+        """Push many notifications (and unread counts) concurrently, at most max_concurrency at a time"""
+        metrics.notification_fanout_size.observe(len(notifications))
+        targets = [n for n in notifications if n.get("userid") in self.active_connections]
+        sends = [self.send_personal_notification(n["userid"], n) for n in targets]
+        if unread_counts:
+            sends.extend(
+                self.send_unread_count_update(userid, count)
+                for userid, count in unread_counts.items()
+                if userid in self.active_connections
+            )
+        if not sends:
+            return 0
+
+        semaphore = asyncio.Semaphore(max_concurrency or FANOUT_CONCURRENCY)
+
+        async def bounded(send):
+            async with semaphore:
+                return await send
+
+        await asyncio.gather(*(bounded(send) for send in sends), return_exceptions=True)
+        return len(targets)
+
+    def push_from_thread(self, notifications: list, unread_counts: dict = None, timeout: float = 30):
+        """
+        Run send_bulk_notifications on the app loop from a worker thread
+        (scheduler jobs).  Returns the number of notifications pushed.
+        """
+        if self.loop is None or not self.loop.is_running():
+            return 0
+        future = asyncio.run_coroutine_threadsafe(
+            self.send_bulk_notifications(notifications, unread_counts), self.loop
+        )
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            print(f"⚠️ Error pushing bulk notifications: {e}")
+            return 0
+
     def get_active_users(self) -> list:
         """Return list of user IDs with active connections"""
         return list(self.active_connections.keys())
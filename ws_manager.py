@@ -2,6 +2,8 @@
 from fastapi import WebSocket
 from collections import defaultdict
 
+from presence import presence, group_conversation
+
 
 
 class DirectChatManager:
@@ -12,8 +14,11 @@ class DirectChatManager:
     async def connect(self, user_id: str, websocket: WebSocket):
         await websocket.accept()
         self.active_connections[user_id].append(websocket)
+        # Viewing nothing until the client reports an open chat
+        presence.connect(websocket, user_id)
 
     def disconnect(self, user_id: str, websocket: WebSocket):
+        presence.disconnect(websocket)
         if user_id in self.active_connections:
             if websocket in self.active_connections[user_id]:
                 self.active_connections[user_id].remove(websocket)
@@ -113,13 +118,16 @@ class GroupChatManager:
     def __init__(self):
         self.active_connections: Dict[str, List[WebSocket]] = {}  # group_id -> list of websockets
 
-    async def connect(self, group_id: str, websocket: WebSocket):
+    async def connect(self, group_id: str, websocket: WebSocket, user_id: str = None):
         await websocket.accept()
         if group_id not in self.active_connections:
             self.active_connections[group_id] = []
         self.active_connections[group_id].append(websocket)
+        # A group socket is viewing its group for as long as it is open
+        presence.connect(websocket, user_id, group_conversation(group_id))
 
     def disconnect(self, group_id: str, websocket: WebSocket):
+        presence.disconnect(websocket)
         if group_id in self.active_connections:
             self.active_connections[group_id].remove(websocket)
             if not self.active_connections[group_id]: